@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = "NOAA"
+__date__ = "2026-10-18"
+__copyright__ = "(C) 2021 by NOAA"
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = "$Format:%H$"
+
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from qgis.core import QgsProcessingUtils
+import processing
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+PROFILE_ENV = "QNSPECT_PROFILE"
+PROFILE_DIR_ENV = "QNSPECT_PROFILE_DIR"
+
+_state = threading.local()
+_tagged_runs = {}
+
+# processing.run is replaced while at least one profiled algorithm runs, in any thread
+_patch_lock = threading.Lock()
+_patch_count = 0
+_original_run = None
+
+
+def requested_profiler():
+    """Profiler chosen with the QNSPECT_PROFILE environment variable (cprofile, pyinstrument
+    or 1 for cProfile). None if profiling is off."""
+    value = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if value in ["", "0", "off", "false", "no"]:
+        return None
+    return "pyinstrument" if value == "pyinstrument" else "cProfile"
+
+
+def _tagged_run(alg_id: str):
+    """Trampoline named after the child algorithm id, so that the profiles list the time of
+    each child algorithm (GDAL, GRASS, native) separately from the Python code calling it
+    """
+    if alg_id not in _tagged_runs:
+
+        def child_algorithm(run, *args, **kwargs):
+            return run(*args, **kwargs)
+
+        tag = f"processing.run[{alg_id}]"
+        code = child_algorithm.__code__
+        changes = {"co_name": tag}
+        if hasattr(code, "co_qualname"):
+            changes["co_qualname"] = tag
+        child_algorithm.__code__ = code.replace(**changes)
+        _tagged_runs[alg_id] = child_algorithm
+    return _tagged_runs[alg_id]
+
+
+def _timed_run(algOrName, *args, **kwargs):
+    """Replacement of processing.run that times the call if the calling thread is profiled"""
+    timer = getattr(_state, "timer", None)
+    if timer is None:
+        return _original_run(algOrName, *args, **kwargs)
+    return timer.run(algOrName, *args, **kwargs)
+
+
+class ChildAlgorithmTimer:
+    """Sums the time of each child algorithm run by the profiled algorithm of this thread.
+
+    processing.run is replaced by a router while any timer is active. The replacement is
+    reference counted under a module lock so concurrent profiled algorithms install and restore
+    it once, and the timings are kept per thread: calls from other threads go straight to the
+    original function."""
+
+    def __init__(self):
+        self.timings = {}
+
+    def __enter__(self):
+        global _patch_count, _original_run
+        with _patch_lock:
+            if _patch_count == 0:
+                _original_run = processing.run
+                processing.run = _timed_run
+            _patch_count += 1
+        _state.timer = self
+        return self
+
+    def __exit__(self, *exc):
+        global _patch_count
+        _state.timer = None
+        with _patch_lock:
+            _patch_count -= 1
+            if _patch_count == 0:
+                # _original_run is kept for the calls that already looked up the router
+                processing.run = _original_run
+
+    def run(self, algOrName, *args, **kwargs):
+        alg_id = algOrName if isinstance(algOrName, str) else algOrName.id()
+        start = time.perf_counter()
+        try:
+            return _tagged_run(alg_id)(_original_run, algOrName, *args, **kwargs)
+        finally:
+            timing = self.timings.setdefault(alg_id, {"Calls": 0, "Seconds": 0.0})
+            timing["Calls"] += 1
+            timing["Seconds"] += time.perf_counter() - start
+
+
+def profile_folder(alg, parameters, context) -> str:
+    """QNSPECT_PROFILE_DIR, else the run or output folder of the algorithm, else the
+    processing temporary folder"""
+    folder = os.environ.get(PROFILE_DIR_ENV)
+    if not folder:
+        if alg.parameterDefinition("ProjectLocation") is not None:
+            folder = alg.parameterAsString(parameters, "ProjectLocation", context)
+            if folder and alg.parameterDefinition("RunName") is not None:
+                folder = os.path.join(
+                    folder, alg.parameterAsString(parameters, "RunName", context)
+                )
+        elif alg.parameterDefinition("OutputDirectory") is not None:
+            folder = alg.parameterAsString(parameters, "OutputDirectory", context)
+    if not folder:
+        folder = QgsProcessingUtils.tempFolder()
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def profiled(process_algorithm):
+    """Decorate processAlgorithm to run it under the profiler requested with the QNSPECT_PROFILE
+    environment variable. Child algorithms run by a profiled algorithm are not profiled separately.
+    """
+
+    @functools.wraps(process_algorithm)
+    def wrapper(self, parameters, context, feedback):
+        profiler_name = requested_profiler()
+        if profiler_name is None or getattr(_state, "active", False):
+            return process_algorithm(self, parameters, context, feedback)
+
+        if profiler_name == "pyinstrument" and pyinstrument is None:
+            feedback.reportError(
+                "pyinstrument is not installed, cProfile is used instead."
+            )
+            profiler_name = "cProfile"
+        if profiler_name == "pyinstrument":
+            profiler = pyinstrument.Profiler()
+            start_profiler, stop_profiler = profiler.start, profiler.stop
+        else:
+            profiler = cProfile.Profile()
+            start_profiler, stop_profiler = profiler.enable, profiler.disable
+
+        try:
+            start_profiler()
+        except ValueError as e:
+            # ex: cProfile is already enabled by a profiled algorithm of another thread
+            feedback.reportError(f"Unable to start {profiler_name}: {e}")
+            return process_algorithm(self, parameters, context, feedback)
+
+        _state.active = True
+        start = time.perf_counter()
+        children = None
+        try:
+            with ChildAlgorithmTimer() as children:
+                try:
+                    return process_algorithm(self, parameters, context, feedback)
+                finally:
+                    stop_profiler()
+        finally:
+            _state.active = False
+            try:
+                write_profile(
+                    self,
+                    parameters,
+                    context,
+                    feedback,
+                    profiler,
+                    children.timings if children is not None else {},
+                    time.perf_counter() - start,
+                )
+            except (
+                Exception
+            ) as e:  # noqa: BLE001 - never mask the result or error of the run
+                feedback.reportError(f"Unable to write the profile: {e}")
+
+    return wrapper
+
+
+def write_profile(
+    alg, parameters, context, feedback, profiler, child_timings, total_seconds
+):
+    """Write the profile (.prof for cProfile, .html for pyinstrument) and a JSON summary of the
+    child algorithm times next to the outputs, and report the summary"""
+    base = os.path.join(
+        profile_folder(alg, parameters, context),
+        f"{alg.name()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+    )
+    if isinstance(profiler, cProfile.Profile):
+        profile_file = f"{base}.prof"
+        profiler.dump_stats(profile_file)
+    else:
+        profile_file = f"{base}.html"
+        with open(profile_file, "w", encoding="utf-8") as f:
+            f.write(profiler.output_html())
+
+    child_seconds = sum(timing["Seconds"] for timing in child_timings.values())
+    summary = {
+        "Algorithm": alg.id(),
+        "TotalSeconds": round(total_seconds, 3),
+        "ChildAlgorithmSeconds": round(child_seconds, 3),
+        "PythonSeconds": round(total_seconds - child_seconds, 3),
+        "ChildAlgorithms": {
+            alg_id: {"Calls": timing["Calls"], "Seconds": round(timing["Seconds"], 3)}
+            for alg_id, timing in sorted(
+                child_timings.items(), key=lambda item: -item[1]["Seconds"]
+            )
+        },
+    }
+    with open(f"{base}.children.json", "w") as f:
+        json.dump(summary, f, indent=4)
+
+    lines = [
+        f"Profile written to {profile_file}",
+        f"{summary['TotalSeconds']} s total, {summary['ChildAlgorithmSeconds']} s in child algorithms, "
+        f"{summary['PythonSeconds']} s in Python",
+    ]
+    for alg_id, timing in summary["ChildAlgorithms"].items():
+        lines.append(f"  {alg_id}: {timing['Seconds']} s in {timing['Calls']} calls")
+    feedback.pushInfo("\n".join(lines))
@@ -3,6 +3,7 @@ from .rasterize_soil.rasterize_soil import RasterizeSoil
 from .modify_land_cover.modify_land_cover_by_field import ModifyLandCover
 from .modify_land_cover.modify_land_cover_by_name import ModifyLandCoverByName
 from .modify_land_cover.modify_land_cover_by_nlcdccap import ModifyLandCoverByNLCDCCAP
+from .modify_land_cover.modify_land_cover_batch import ModifyLandCoverBatch
 from .create_lookup_table_template.create_lookup_table_template import (
     CreateLookupTableTemplate,
 )
@@ -11,3 +12,6 @@ from .run_analysis.run_erosion_analysis import RunErosionAnalysis
 from .load_run.load_run import LoadPreviousRun
 from .compare_scenarios.compare_pollution import ComparePollution
 from .compare_scenarios.compare_erosion import CompareErosion
+from .zonal_summary.zonal_summary import ZonalSummary
+from .outlet_loads.outlet_loads import OutletLoads
+from .estimate_load_change.estimate_load_change import EstimateLoadChange
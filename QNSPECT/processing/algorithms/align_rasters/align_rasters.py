@@ -22,7 +22,9 @@ __revision__ = "$Format:%H$"
 
 import processing
 import os
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from osgeo import gdal, osr
 
 from qgis.core import (
     QgsProcessing,
@@ -34,7 +36,11 @@ from qgis.core import (
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterFolderDestination,
     QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
     QgsProcessingContext,
+    QgsProcessingFeedback,
+    QgsProcessingUtils,
+    QgsProcessingException,
     QgsUnitTypes,
     QgsProcessingParameterNumber,
     QgsRasterLayer,
@@ -42,11 +48,19 @@ from qgis.core import (
 )
 
 from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
-from QNSPECT.processing.algorithms.qnspect_utils import select_group, create_group
+from QNSPECT.processing.algorithms.qnspect_utils import (
+    select_group,
+    create_group,
+    default_worker_count,
+)
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 
 class AlignRasters(QNSPECTAlgorithm):
     rasterCellSize: str = "RasterCellSize"
+    maxWorkers: str = "MaxWorkers"
+    virtualOutputs: str = "VirtualOutputs"
     resamplingMethods = [
         ("Nearest Neighbour", "near"),
         ("Bilinear", "bilinear"),
@@ -128,6 +142,22 @@ class AlignRasters(QNSPECTAlgorithm):
                 defaultValue=True,
             )
         )
+        param = QgsProcessingParameterBoolean(
+            self.virtualOutputs,
+            "Write Virtual Rasters (VRT)",
+            defaultValue=False,
+        )
+        param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(param)
+        param = QgsProcessingParameterNumber(
+            self.maxWorkers,
+            "Maximum Parallel Alignments",
+            type=QgsProcessingParameterNumber.Integer,
+            minValue=1,
+            defaultValue=default_worker_count(),
+        )
+        param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(param)
         self.addParameter(
             QgsProcessingParameterFolderDestination(
                 "OutputDirectory",
@@ -137,6 +167,8 @@ class AlignRasters(QNSPECTAlgorithm):
             )
         )
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
@@ -148,12 +180,16 @@ class AlignRasters(QNSPECTAlgorithm):
         else:
             feedback = QgsProcessingMultiStepFeedback(3, model_feedback)
         results = {}
-        outputs = {}
 
         output_dir = self.parameterAsString(parameters, "OutputDirectory", context)
         self.load_outputs = self.parameterAsBool(parameters, "LoadOutputs", context)
         ref_layer = self.parameterAsRasterLayer(parameters, "ReferenceRaster", context)
-        resample_method = self.parameterAsEnum(parameters, "ResamplingMethod", context)
+        resample_method = self.resamplingMethods[
+            self.parameterAsEnum(parameters, "ResamplingMethod", context)
+        ][1]
+        max_workers = self.parameterAsInt(parameters, self.maxWorkers, context)
+        virtual = self.parameterAsBool(parameters, self.virtualOutputs, context)
+        out_format = "VRT" if virtual else "GTiff"
 
         # Check if the reference raster is in a geographic CRS and terminate if it is
         # This will:
@@ -167,59 +203,9 @@ class AlignRasters(QNSPECTAlgorithm):
             )
             return {}
 
+        mask_path = None
         if parameters["MaskLayer"]:
-            if all(
-                [
-                    parameters["MaskBuffer"],
-                    parameters["MaskBuffer"] != 0,
-                ]
-            ):
-
-                # Reprojecting Mask Layer to Reference Raster CRS because
-                # Mask Layer and Buffer distance can be in different CRS
-                # If the distance is in projected units (meters etc) and Mask Layer in Geographic (degrees)
-                # the buffer algorithm will treat distance in degrees ignoring actual buffer distance units
-                alg_params = {
-                    "INPUT": parameters["MaskLayer"],
-                    "OPERATION": "",
-                    "TARGET_CRS": ref_layer_crs,
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                }
-                outputs["ReprojectLayer"] = processing.run(
-                    "native:reprojectlayer",
-                    alg_params,
-                    context=context,
-                    feedback=feedback,
-                    is_child_algorithm=True,
-                )
-
-                feedback.setCurrentStep(1)
-                if feedback.isCanceled():
-                    return {}
-
-                # Buffer
-                alg_params = {
-                    "DISSOLVE": False,
-                    "DISTANCE": parameters["MaskBuffer"],
-                    "END_CAP_STYLE": 0,
-                    "INPUT": outputs["ReprojectLayer"]["OUTPUT"],
-                    "JOIN_STYLE": 0,
-                    "MITER_LIMIT": 2,
-                    "SEGMENTS": 5,
-                    "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-                }
-                outputs["Buffer"] = processing.run(
-                    "native:buffer",
-                    alg_params,
-                    context=context,
-                    feedback=feedback,
-                    is_child_algorithm=True,
-                )
-                mask_layer = outputs["Buffer"]["OUTPUT"]
-            else:
-                mask_layer = self.parameterAsVectorLayer(
-                    parameters, "MaskLayer", context
-                )
+            mask_path = self.prepare_mask(parameters, ref_layer_crs, context, feedback)
 
         feedback.setCurrentStep(2)
         if feedback.isCanceled():
@@ -232,121 +218,142 @@ class AlignRasters(QNSPECTAlgorithm):
         # if reference is not aligned, it will have old projection which will be same
         # in theory but some software like ArcGIS can interpret both projections as different
         ref_source = ref_layer.source()
-        rasters_to_align = [ref_layer]
-        rasters_to_align += self.parameterAsLayerList(
+        rasters_to_align = self.parameterAsLayerList(
             parameters, "RastersToAlign", context
         )
 
-        all_out_paths = []
-
-        enum_start = 3
-        for i, rast in enumerate(rasters_to_align, start=enum_start):
-            # Prevent the reference raster from being alignd multiple times
-            if (i != enum_start) and (rast.source() == ref_source):
-                continue
+        ref_name, ref_out_path = self.output_name(ref_layer, output_dir, [], out_format)
+        all_out_paths = [ref_out_path]
+        feedback.pushInfo(f"Aligning {ref_name} ...")
+        if virtual and not (mask_path or user_size):
+            # the reference raster is on its own grid, so it only needs to be referenced
+            self.reference_window(ref_source, ref_out_path)
+        elif mask_path and not user_size:
+            # crop ref layer to the cutline in its own grid to match original cell alignment to preserve integrity
+            self.warp_raster(
+                ref_source,
+                ref_out_path,
+                resample_method,
+                mask_path=mask_path,
+                crop_to_cutline=True,
+                output_format=out_format,
+                feedback=feedback,
+            )
+        else:
+            # extent of the mask layer if it is provided else the extent of the reference raster
+            extent = (
+                QgsVectorLayer(mask_path, "mask", "ogr").extent()
+                if mask_path
+                else ref_layer.extent()
+            )
+            self.warp_raster(
+                ref_source,
+                ref_out_path,
+                resample_method,
+                bounds=(
+                    extent.xMinimum(),
+                    extent.yMinimum(),
+                    extent.xMaximum(),
+                    extent.yMaximum(),
+                ),
+                res=(res_x, res_y),
+                mask_path=mask_path,
+                output_format=out_format,
+                feedback=feedback,
+            )
+        results[ref_name] = ref_out_path
+
+        # all other rasters are warped onto the grid of the aligned reference raster
+        ref_ds = gdal.Open(ref_out_path)
+        ref_wkt = ref_ds.GetProjection()
+        transform = ref_ds.GetGeoTransform()
+        ref_bounds = (
+            transform[0],
+            transform[3] + ref_ds.RasterYSize * transform[5],
+            transform[0] + ref_ds.RasterXSize * transform[1],
+            transform[3],
+        )
+        ref_res = (transform[1], abs(transform[5]))
+        ref_ds = None
 
-            rast_name = rast.name()
-            out_path = os.path.join(output_dir, f"{rast_name}.tif")
+        if feedback.isCanceled():
+            return {}
 
-            j = 1  # prevent self overwriting in algorithm outputs if two rasters have same display name
-            while out_path in all_out_paths:
-                rast_name = f"{rast.name()}_{j}"
-                out_path = os.path.join(output_dir, f"{rast_name}.tif")
-                j += 1
+        aligned_outputs = {}
+        jobs = {}
+        referenced = {}
+        for rast in rasters_to_align:
+            # Prevent the reference raster from being aligned multiple times
+            if rast.source() == ref_source:
+                continue
+            rast_name, out_path = self.output_name(
+                rast, output_dir, all_out_paths, out_format
+            )
             all_out_paths.append(out_path)
-
-            if i == enum_start:  # first item will be ref_layer
-                if parameters["MaskLayer"]:
-                    if not user_size:
-                        # mask ref layer with crop_to_cutline=True to match original cell alignment to preserve integrity
-                        outputs[rast_name] = self.mask_raster(
-                            rast,
-                            mask_layer,
-                            out_path,
-                            True,
-                            context=context,
-                            feedback=feedback,
-                        )
-                    else:
-                        temp_rast_layer = self.warp_raster(
-                            rast,
-                            ref_layer,
-                            mask_layer,
-                            resample_method,
-                            res_x,
-                            res_y,
-                            context=context,
-                            feedback=feedback,
-                        )["OUTPUT"]
-                        outputs[rast_name] = self.mask_raster(
-                            temp_rast_layer,
-                            mask_layer,
-                            out_path,
-                            False,
-                            context=context,
-                            feedback=feedback,
-                        )
-                    ref_layer = QgsRasterLayer(
-                        outputs[rast_name]["OUTPUT"], "ref layer"
-                    )
-                else:
-                    outputs[rast_name] = self.warp_raster(
-                        rast,
-                        ref_layer,
-                        ref_layer,
-                        resample_method,
-                        res_x,
-                        res_y,
-                        out_path,
-                        context=context,
-                        feedback=feedback,
-                    )
-
-            elif parameters["MaskLayer"]:
-                temp_rast_layer = self.warp_raster(
-                    rast,
-                    ref_layer,
-                    ref_layer,
-                    resample_method,
-                    res_x,
-                    res_y,
-                    context=context,
-                    feedback=feedback,
-                )["OUTPUT"]
-                outputs[rast_name] = self.mask_raster(
-                    temp_rast_layer,
-                    mask_layer,
-                    out_path,
-                    False,
-                    context=context,
-                    feedback=feedback,
-                )
-
+            aligned_outputs[rast_name] = out_path
+            if (
+                virtual
+                and not mask_path
+                and self.is_aligned(rast.source(), ref_wkt, transform)
+            ):
+                # no resampling needed, the VRT only offsets the window of the input
+                referenced[rast_name] = (rast.source(), out_path)
             else:
-                outputs[rast_name] = self.warp_raster(
-                    rast,
-                    ref_layer,
-                    ref_layer,
-                    resample_method,
-                    res_x,
-                    res_y,
+                jobs[rast_name] = (rast.source(), out_path)
+
+        for rast_name, (source, out_path) in referenced.items():
+            feedback.pushInfo(f"{rast_name} is already aligned; referencing it")
+            self.reference_window(source, out_path, ref_bounds)
+
+        # Each warp is independent, so rasters are warped concurrently and every warp is multithreaded
+        threads = max(1, (os.cpu_count() or 1) // max(1, min(max_workers, len(jobs))))
+        job_feedbacks = {name: QgsProcessingFeedback() for name in jobs}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    self.warp_raster,
+                    source,
                     out_path,
-                    context=context,
-                    feedback=feedback,
-                )
+                    resample_method,
+                    bounds=ref_bounds,
+                    res=ref_res,
+                    target_crs=ref_wkt,
+                    mask_path=mask_path,
+                    num_threads=threads,
+                    output_format=out_format,
+                    feedback=job_feedbacks[rast_name],
+                ): rast_name
+                for rast_name, (source, out_path) in jobs.items()
+            }
+            pending = set(futures)
+            current_step = 3 + len(referenced)
+            while pending:
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                if feedback.isCanceled():
+                    for future in pending:
+                        future.cancel()
+                    for job_feedback in job_feedbacks.values():
+                        job_feedback.cancel()
+                    return {}
 
-            if self.load_outputs:
+                for future in done:
+                    rast_name = futures[future]
+                    future.result()
+                    feedback.pushInfo(f"Aligned {rast_name}")
+                    feedback.setCurrentStep(current_step)
+                    current_step += 1
+
+        for rast_name, out_path in aligned_outputs.items():
+            results[rast_name] = out_path
+
+        if self.load_outputs:
+            for rast_name, out_path in results.items():
                 context.addLayerToLoadOnCompletion(
-                    outputs[rast_name]["OUTPUT"],
+                    out_path,
                     QgsProcessingContext.LayerDetails(
                         rast_name, context.project(), rast_name
                     ),
                 )
-            results[rast_name] = outputs[rast_name]["OUTPUT"]
-
-            feedback.setCurrentStep(i)
-            if feedback.isCanceled():
-                return {}
 
         return results
 
@@ -375,7 +382,7 @@ class AlignRasters(QNSPECTAlgorithm):
     def shortHelpString(self):
         return """<html><body>
 <a href="https://coast.noaa.gov/data/digitalcoast/pdf/qnspect-help-and-technical-guide.pdf#Align_Rasters">Documentation</a><h2>Algorithm description</h2>
-<p>The algorithm aligns one or more rasters to a reference raster. The aligned rasters will adopt the CRS, cell size, and origin of the reference raster. The aligned rasters will be saved as TIFF files.</p>
+<p>The algorithm aligns one or more rasters to a reference raster. The aligned rasters will adopt the CRS, cell size, and origin of the reference raster. The aligned rasters will be saved as TIFF files, or as virtual rasters if `Write Virtual Rasters (VRT)` is checked.</p>
 <h2>Input parameters</h2>
 <h3>Reference Raster</h3>
 <p>The raster used for determining the CRS and origin coordinates of the output rasters.</p>
@@ -389,6 +396,11 @@ class AlignRasters(QNSPECTAlgorithm):
 <p>Buffer added around the Mask Layer. If the Mask Layer is not provided, no buffer will be applied.</p>
 <h3>Output Cell Size [optional]</h3>
 <p>The raster cell size of the output rasters. If this is not set, the cell size will be the same as the reference raster.</p>
+<h2>Advanced Parameters</h2>
+<h3>Write Virtual Rasters (VRT)</h3>
+<p>If checked, the aligned rasters are saved as virtual rasters (`.vrt`) instead of TIFF copies. Rasters that already share the CRS, cell size and cell origin of the reference raster are referenced directly and only offset to its extent; the other rasters are warped when they are read. This saves the disk space and time of copying the rasters, but the virtual rasters depend on the input files, which must not be moved or deleted.</p>
+<h3>Maximum Parallel Alignments</h3>
+<p>The reference raster is aligned first, then the other rasters are aligned concurrently, up to this many at a time. Each alignment applies the mask in the same warp and uses multithreaded warping, so every raster is read and written once. Lower this value if the computer runs low on memory.</p>
 <h2>Outputs</h2>
 <h3>Output Directory</h3>
 <p>The output directory the aligned rasters will be saved to. The aligned rasters will have the same name as their source files.</p>
@@ -406,76 +418,155 @@ class AlignRasters(QNSPECTAlgorithm):
             ras_size_y = rast_layer.rasterUnitsPerPixelY()
             return ras_size_x, ras_size_y, False
 
-    def mask_raster(
+    def output_name(
         self,
         rast: QgsRasterLayer,
-        mask_layer: Union[str, QgsVectorLayer],
-        out_path: str = QgsProcessing.TEMPORARY_OUTPUT,
-        crop_to_cutline: bool = False,
-        extra: str = "-wo CUTLINE_ALL_TOUCHED=TRUE",
-        context=None,
-        feedback=None,
-    ):
-        # Clip raster by mask layer
+        output_dir: str,
+        taken: list,
+        output_format: str = "GTiff",
+    ) -> tuple:
+        """Name and path of the aligned raster, ex: ("elevation", ".../elevation.tif")"""
+        extension = "vrt" if output_format == "VRT" else "tif"
+        rast_name = rast.name()
+        out_path = os.path.join(output_dir, f"{rast_name}.{extension}")
+
+        j = 1  # prevent self overwriting in algorithm outputs if two rasters have same display name
+        while out_path in taken:
+            rast_name = f"{rast.name()}_{j}"
+            out_path = os.path.join(output_dir, f"{rast_name}.{extension}")
+            j += 1
+        return rast_name, out_path
+
+    def is_aligned(self, source: str, ref_wkt: str, ref_transform: tuple) -> bool:
+        """Check if a raster shares the CRS, cell size and cell origin of the reference grid"""
+        ds = gdal.Open(source)
+        if ds is None:
+            return False
+        transform = ds.GetGeoTransform()
+        srs = osr.SpatialReference(wkt=ds.GetProjection())
+        ds = None
+
+        ref_srs = osr.SpatialReference(wkt=ref_wkt)
+        if not ref_srs.IsSame(srs):
+            return False
+        if transform[2] or transform[4]:  # rotated
+            return False
+        tolerance = 1e-6
+        for i, res_index in ((0, 1), (3, 5)):
+            ref_res = ref_transform[res_index]
+            if abs(transform[res_index] - ref_res) > tolerance * abs(ref_res):
+                return False
+            offset = (transform[i] - ref_transform[i]) / ref_res
+            if abs(offset - round(offset)) > tolerance:
+                return False
+        return True
+
+    def reference_window(self, source: str, out_path: str, bounds: tuple = None) -> str:
+        """Write a VRT that references the window of an aligned raster covering the bounds (xmin, ymin, xmax, ymax)"""
+        options = gdal.TranslateOptions(
+            format="VRT",
+            projWin=[bounds[0], bounds[3], bounds[2], bounds[1]] if bounds else None,
+        )
+        ds = gdal.Translate(out_path, source, options=options)
+        if ds is None:
+            raise QgsProcessingException(
+                f"Unable to reference {source}: {gdal.GetLastErrorMsg()}"
+            )
+        ds = None  # flush to disk
+        return out_path
+
+    def prepare_mask(self, parameters, ref_layer_crs, context, feedback) -> str:
+        """Write the (buffered) mask layer in the reference raster CRS to a file GDAL can use as a cutline"""
+        # Reprojecting Mask Layer to Reference Raster CRS because
+        # Mask Layer and Buffer distance can be in different CRS
+        # If the distance is in projected units (meters etc) and Mask Layer in Geographic (degrees)
+        # the buffer algorithm will treat distance in degrees ignoring actual buffer distance units
         alg_params = {
-            "ALPHA_BAND": False,
-            "CROP_TO_CUTLINE": crop_to_cutline,
-            "DATA_TYPE": 0,  # Use Input Layer Data Type
-            "EXTRA": extra,
-            "INPUT": rast,
-            "KEEP_RESOLUTION": False,
-            "MASK": mask_layer,
-            "MULTITHREADING": False,
-            "NODATA": None,
-            "OPTIONS": "",
-            "SET_RESOLUTION": False,
-            "SOURCE_CRS": None,
-            "TARGET_CRS": None,
-            "X_RESOLUTION": None,
-            "Y_RESOLUTION": None,
-            "OUTPUT": out_path,
+            "INPUT": parameters["MaskLayer"],
+            "OPERATION": "",
+            "TARGET_CRS": ref_layer_crs,
+            "OUTPUT": QgsProcessingUtils.generateTempFilename("mask.gpkg"),
         }
-        return processing.run(
-            "gdal:cliprasterbymasklayer",
+        mask_path = processing.run(
+            "native:reprojectlayer",
             alg_params,
             context=context,
             feedback=feedback,
             is_child_algorithm=True,
-        )
+        )["OUTPUT"]
+
+        feedback.setCurrentStep(1)
+        if feedback.isCanceled():
+            return mask_path
+
+        if parameters["MaskBuffer"]:
+            # Buffer
+            alg_params = {
+                "DISSOLVE": False,
+                "DISTANCE": parameters["MaskBuffer"],
+                "END_CAP_STYLE": 0,
+                "INPUT": mask_path,
+                "JOIN_STYLE": 0,
+                "MITER_LIMIT": 2,
+                "SEGMENTS": 5,
+                "OUTPUT": QgsProcessingUtils.generateTempFilename("mask_buffer.gpkg"),
+            }
+            mask_path = processing.run(
+                "native:buffer",
+                alg_params,
+                context=context,
+                feedback=feedback,
+                is_child_algorithm=True,
+            )["OUTPUT"]
+        return mask_path
 
     def warp_raster(
         self,
-        rast: QgsRasterLayer,
-        ref_layer,
-        extent_layer,
-        resample: int,
-        res_x: float,
-        res_y: float,
-        out_path: str = QgsProcessing.TEMPORARY_OUTPUT,
-        extra: str = "",
-        context=None,
+        source: str,
+        out_path: str,
+        resample: str,
+        bounds: tuple = None,
+        res: tuple = (None, None),
+        target_crs: str = None,
+        mask_path: str = None,
+        crop_to_cutline: bool = False,
+        num_threads="ALL_CPUS",
+        output_format: str = "GTiff",
         feedback=None,
-    ):
-        # Warp (reproject)
-        alg_params = {
-            "DATA_TYPE": 0,
-            "INPUT": rast,
-            "MULTITHREADING": False,
-            "NODATA": None,
-            "OPTIONS": "",
-            "RESAMPLING": resample,
-            "SOURCE_CRS": None,
-            "TARGET_CRS": ref_layer,
-            "TARGET_EXTENT": extent_layer,
-            "TARGET_EXTENT_CRS": None,
-            "TARGET_RESOLUTION": None,
-            "OUTPUT": out_path,
-            "EXTRA": f"-tr {res_x} {res_y} {extra}",
-        }
-        return processing.run(
-            "gdal:warpreproject",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
+    ) -> str:
+        """Warp (reproject) a raster onto the target grid with GDAL multithreaded warping.
+        If a mask is provided it is applied as the cutline of the same warp, so the raster is read and written once.
+        """
+        warp_options = [f"NUM_THREADS={num_threads}"]
+        if mask_path:
+            warp_options.append("CUTLINE_ALL_TOUCHED=TRUE")
+
+        def progress(complete, message, data):
+            if feedback is None:
+                return 1
+            feedback.setProgress(100 * complete)
+            return 0 if feedback.isCanceled() else 1
+
+        options = gdal.WarpOptions(
+            format=output_format,
+            outputBounds=bounds,
+            xRes=res[0],
+            yRes=res[1],
+            dstSRS=target_crs,
+            resampleAlg=resample,
+            cutlineDSName=mask_path,
+            cropToCutline=crop_to_cutline,
+            multithread=True,
+            warpOptions=warp_options,
+            creationOptions=["BIGTIFF=IF_SAFER"] if output_format == "GTiff" else None,
+            callback=progress,
         )
+        ds = gdal.Warp(out_path, source, options=options)
+        if ds is None:
+            if feedback is not None and feedback.isCanceled():
+                raise QgsProcessingException("Canceled.")
+            raise QgsProcessingException(
+                f"Unable to align {source}: {gdal.GetLastErrorMsg()}"
+            )
+        ds = None  # flush to disk
+        return out_path
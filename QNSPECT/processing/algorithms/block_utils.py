@@ -0,0 +1,309 @@
+"""
+Store block-wise raster functions that are required by different QNSPECT Modules.
+Rasters are streamed window by window with GDAL so several results can be produced from one read of the inputs.
+"""
+
+import numpy as np
+from osgeo import gdal
+
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingUtils,
+    QgsRasterLayer,
+    QgsProcessingException,
+)
+
+NODATA = -999999  # same no data value used by perform_raster_math
+BLOCK_SIZE = 512
+
+# names available to expressions, same as in gdal_calc which imports all of numpy
+_EXPRESSION_NAMESPACE = {
+    name: getattr(np, name) for name in dir(np) if not name.startswith("_")
+}
+_EXPRESSION_NAMESPACE["numpy"] = np
+
+
+def raster_source(raster, context=None) -> str:
+    """Return a GDAL readable source for a raster path, raster layer or layer id"""
+    if isinstance(raster, QgsRasterLayer):
+        return raster.source()
+    if context is not None:
+        layer = QgsProcessingUtils.mapLayerFromString(str(raster), context)
+        if layer is not None:
+            return layer.source()
+    return str(raster)
+
+
+def open_raster(raster, context=None, update: bool = False) -> gdal.Dataset:
+    """Open a raster path, raster layer or layer id with GDAL"""
+    source = raster_source(raster, context)
+    ds = gdal.Open(source, gdal.GA_Update if update else gdal.GA_ReadOnly)
+    if ds is None:
+        raise QgsProcessingException(f"Unable to open raster {source}")
+    return ds
+
+
+def resolve_output(output, name: str = "OUTPUT") -> str:
+    """Replace the processing temporary output placeholder with a file in the processing temp folder"""
+    if output is None or output == QgsProcessing.TEMPORARY_OUTPUT:
+        return QgsProcessingUtils.generateTempFilename(f"{name}.tif")
+    return str(output)
+
+
+def create_raster_like(
+    ref_ds: gdal.Dataset,
+    path: str,
+    data_type: int = gdal.GDT_Float32,
+    nodata: float = NODATA,
+) -> gdal.Dataset:
+    """Create a single band tiled GeoTIFF on the grid of the reference dataset"""
+    out_ds = gdal.GetDriverByName("GTiff").Create(
+        path,
+        ref_ds.RasterXSize,
+        ref_ds.RasterYSize,
+        1,
+        data_type,
+        options=[
+            "TILED=YES",
+            f"BLOCKXSIZE={BLOCK_SIZE}",
+            f"BLOCKYSIZE={BLOCK_SIZE}",
+            "BIGTIFF=IF_SAFER",
+        ],
+    )
+    out_ds.SetGeoTransform(ref_ds.GetGeoTransform())
+    out_ds.SetProjection(ref_ds.GetProjection())
+    if nodata is not None:
+        out_ds.GetRasterBand(1).SetNoDataValue(nodata)
+    return out_ds
+
+
+def iterate_windows(x_size: int, y_size: int, block_size: int = BLOCK_SIZE):
+    """Yield (x offset, y offset, width, height) windows covering a raster"""
+    for y_off in range(0, y_size, block_size):
+        height = min(block_size, y_size - y_off)
+        for x_off in range(0, x_size, block_size):
+            width = min(block_size, x_size - x_off)
+            yield x_off, y_off, width, height
+
+
+def valid_data(array: np.ndarray, nodata) -> np.ndarray:
+    """Boolean array that is True where the cell is not no data"""
+    if nodata is None:
+        return np.ones(array.shape, dtype=bool)
+    if np.isnan(nodata):
+        return ~np.isnan(array)
+    return array != nodata
+
+
+def read_window_with_halo(
+    band: gdal.Band, x_off: int, y_off: int, width: int, height: int, halo: int = 1
+) -> np.ndarray:
+    """Read a window grown by halo cells on each side as float64 for neighbourhood kernels.
+    No data cells and cells outside of the raster are NaN."""
+    x_start = max(x_off - halo, 0)
+    y_start = max(y_off - halo, 0)
+    x_end = min(x_off + width + halo, band.XSize)
+    y_end = min(y_off + height + halo, band.YSize)
+    block = band.ReadAsArray(x_start, y_start, x_end - x_start, y_end - y_start).astype(
+        np.float64
+    )
+    block[~valid_data(block, band.GetNoDataValue())] = np.nan
+    window = np.full((height + 2 * halo, width + 2 * halo), np.nan)
+    window[
+        y_start - y_off + halo : y_end - y_off + halo,
+        x_start - x_off + halo : x_end - x_off + halo,
+    ] = block
+    return window
+
+
+class BlockMask:
+    """Block occupancy index of a raster: which BLOCK_SIZE windows hold at least one valid cell.
+    It is computed once per run, usually from the elevation raster, so later stages can skip
+    the windows outside of the watershed without reading them.
+    The source raster is kept so the cells that are no data in it are also no data in the
+    windows that are computed; otherwise the outputs would stop along the block edges."""
+
+    def __init__(self, occupied: np.ndarray, x_size: int, y_size: int, source=None):
+        self.occupied = occupied
+        self.x_size = x_size
+        self.y_size = y_size
+        self.source = source
+
+    @classmethod
+    def from_raster(cls, raster, context=None, feedback=None) -> "BlockMask":
+        ds = open_raster(raster, context)
+        band = ds.GetRasterBand(1)
+        nodata = band.GetNoDataValue()
+        occupied = np.zeros(
+            (
+                (ds.RasterYSize + BLOCK_SIZE - 1) // BLOCK_SIZE,
+                (ds.RasterXSize + BLOCK_SIZE - 1) // BLOCK_SIZE,
+            ),
+            dtype=bool,
+        )
+        if nodata is None:
+            occupied[:] = True
+        else:
+            for x_off, y_off, width, height in iterate_windows(
+                ds.RasterXSize, ds.RasterYSize
+            ):
+                if feedback is not None and feedback.isCanceled():
+                    occupied[:] = True
+                    break
+                block = band.ReadAsArray(x_off, y_off, width, height)
+                occupied[y_off // BLOCK_SIZE, x_off // BLOCK_SIZE] = valid_data(
+                    block, nodata
+                ).any()
+        mask = cls(
+            occupied, ds.RasterXSize, ds.RasterYSize, raster_source(raster, context)
+        )
+        band = None
+        ds = None
+        return mask
+
+    def matches(self, ds: gdal.Dataset) -> bool:
+        """Check if the mask was computed on a grid of the same size as the dataset"""
+        return (ds.RasterXSize, ds.RasterYSize) == (self.x_size, self.y_size)
+
+    def is_occupied(self, x_off: int, y_off: int) -> bool:
+        return bool(self.occupied[y_off // BLOCK_SIZE, x_off // BLOCK_SIZE])
+
+    def occupied_fraction(self) -> float:
+        return float(self.occupied.mean()) if self.occupied.size else 0.0
+
+
+def process_blocks(
+    inputs: dict,
+    outputs: dict,
+    func,
+    feedback=None,
+    context=None,
+    data_type=gdal.GDT_Float32,
+    nodata=NODATA,
+    mask: BlockMask = None,
+    nodata_inputs: list = None,
+) -> dict:
+    """Stream the input rasters window by window through func and write the arrays it returns.
+
+    inputs maps names to rasters on the same grid and outputs maps names to destinations.
+    func is called with a dict of input arrays and a boolean array of cells that are valid in all inputs;
+    it must return a dict of arrays with the keys of outputs. Invalid cells are written as nodata.
+    If nodata_inputs names some of the inputs, only their no data cells are invalid and func receives
+    the no data cells of the other inputs as they are.
+    If the feedback is canceled, the partial outputs are deleted and QgsProcessingException is raised.
+    data_type and nodata apply to all outputs, or can be dicts keyed by output name.
+    If a block mask is given, windows without valid cells are neither read nor computed;
+    GDAL fills them with nodata when the outputs are closed. In the other windows, the cells that are
+    no data in the raster of the mask are invalid too, so the outputs follow its edge cell by cell.
+    Returns a dict of output paths."""
+    datasets = {name: open_raster(raster, context) for name, raster in inputs.items()}
+    bands = {name: ds.GetRasterBand(1) for name, ds in datasets.items()}
+    nodata_values = {name: band.GetNoDataValue() for name, band in bands.items()}
+    ref_ds = next(iter(datasets.values()))
+
+    out_paths = {name: resolve_output(path, name) for name, path in outputs.items()}
+    out_nodata = {
+        name: nodata[name] if isinstance(nodata, dict) else nodata for name in outputs
+    }
+    out_datasets = {
+        name: create_raster_like(
+            ref_ds,
+            path,
+            data_type[name] if isinstance(data_type, dict) else data_type,
+            out_nodata[name],
+        )
+        for name, path in out_paths.items()
+    }
+
+    if mask is not None and not mask.matches(ref_ds):
+        mask = None
+    mask_ds = mask_band = None
+    if mask is not None and mask.source is not None:
+        mask_ds = open_raster(mask.source)
+        mask_band = mask_ds.GetRasterBand(1)
+        mask_nodata = mask_band.GetNoDataValue()
+
+    canceled = False
+    windows = list(iterate_windows(ref_ds.RasterXSize, ref_ds.RasterYSize))
+    for i, (x_off, y_off, width, height) in enumerate(windows):
+        if feedback is not None:
+            if feedback.isCanceled():
+                canceled = True
+                break
+            feedback.setProgress(100 * i / len(windows))
+        if mask is not None and not mask.is_occupied(x_off, y_off):
+            continue
+
+        arrays = {}
+        valid = np.ones((height, width), dtype=bool)
+        for name, band in bands.items():
+            arrays[name] = band.ReadAsArray(x_off, y_off, width, height)
+            if nodata_inputs is None or name in nodata_inputs:
+                valid &= valid_data(arrays[name], nodata_values[name])
+        if mask_band is not None:
+            valid &= valid_data(
+                mask_band.ReadAsArray(x_off, y_off, width, height), mask_nodata
+            )
+
+        results = func(arrays, valid)
+        for name, out_ds in out_datasets.items():
+            block = np.where(valid, results[name], out_nodata[name])
+            out_ds.GetRasterBand(1).WriteArray(block, x_off, y_off)
+
+    for out_ds in out_datasets.values():
+        out_ds.FlushCache()
+    out_datasets.clear()
+    bands.clear()
+    datasets.clear()
+    mask_band = None
+    mask_ds = None
+
+    if canceled:
+        # partial outputs must not be mistaken for results
+        for path in out_paths.values():
+            gdal.GetDriverByName("GTiff").Delete(path)
+        raise QgsProcessingException("Processing canceled.")
+    return out_paths
+
+
+def evaluate_expression(
+    exprs: str,
+    inputs: dict,
+    output=QgsProcessing.TEMPORARY_OUTPUT,
+    mask: BlockMask = None,
+    feedback=None,
+    context=None,
+) -> str:
+    """Evaluate a GDAL Raster Calculator style numpy expression, ex: "A * B", block by block.
+    Only the cells that are valid in all inputs are computed; the others are nodata as with gdal_calc.
+    With a block mask, the cells that are no data in the raster of the mask are nodata as well.
+    Returns the output path."""
+    code = compile(exprs, "<expression>", "eval")
+
+    def calculate(arrays, valid):
+        result = np.zeros(valid.shape, dtype=np.float64)
+        if valid.any():
+            result[valid] = eval(
+                code,
+                _EXPRESSION_NAMESPACE,
+                {name: array[valid] for name, array in arrays.items()},
+            )
+        return {"OUTPUT": result}
+
+    return process_blocks(
+        inputs,
+        {"OUTPUT": output},
+        calculate,
+        feedback=feedback,
+        context=context,
+        mask=mask,
+    )["OUTPUT"]
+
+
+def set_band_statistics(
+    path: str, minimum: float, maximum: float, mean: float, std_dev: float
+) -> None:
+    """Store band statistics with the raster so readers do not need to scan it again"""
+    ds = open_raster(path, update=True)
+    ds.GetRasterBand(1).SetStatistics(minimum, maximum, mean, std_dev)
+    ds = None
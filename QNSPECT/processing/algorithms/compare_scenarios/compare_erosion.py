@@ -26,16 +26,21 @@ from qgis.core import (
     QgsProcessingParameterFile,
     QgsProcessingParameterBoolean,
     QgsProcessingParameterFolderDestination,
+    QgsProcessingOutputFile,
     QgsProcessingException,
 )
 import processing
 
 from QNSPECT.processing.algorithms.compare_scenarios.comparison_utils import (
+    find_scenario_raster,
     run_direct_and_percent_comparisons,
+    write_comparison_summary,
 )
 from QNSPECT.processing.algorithms.compare_scenarios.qnspect_compare_algorithm import (
     QNSPECTCompareAlgorithm,
 )
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 
 class CompareErosion(QNSPECTCompareAlgorithm):
@@ -85,12 +90,16 @@ class CompareErosion(QNSPECTCompareAlgorithm):
                 defaultValue=None,
             )
         )
+        self.addOutput(QgsProcessingOutputFile(self.summary, self.summaryName))
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
         results = {}
         outputs = {}
+        summaries = []
 
         self.scenario_dir_a = Path(
             self.parameterAsString(parameters, self.scenarioA, context)
@@ -128,6 +137,7 @@ class CompareErosion(QNSPECTCompareAlgorithm):
                 feedback=feedback,
                 context=context,
                 outputs=outputs,
+                summaries=summaries,
                 compare_type=self.compareLocal,
             )
         if compare_acc:
@@ -138,9 +148,15 @@ class CompareErosion(QNSPECTCompareAlgorithm):
                 feedback=feedback,
                 context=context,
                 outputs=outputs,
+                summaries=summaries,
                 compare_type=self.compareAccumulate,
             )
 
+        if summaries:
+            results[self.summary] = write_comparison_summary(
+                summaries, self.output_dir / f"{self.summaryName}.csv"
+            )
+
         return results
 
     def name(self):
@@ -163,13 +179,14 @@ class CompareErosion(QNSPECTCompareAlgorithm):
         feedback,
         context,
         outputs,
+        summaries: list,
         compare_type: str,
     ):
         compare_name = f"Sediment {compare_type}"
-        raster_a = (self.scenario_dir_a / f"{compare_name}.tif").is_file()
-        raster_b = (self.scenario_dir_b / f"{compare_name}.tif").is_file()
+        raster_a = find_scenario_raster(self.scenario_dir_a, compare_name)
+        raster_b = find_scenario_raster(self.scenario_dir_b, compare_name)
         if raster_a and raster_b:
-            run_direct_and_percent_comparisons(
+            summary = run_direct_and_percent_comparisons(
                 scenario_dir_a=self.scenario_dir_a,
                 scenario_dir_b=self.scenario_dir_b,
                 output_dir=self.output_dir,
@@ -179,6 +196,7 @@ class CompareErosion(QNSPECTCompareAlgorithm):
                 outputs=outputs,
                 load_outputs=self.load_outputs,
             )
+            summaries.append(summary)
         else:
             feedback.pushWarning(
                 f"Comparison type {compare_type} was selected but one or more scenarios do not contain a related file."
@@ -213,4 +231,7 @@ The outputs of this algorithm are rasters that show the absolute and relative ma
 <h3>Output Folder</h3>
 <p>The folder the results of the comparison will be saved to.</p>
 
+<h3>Comparison Summary</h3>
+<p>CSV file saved in the Output Folder with one row per comparison. It lists the totals of both scenarios, the net and percent change of the totals, and the number of cells that increased, decreased, or did not change. The summary is computed while the comparison rasters are written.</p>
+
 </body></html>"""
@@ -27,17 +27,28 @@ from qgis.core import (
     QgsProcessingParameterBoolean,
     QgsProcessingParameterMatrix,
     QgsProcessingParameterFolderDestination,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterDefinition,
+    QgsProcessingOutputFile,
     QgsProcessingException,
 )
 import processing
 
 from QNSPECT.processing.algorithms.compare_scenarios.comparison_utils import (
-    run_direct_and_percent_comparisons,
+    SCENARIO_RASTER_SUFFIXES,
+    find_scenario_raster,
+    run_comparisons_in_parallel,
+    write_comparison_summary,
 )
 from QNSPECT.processing.algorithms.compare_scenarios.qnspect_compare_algorithm import (
     QNSPECTCompareAlgorithm,
 )
-from QNSPECT.processing.algorithms.qnspect_utils import filter_matrix
+from QNSPECT.processing.algorithms.qnspect_utils import (
+    filter_matrix,
+    default_worker_count,
+)
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 
 def find_all_matching(
@@ -46,11 +57,11 @@ def find_all_matching(
     """Finds all of the stems where valid comparison rasters exist in both folders."""
     matches = []
     scenario_a_stems = retrieve_scenario_file_stems(scenario_dir_a, comparison_types)
-    for stem in scenario_a_stems:
+    for stem in dict.fromkeys(scenario_a_stems):  # a stem can have both a tif and a vrt
         # Prevent finding comparison potentials between previous comparisons
         if len(stem.split(" ")) == 2:
-            if (scenario_dir_a / f"{stem}.tif").is_file():
-                if (scenario_dir_b / f"{stem}.tif").is_file():
+            if find_scenario_raster(scenario_dir_a, stem):
+                if find_scenario_raster(scenario_dir_b, stem):
                     matches.append(stem)
     return matches
 
@@ -58,7 +69,7 @@ def find_all_matching(
 def retrieve_scenario_file_stems(scenario_dir: Path, comparison_types: list) -> list:
     stems = []
     for file in scenario_dir.iterdir():
-        if file.suffix == ".tif":
+        if file.suffix in SCENARIO_RASTER_SUFFIXES:
             for type in comparison_types:
                 if type in file.stem:
                     stems.append(file.stem)
@@ -68,6 +79,7 @@ def retrieve_scenario_file_stems(scenario_dir: Path, comparison_types: list) ->
 class ComparePollution(QNSPECTCompareAlgorithm):
     compareConcentration = "Concentration"
     compareGrid = "Grid"
+    maxWorkers = "MaxWorkers"
 
     def initAlgorithm(self, config=None):
         self.addParameter(
@@ -138,6 +150,15 @@ class ComparePollution(QNSPECTCompareAlgorithm):
                 defaultValue=True,
             )
         )
+        param = QgsProcessingParameterNumber(
+            self.maxWorkers,
+            "Maximum Parallel Comparisons",
+            type=QgsProcessingParameterNumber.Integer,
+            minValue=1,
+            defaultValue=default_worker_count(),
+        )
+        param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(param)
         self.addParameter(
             QgsProcessingParameterFolderDestination(
                 self.outputDir,
@@ -146,7 +167,10 @@ class ComparePollution(QNSPECTCompareAlgorithm):
                 defaultValue=None,
             )
         )
+        self.addOutput(QgsProcessingOutputFile(self.summary, self.summaryName))
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
@@ -193,66 +217,60 @@ class ComparePollution(QNSPECTCompareAlgorithm):
                 raise QgsProcessingException(
                     "No valid comparisons were found between the two scenario folders."
                 )
-            total_steps = len(matching_names)
-        else:
-            total_steps = len(pollutants)
-        feedback = QgsProcessingMultiStepFeedback(total_steps + 1, model_feedback)
-        current_step = 1
-
-        if run_everything:
-            feedback.pushInfo("Running everything...")
-            for name in matching_names:
-                feedback.setCurrentStep(current_step)
-                current_step += 1
-                if feedback.isCanceled():
-                    return {}
-                run_direct_and_percent_comparisons(
-                    scenario_dir_a=scenario_dir_a,
-                    scenario_dir_b=scenario_dir_b,
-                    output_dir=output_dir,
-                    name=name,
-                    feedback=feedback,
-                    context=context,
-                    outputs=outputs,
-                    load_outputs=self.load_outputs,
-                )
         else:
+            matching_names = []
             for pollutant in pollutants:
-                feedback.setCurrentStep(current_step)
-                current_step += 1
-                if feedback.isCanceled():
-                    return {}
                 for comp_type in comparison_types:
                     name = f"{pollutant} {comp_type}"
 
                     # Check for existence of both comparison types for the pollutant
-                    pollutant_comp_a = (scenario_dir_a / f"{name}.tif").is_file()
-                    pollutant_comp_b = (scenario_dir_b / f"{name}.tif").is_file()
+                    pollutant_comp_a = find_scenario_raster(scenario_dir_a, name)
+                    pollutant_comp_b = find_scenario_raster(scenario_dir_b, name)
                     if not (pollutant_comp_a and pollutant_comp_b):
                         if pollutant_comp_b:
-                            feedback.pushWarning(
-                                f'TIFF for "{name}" was not found in Scenario A.'
+                            model_feedback.pushWarning(
+                                f'Raster for "{name}" was not found in Scenario A.'
                             )
                         elif pollutant_comp_a:
-                            feedback.pushWarning(
-                                f'TIFF for "{name}" was not found in Scenario B.'
+                            model_feedback.pushWarning(
+                                f'Raster for "{name}" was not found in Scenario B.'
                             )
                         else:
-                            feedback.pushWarning(
-                                f'TIFF for "{name}" was not found in Scenarios A and B.'
+                            model_feedback.pushWarning(
+                                f'Raster for "{name}" was not found in Scenarios A and B.'
                             )
                         continue
+                    matching_names.append(name)
 
-                    run_direct_and_percent_comparisons(
-                        scenario_dir_a=scenario_dir_a,
-                        scenario_dir_b=scenario_dir_b,
-                        output_dir=output_dir,
-                        name=name,
-                        feedback=feedback,
-                        context=context,
-                        outputs=outputs,
-                        load_outputs=self.load_outputs,
-                    )
+        feedback = QgsProcessingMultiStepFeedback(
+            len(matching_names) + 1, model_feedback
+        )
+        feedback.setCurrentStep(1)
+        if feedback.isCanceled():
+            return {}
+
+        if run_everything:
+            feedback.pushInfo("Running everything...")
+        max_workers = self.parameterAsInt(parameters, self.maxWorkers, context)
+        # Each comparison is independent raster math, so they are dispatched concurrently
+        summaries = run_comparisons_in_parallel(
+            names=matching_names,
+            scenario_dir_a=scenario_dir_a,
+            scenario_dir_b=scenario_dir_b,
+            output_dir=output_dir,
+            feedback=feedback,
+            context=context,
+            outputs=outputs,
+            load_outputs=self.load_outputs,
+            max_workers=max_workers,
+            current_step=2,
+        )
+        if summaries is None:
+            return {}
+
+        results[self.summary] = write_comparison_summary(
+            summaries, output_dir / f"{self.summaryName}.csv"
+        )
 
         return results
 
@@ -297,9 +315,17 @@ The outputs of this algorithm are rasters that show the absolute and relative ma
 
 The user can add more pollutants to the table. To exclude an output from the analysis, write N in the Output column. You must click OK after editing to save your changes.</p>
 
+<h2>Advanced Parameters</h2>
+
+<h3>Maximum Parallel Comparisons</h3>
+<p>Number of comparisons that are run at the same time. Each comparison is independent, so running several at once shortens the total run time. Lower this value if the computer runs out of memory or disk bandwidth.</p>
+
 <h2>Outputs</h2>
 
 <h3>Output Folder</h3>
 <p>The folder the results of the comparison will be saved to.</p>
 
+<h3>Comparison Summary</h3>
+<p>CSV file saved in the Output Folder with one row per comparison. It lists the totals of both scenarios, the net and percent change of the totals, and the number of cells that increased, decreased, or did not change. The summary is computed while the comparison rasters are written.</p>
+
 </body></html>"""
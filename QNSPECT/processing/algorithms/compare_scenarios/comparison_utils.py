@@ -1,9 +1,39 @@
-import processing
+import csv
+import math
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-from qgis.core import QgsProcessingContext
+import numpy as np
+from qgis.core import QgsProcessingContext, QgsProcessingFeedback
 
-from QNSPECT.processing.algorithms.qnspect_utils import perform_raster_math
+from QNSPECT.processing.algorithms.block_utils import (
+    NODATA,
+    process_blocks,
+    set_band_statistics,
+)
+
+SUMMARY_FIELDS = [
+    "Name",
+    "Total A",
+    "Total B",
+    "Net Change",
+    "Percent Change",
+    "Increased Cells",
+    "Decreased Cells",
+    "Unchanged Cells",
+]
+
+SCENARIO_RASTER_SUFFIXES = (".tif", ".vrt")  # vrt for outputs derived on the fly
+
+
+def find_scenario_raster(scenario_dir: Path, name: str):
+    """Path of the output raster of a scenario, ex: Lead Concentration.tif or Lead Concentration.vrt
+    Returns None if the scenario does not have the output."""
+    for suffix in SCENARIO_RASTER_SUFFIXES:
+        path = scenario_dir / f"{name}{suffix}"
+        if path.is_file():
+            return path
+    return None
 
 
 def run_direct_and_percent_comparisons(
@@ -15,61 +45,186 @@ def run_direct_and_percent_comparisons(
     context,
     outputs,
     load_outputs: bool,
-):
-    input_dict = {
-        "band_a": 1,
-        "band_b": 1,
-        "input_a": str(scenario_dir_a / f"{name}.tif"),
-        "input_b": str(scenario_dir_b / f"{name}.tif"),
-    }
-    _run_comparison_type(
-        output_dir=output_dir,
-        input_dict=input_dict,
-        name=name,
-        compare_type="Direct",
-        expression="A - B",
+) -> dict:
+    """Create the Direct and Percent comparison rasters of both scenarios in a single pass
+    and return the summary statistics of the comparison."""
+    direct_name = f"{name} Direct"
+    percent_name = f"{name} Percent"
+    summary, out_paths = compare_rasters(
+        raster_a=str(find_scenario_raster(scenario_dir_a, name)),
+        raster_b=str(find_scenario_raster(scenario_dir_b, name)),
+        direct_output=str(output_dir / f"{direct_name}.tif"),
+        percent_output=str(output_dir / f"{percent_name}.tif"),
         feedback=feedback,
-        context=context,
-        outputs=outputs,
-        load_outputs=load_outputs,
     )
-    _run_comparison_type(
-        output_dir=output_dir,
-        input_dict=input_dict,
-        name=name,
-        compare_type="Percent",
-        expression="100 * ((A - B) / B)",  # example A = [[5,1]] and B = [[1,2]] result = [[400%,-50%]] interpreted as [[A increased 400%, A decreased 50%]]
+    summary["Name"] = name
+    outputs[direct_name] = {"OUTPUT": out_paths["Direct"]}
+    outputs[percent_name] = {"OUTPUT": out_paths["Percent"]}
+    if load_outputs:
+        _load_comparison_output(out_paths["Direct"], direct_name, context)
+        _load_comparison_output(out_paths["Percent"], percent_name, context)
+    return summary
+
+
+def compare_rasters(
+    raster_a: str, raster_b: str, direct_output: str, percent_output: str, feedback
+) -> tuple:
+    """Stream both scenario rasters once, writing Direct (A - B) and Percent (100 * (A - B) / B) rasters
+    while accumulating totals, cell change counts and band statistics of the outputs.
+    Percent is no data where B is 0."""
+    stats = {
+        "Direct": _RunningStats(),
+        "Percent": _RunningStats(),
+    }
+    totals = {"a": 0.0, "b": 0.0, "increased": 0, "decreased": 0, "unchanged": 0}
+
+    def compare(arrays, valid):
+        a = arrays["A"].astype(np.float64)
+        b = arrays["B"].astype(np.float64)
+        direct = a - b
+        # example A = [[5,1]] and B = [[1,2]] result = [[400%,-50%]] interpreted as [[A increased 400%, A decreased 50%]]
+        nonzero_b = b != 0
+        percent = np.divide(
+            100 * direct, b, out=np.full_like(direct, NODATA), where=nonzero_b
+        )
+
+        direct_valid = direct[valid]
+        totals["a"] += float(a[valid].sum())
+        totals["b"] += float(b[valid].sum())
+        totals["increased"] += int(np.count_nonzero(direct_valid > 0))
+        totals["decreased"] += int(np.count_nonzero(direct_valid < 0))
+        totals["unchanged"] += int(np.count_nonzero(direct_valid == 0))
+        stats["Direct"].update(direct_valid)
+        stats["Percent"].update(percent[valid & nonzero_b])
+
+        return {"Direct": direct, "Percent": percent}
+
+    out_paths = process_blocks(
+        inputs={"A": raster_a, "B": raster_b},
+        outputs={"Direct": direct_output, "Percent": percent_output},
+        func=compare,
         feedback=feedback,
-        context=context,
-        outputs=outputs,
-        load_outputs=load_outputs,
     )
+    for name, path in out_paths.items():
+        if stats[name].count:
+            set_band_statistics(path, *stats[name].values())
 
+    net_change = totals["a"] - totals["b"]
+    summary = {
+        "Total A": totals["a"],
+        "Total B": totals["b"],
+        "Net Change": net_change,
+        "Percent Change": 100 * net_change / totals["b"] if totals["b"] else None,
+        "Increased Cells": totals["increased"],
+        "Decreased Cells": totals["decreased"],
+        "Unchanged Cells": totals["unchanged"],
+    }
+    return summary, out_paths
+
+
+def write_comparison_summary(summaries: list, output_path: Path) -> str:
+    """Write one row per comparison to a CSV file"""
+    with open(output_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summaries)
+    return str(output_path)
 
-def _run_comparison_type(
+
+def run_comparisons_in_parallel(
+    names: list,  # ex: ["Lead Local", "Lead Accumulated"]
+    scenario_dir_a: Path,
+    scenario_dir_b: Path,
     output_dir: Path,
-    input_dict: dict,
-    name: str,  # ex: Lead Local
-    compare_type: str,
-    expression: str,
     feedback,
     context,
     outputs,
     load_outputs: bool,
+    max_workers: int,
+    current_step: int = 1,
 ):
-    type_name = f"{name} {compare_type}"
-    output = outputs[type_name] = perform_raster_math(
-        exprs=expression,
-        input_dict=input_dict,
-        context=context,
-        feedback=feedback,
-        output=str(output_dir / f"{type_name}.tif"),
-    )
-    layer_name = f"{type_name} "
-    if load_outputs:
-        context.addLayerToLoadOnCompletion(
-            output["OUTPUT"],
-            QgsProcessingContext.LayerDetails(
-                layer_name, context.project(), layer_name
-            ),
+    """Run the direct and percent comparisons of all names concurrently on a bounded thread pool.
+    Every comparison is independent raster math, so each job gets its own feedback;
+    the multi-step feedback is advanced from the calling thread as jobs complete.
+    Returns the comparison summaries in the order of names, or None if the run was canceled.
+    """
+    job_feedbacks = {name: QgsProcessingFeedback() for name in names}
+    summaries = {}
+
+    def run_job(name: str) -> tuple:
+        job_outputs = {}
+        summary = run_direct_and_percent_comparisons(
+            scenario_dir_a=scenario_dir_a,
+            scenario_dir_b=scenario_dir_b,
+            output_dir=output_dir,
+            name=name,
+            feedback=job_feedbacks[name],
+            context=None,
+            outputs=job_outputs,
+            load_outputs=False,
         )
+        return job_outputs, summary
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_job, name): name for name in names}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            if feedback.isCanceled():
+                for future in pending:
+                    future.cancel()
+                for job_feedback in job_feedbacks.values():
+                    job_feedback.cancel()
+                return None
+
+            for future in done:
+                name = futures[future]
+                job_outputs, summaries[name] = future.result()
+                outputs.update(job_outputs)
+                if load_outputs:
+                    for type_name, output in job_outputs.items():
+                        _load_comparison_output(output["OUTPUT"], type_name, context)
+                feedback.pushInfo(f"Compared {name}")
+                feedback.setCurrentStep(current_step)
+                current_step += 1
+
+    return [summaries[name] for name in names]
+
+
+def _load_comparison_output(layer, type_name: str, context):
+    layer_name = f"{type_name} "
+    context.addLayerToLoadOnCompletion(
+        layer,
+        QgsProcessingContext.LayerDetails(layer_name, context.project(), layer_name),
+    )
+
+
+class _RunningStats:
+    """Accumulates count, min, max, mean and standard deviation over blocks.
+    The block means and sums of squared deviations are merged with Chan's formula,
+    which stays accurate when the mean is large compared to the deviation."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def update(self, values: np.ndarray) -> None:
+        values = values[np.isfinite(values)].astype(np.float64)
+        if values.size == 0:
+            return
+        block_mean = float(values.mean())
+        block_m2 = float(np.square(values - block_mean).sum())
+        count = self.count + values.size
+        delta = block_mean - self.mean
+        self.mean += delta * values.size / count
+        self.m2 += block_m2 + delta**2 * self.count * values.size / count
+        self.count = count
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+
+    def values(self) -> tuple:
+        """(min, max, mean, standard deviation)"""
+        return self.minimum, self.maximum, self.mean, math.sqrt(self.m2 / self.count)
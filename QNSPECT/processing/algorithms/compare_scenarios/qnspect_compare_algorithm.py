@@ -42,6 +42,8 @@ class QNSPECTCompareAlgorithm(QNSPECTAlgorithm):
     compareAccumulate = "Accumulated"
     loadOutputs = "LoadOutputs"
     outputDir = "Output"
+    summary = "Summary"
+    summaryName = "Comparison Summary"
 
     def __init__(self):
         super().__init__()
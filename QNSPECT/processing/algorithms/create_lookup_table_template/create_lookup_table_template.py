@@ -32,6 +32,8 @@ from qgis.core import (
 )
 
 from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 
 class CreateLookupTableTemplate(QNSPECTAlgorithm):
@@ -78,6 +80,8 @@ class CreateLookupTableTemplate(QNSPECTAlgorithm):
                 )
             )
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
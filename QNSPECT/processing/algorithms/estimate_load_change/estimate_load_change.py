@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = "NOAA"
+__date__ = "2026-10-18"
+__copyright__ = "(C) 2021 by NOAA"
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = "$Format:%H$"
+
+import numpy as np
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingMultiStepFeedback,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterField,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingException,
+    QgsDistanceArea,
+    QgsCoordinateTransformContext,
+    QgsUnitTypes,
+    QgsRasterLayer,
+)
+
+from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithms.qnspect_utils import load_run_file, filter_matrix
+from QNSPECT.processing.algorithms.block_utils import open_raster, valid_data
+from QNSPECT.processing.algorithms.modify_land_cover.land_cover_utils import (
+    LandCoverEditor,
+    load_change_record,
+    CHANGE_RECORD_SUFFIX,
+)
+from QNSPECT.processing.algorithms.estimate_load_change.load_change_utils import (
+    LocalLoadModel,
+    run_lookup_layer,
+    write_load_change_summary,
+)
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
+
+
+class EstimateLoadChange(QNSPECTAlgorithm):
+    runFile = "RunFile"
+    inputVector = "InputVector"
+    field = "Field"
+    landCoverValue = "LandCoverValue"
+    changeRecord = "ChangeRecord"
+    output = "Output"
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.runFile,
+                "Baseline Run File",
+                behavior=QgsProcessingParameterFile.File,
+                fileFilter="QNSPECT Files (*pol.json)",
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.inputVector,
+                "Areas to Modify",
+                optional=True,
+                types=[QgsProcessing.TypeVectorPolygon],
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.field,
+                "Land Cover Value Field",
+                optional=True,
+                type=QgsProcessingParameterField.Numeric,
+                parentLayerParameterName=self.inputVector,
+                allowMultiple=False,
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.landCoverValue,
+                "Land Cover Value",
+                optional=True,
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.changeRecord,
+                "Land Cover Change Record",
+                optional=True,
+                behavior=QgsProcessingParameterFile.File,
+                fileFilter=f"Land Cover Change Record (*{CHANGE_RECORD_SUFFIX})",
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.output,
+                "Load Change Summary",
+                fileFilter="CSV files (*.csv)",
+                createByDefault=True,
+                defaultValue=None,
+            )
+        )
+
+    @streamed
+    @profiled
+    def processAlgorithm(self, parameters, context, model_feedback):
+        feedback = QgsProcessingMultiStepFeedback(2, model_feedback)
+        results = {}
+
+        run_file = self.parameterAsFile(parameters, self.runFile, context)
+        if not run_file.lower().endswith(".pol.json"):
+            raise QgsProcessingException(
+                "Baseline Run File must be the configuration file of a Run Pollution Analysis run."
+            )
+        inputs = load_run_file(run_file)["Inputs"]
+
+        lookup_layer = run_lookup_layer(inputs)
+        lookup_fields = {f.name().lower(): f.name() for f in lookup_layer.fields()}
+        pollutants = [
+            pol
+            for pol in filter_matrix(inputs["PollutantOutputs"])
+            if pol.lower() != "runoff" and pol.lower() in lookup_fields
+        ]
+        raining_days = int(inputs["RainingDays"])
+        time_unit = "/year" if raining_days > 1 else "/event"
+
+        lc_layer = QgsRasterLayer(inputs["LandCoverRaster"], "Land Cover")
+        distance_area = QgsDistanceArea()
+        distance_area.setSourceCrs(lc_layer.crs(), QgsCoordinateTransformContext())
+        cell_area_sq_feet = distance_area.convertAreaMeasurement(
+            lc_layer.rasterUnitsPerPixelX() * lc_layer.rasterUnitsPerPixelY(),
+            QgsUnitTypes.AreaSquareFeet,
+        )
+        model = LocalLoadModel(
+            lookup_layer,
+            {pol: lookup_fields[pol.lower()] for pol in pollutants},
+            int(inputs["DualSoils"]),
+            raining_days,
+            cell_area_sq_feet,
+            int(inputs.get("PrecipUnits", 0)),
+        )
+
+        lc_ds = open_raster(inputs["LandCoverRaster"])
+        hsg_ds = open_raster(inputs["HSGRaster"])
+        precip_ds = open_raster(inputs["PrecipRaster"])
+        bands = {
+            "LC": lc_ds.GetRasterBand(1),
+            "HSG": hsg_ds.GetRasterBand(1),
+            "P": precip_ds.GetRasterBand(1),
+        }
+        nodata = {name: band.GetNoDataValue() for name, band in bands.items()}
+
+        feedback.setCurrentStep(1)
+        if feedback.isCanceled():
+            return {}
+
+        # Only the changed cells are evaluated, before and after the change
+        baseline = {name: 0.0 for name in ["Runoff"] + pollutants}
+        modified = dict(baseline)
+        changed_cells = 0
+        for x_off, y_off, rows, cols, old, new in self.changed_cells(
+            parameters, context, feedback, lc_layer, lc_ds
+        ):
+            height = int(rows.max()) + 1
+            width = int(cols.max()) + 1
+            hsg = bands["HSG"].ReadAsArray(x_off, y_off, width, height)[rows, cols]
+            precip = bands["P"].ReadAsArray(x_off, y_off, width, height)[rows, cols]
+            valid = (
+                valid_data(hsg, nodata["HSG"])
+                & valid_data(precip, nodata["P"])
+                & valid_data(old, nodata["LC"])
+                & valid_data(new, nodata["LC"])
+            )
+            if not valid.any():
+                continue
+            changed_cells += int(valid.sum())
+            args = (hsg[valid], precip[valid].astype(np.float64))
+            for name, value in model.local_loads(old[valid], *args).items():
+                baseline[name] += value
+            for name, value in model.local_loads(new[valid], *args).items():
+                modified[name] += value
+
+        if feedback.isCanceled():
+            return {}
+
+        feedback.pushInfo(f"Land cover changed in {changed_cells} cells.")
+        for name in baseline:
+            scale, unit = (1, "L") if name == "Runoff" else (1e-6, "kg")
+            feedback.pushInfo(
+                f"{name} Local: {(modified[name] - baseline[name]) * scale:+,.4f} {unit}{time_unit}"
+            )
+
+        results[self.output] = write_load_change_summary(
+            baseline,
+            modified,
+            time_unit,
+            self.parameterAsFileOutput(parameters, self.output, context),
+        )
+        return results
+
+    def changed_cells(self, parameters, context, feedback, lc_layer, lc_ds):
+        """Yield (x offset, y offset, rows, cols, old codes, new codes) of the changed cells
+        per window, rows and cols being relative to the window"""
+        record_file = self.parameterAsFile(parameters, self.changeRecord, context)
+        if record_file:
+            record = load_change_record(record_file)
+            if tuple(record["shape"]) != (lc_ds.RasterYSize, lc_ds.RasterXSize):
+                raise QgsProcessingException(
+                    "The Land Cover Change Record was not made on the land cover grid of the run."
+                )
+            rows, cols = np.divmod(record["index"], lc_ds.RasterXSize)
+            for x_off, y_off, width, height in record["windows"]:
+                in_window = (
+                    (cols >= x_off)
+                    & (cols < x_off + width)
+                    & (rows >= y_off)
+                    & (rows < y_off + height)
+                )
+                if in_window.any():
+                    yield (
+                        int(x_off),
+                        int(y_off),
+                        rows[in_window] - y_off,
+                        cols[in_window] - x_off,
+                        record["old"][in_window],
+                        record["new"][in_window],
+                    )
+            return
+
+        areas = self.parameterAsSource(parameters, self.inputVector, context)
+        if areas is None:
+            raise QgsProcessingException(
+                "Either Areas to Modify or a Land Cover Change Record is required."
+            )
+        field = self.parameterAsString(parameters, self.field, context)
+        if not field and parameters.get(self.landCoverValue) is None:
+            raise QgsProcessingException(
+                "Either a Land Cover Value Field or a Land Cover Value is required with Areas to Modify."
+            )
+        editor = LandCoverEditor(lc_layer, context)
+        if field:
+            editor.add_source(areas, lc_layer.crs(), field=field, feedback=feedback)
+        else:
+            value = self.parameterAsInt(parameters, self.landCoverValue, context)
+            editor.add_source(areas, lc_layer.crs(), value=value, feedback=feedback)
+        for x_off, y_off, before, after in editor.changed_windows(feedback=feedback):
+            rows, cols = np.nonzero(before != after)
+            yield x_off, y_off, rows, cols, before[rows, cols], after[rows, cols]
+
+    def name(self):
+        return "estimate_load_change"
+
+    def displayName(self):
+        return self.tr("Estimate Load Change")
+
+    def group(self):
+        return self.tr("Analysis")
+
+    def groupId(self):
+        return "analysis"
+
+    def createInstance(self):
+        return EstimateLoadChange()
+
+    def shortHelpString(self):
+        return """<html><body>
+<h2>Algorithm Description</h2>
+
+<p>The `Estimate Load Change` algorithm gives a quick estimate of how much a proposed land cover change would change the total local runoff and pollutant loads of a `Run Pollution Analysis` run, before running a full scenario.</p>
+<p>Only the cells whose land cover changes are evaluated. Their curve number, runoff volume, and pollutant loads are calculated with the inputs and lookup table of the baseline run for both the original and the new land cover. Accumulated loads are not estimated; they require a full run of the scenario.</p>
+
+<h2>Input Parameters</h2>
+
+<h3>Baseline Run File</h3>
+<p>The configuration file (`.pol.json`) of the baseline pollution run. Its land cover, soil, and precipitation rasters must still exist at the recorded locations.</p>
+
+<h3>Areas to Modify</h3>
+<p>Polygon vector layer of the proposed land cover change. Not needed if a Land Cover Change Record is provided.</p>
+
+<h3>Land Cover Value Field</h3>
+<p>Field of the Areas to Modify with the new land cover value.</p>
+
+<h3>Land Cover Value</h3>
+<p>New land cover value of all Areas to Modify. Used if no Land Cover Value Field is selected.</p>
+
+<h3>Land Cover Change Record</h3>
+<p>Change record (`.lcc.npz`) written by a `Modify Land Cover` algorithm on the land cover raster of the baseline run. If provided, it is used instead of the Areas to Modify.</p>
+
+<h2>Outputs</h2>
+
+<h3>Load Change Summary</h3>
+<p>CSV file with the total local runoff (L) and pollutant loads (kg) of the changed cells before and after the change, and their net and percent change.</p>
+
+</body></html>"""
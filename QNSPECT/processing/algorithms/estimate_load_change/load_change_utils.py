@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = "NOAA"
+__date__ = "2026-10-18"
+__copyright__ = "(C) 2021 by NOAA"
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = "$Format:%H$"
+
+import csv
+import os
+
+import numpy as np
+from qgis.core import NULL, QgsVectorLayer, QgsProcessingException
+
+from QNSPECT.processing.algorithms.run_analysis.curve_number import CurveNumber
+from QNSPECT.processing.algorithms.run_analysis.qnspect_run_algorithm import (
+    QNSPECTRunAlgorithm,
+)
+
+SUMMARY_FIELDS = [
+    "Output",
+    "Unit",
+    "Baseline",
+    "Modified",
+    "Change",
+    "Percent Change",
+]
+
+
+def run_lookup_layer(inputs: dict) -> QgsVectorLayer:
+    """Land cover lookup table used by a pollution run, from the Inputs of its run file"""
+    if inputs.get("LookupTable"):
+        source = inputs["LookupTable"]
+        if source.startswith("file:"):
+            layer = QgsVectorLayer(source, "Land Cover Lookup Table", "delimitedtext")
+        else:
+            layer = QgsVectorLayer(source, "Land Cover Lookup Table", "ogr")
+    else:
+        land_cover_type = int(inputs.get("LandCoverType", 0))
+        if land_cover_type not in QNSPECTRunAlgorithm._land_cover_TABLES:
+            raise QgsProcessingException(
+                "The run file does not record a Land Cover Lookup Table.\n"
+            )
+        layer = QgsVectorLayer(
+            os.path.join(
+                QNSPECTRunAlgorithm._land_cover_PATH,
+                f"{QNSPECTRunAlgorithm._land_cover_TABLES[land_cover_type]}.csv",
+            ),
+            "Land Cover Lookup Table",
+            "delimitedtext",
+        )
+    if not layer.isValid():
+        raise QgsProcessingException(
+            f"Unable to load the Land Cover Lookup Table of the run: {layer.source()}"
+        )
+    return layer
+
+
+def table_lookup(codes: np.ndarray, table: dict, default: float = 0.0) -> np.ndarray:
+    """Map codes to the values of a {code: value} table, default for missing codes"""
+    if not table:
+        return np.full(codes.shape, default, dtype=np.float64)
+    keys = np.array(sorted(table), dtype=np.float64)
+    values = np.array([table[key] for key in sorted(table)], dtype=np.float64)
+    positions = np.clip(np.searchsorted(keys, codes), 0, len(keys) - 1)
+    return np.where(keys[positions] == codes, values[positions], default)
+
+
+def soil_reclass_array(table: list) -> np.ndarray:
+    """Lookup array of the native:reclassifybytable [min, max, value] table used by CurveNumber"""
+    reclass = np.arange(256, dtype=np.float64)
+    for i in range(0, len(table), 3):
+        reclass[table[i] : table[i + 1] + 1] = table[i + 2]
+    return reclass
+
+
+class LocalLoadModel:
+    """Local runoff (L) and pollutant loads (mg) of a pollution run for selected cells.
+
+    The same Curve Number lookup, dual soil handling, precipitation units and runoff formula as
+    CurveNumber and RunoffVolume are applied with numpy to the given cells only, so the local
+    effect of a land cover change can be estimated without running the analysis.
+    precip_units is the PrecipUnits of the run, 0 for inches and 1 for millimeters."""
+
+    def __init__(
+        self,
+        lookup_layer: QgsVectorLayer,
+        pollutant_fields: dict,
+        dual_soil_type: int,
+        raining_days: int,
+        cell_area_sq_feet: float,
+        precip_units: int = 0,
+    ):
+        self.dual_soil_type = dual_soil_type
+        self.precip_units = precip_units
+        self.raining_days = raining_days
+        self.cell_area_sq_feet = cell_area_sq_feet
+        self.curve_numbers = [{} for _ in range(4)]  # per HSG A to D
+        self.pollutant_coefficients = {pol: {} for pol in pollutant_fields}
+        for feature in lookup_layer.getFeatures():
+            lc_value = float(feature.attribute("lc_value"))
+            for i, hsg in enumerate(["a", "b", "c", "d"]):
+                cn = feature.attribute(f"cn_{hsg}")
+                self.curve_numbers[i][lc_value] = float(cn) if cn != NULL else 0.0
+            for pol, field in pollutant_fields.items():
+                value = feature.attribute(field)
+                if value != NULL:
+                    self.pollutant_coefficients[pol][lc_value] = float(value)
+        self.soil_reclass = [
+            soil_reclass_array(table)
+            for table in CurveNumber.dual_soil_reclass.values()
+        ]
+
+    def _curve_number(self, land_cover: np.ndarray, soil: np.ndarray) -> np.ndarray:
+        cn = np.zeros(land_cover.shape, dtype=np.float64)
+        for i, table in enumerate(self.curve_numbers):
+            hsg_cells = soil == i + 1
+            cn[hsg_cells] = table_lookup(land_cover[hsg_cells], table)
+        return cn
+
+    def curve_number(self, land_cover: np.ndarray, hsg: np.ndarray) -> np.ndarray:
+        hsg = np.clip(hsg, 0, 255).astype(np.int64)
+        if self.dual_soil_type in [0, 1]:
+            return self._curve_number(
+                land_cover, self.soil_reclass[self.dual_soil_type][hsg]
+            )
+        # average of the undrained and drained curve numbers
+        return (
+            self._curve_number(land_cover, self.soil_reclass[0][hsg])
+            + self._curve_number(land_cover, self.soil_reclass[1][hsg])
+        ) / 2
+
+    def runoff(self, cn: np.ndarray, precip: np.ndarray) -> np.ndarray:
+        """Runoff volume in Liters, as in RunoffVolume.calculate_Q"""
+        s = np.maximum(
+            np.divide(1000, cn, out=np.zeros_like(cn), where=(cn != 0)) - 10, 0
+        )
+        p_ia = precip - 0.2 * s * self.raining_days
+        denominator = precip + 0.8 * s * self.raining_days
+        q = np.divide(
+            p_ia**2, denominator, out=np.zeros_like(p_ia), where=(denominator != 0)
+        )
+        return q * (p_ia > 0) * self.cell_area_sq_feet * 2.35973722 * (cn != 0)
+
+    def local_loads(
+        self, land_cover: np.ndarray, hsg: np.ndarray, precip: np.ndarray
+    ) -> dict:
+        """Sum of the local runoff (L) and of each pollutant load (mg) over the cells"""
+        land_cover = land_cover.astype(np.float64)
+        if self.precip_units == 1:
+            # millimeters to inches, as in RunoffVolume.preprocess_precipitation
+            precip = precip / 25.4
+        runoff = self.runoff(self.curve_number(land_cover, hsg), precip)
+        loads = {"Runoff": float(runoff.sum())}
+        for pol, coefficients in self.pollutant_coefficients.items():
+            loads[pol] = float((runoff * table_lookup(land_cover, coefficients)).sum())
+        return loads
+
+
+def write_load_change_summary(
+    baseline: dict, modified: dict, time_unit: str, path: str
+) -> str:
+    """Write one row per output with the local totals of the changed cells before and after"""
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for name in baseline:
+            # pollutant loads are reported in kg like the accumulated rasters
+            scale = 1 if name == "Runoff" else 1e-6
+            before = baseline[name] * scale
+            after = modified[name] * scale
+            writer.writerow(
+                {
+                    "Output": f"{name} Local",
+                    "Unit": ("L" if name == "Runoff" else "kg") + time_unit,
+                    "Baseline": before,
+                    "Modified": after,
+                    "Change": after - before,
+                    "Percent Change": (after - before) / before * 100 if before else "",
+                }
+            )
+    return path
@@ -0,0 +1,373 @@
+"""
+Store the multiple flow direction (MFD) accumulation engine used by the QNSPECT run algorithms.
+The flow graph of the raster is built as a sparse weighted edge list (compressed by source cell) and the
+weights are propagated downstream level by level with numpy, each level being the cells whose upstream
+cells are all done. Depressions are routed along the single flow directions of r.watershed.
+"""
+
+import os
+
+import numpy as np
+
+from qgis.core import QgsProcessing, QgsProcessingException
+
+import processing
+
+from QNSPECT.processing.algorithms.block_utils import (
+    NODATA,
+    create_raster_like,
+    open_raster,
+    resolve_output,
+    valid_data,
+)
+from QNSPECT.processing.algorithms.qnspect_utils import grass_material_transport
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# (row, column) offsets of the 8 neighbours of a cell
+_NEIGHBOURS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+# (row, column) offsets of the r.watershed drainage codes, counter clockwise from east by 45 degrees
+_DRAINAGE_ROWS = np.array([0, -1, -1, -1, 0, 1, 1, 1, 0])
+_DRAINAGE_COLS = np.array([0, 1, 0, -1, -1, -1, 0, 1, 1])
+# levels between progress reports
+_PROGRESS_LEVELS = 64
+# peak memory of mfd_material_transport: about 200 bytes per cell for the flow graph and the
+# accumulation in mfd_accumulation, and about 40 bytes per cell for the input arrays
+MFD_BYTES_PER_CELL = 250
+# memory limit of the engine when the available memory is unknown
+DEFAULT_MFD_MEMORY_LIMIT = 8 * 1024**3
+
+
+def mfd_memory_limit() -> int:
+    """Bytes the engine may use: the available physical memory, DEFAULT_MFD_MEMORY_LIMIT if unknown"""
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):  # not available on Windows
+        return DEFAULT_MFD_MEMORY_LIMIT
+
+
+def _neighbour(array: np.ndarray, d_row: int, d_col: int, fill) -> np.ndarray:
+    """Value of the neighbour at (row + d_row, col + d_col) of each cell, fill outside of the array"""
+    rows, cols = array.shape
+    out = np.full_like(array, fill)
+    out[
+        max(-d_row, 0) : rows - max(d_row, 0), max(-d_col, 0) : cols - max(d_col, 0)
+    ] = array[
+        max(d_row, 0) : rows + min(d_row, 0), max(d_col, 0) : cols + min(d_col, 0)
+    ]
+    return out
+
+
+def _edge_ids(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Positions of the edges of the given cells in a compressed edge list"""
+    total = int(counts.sum())
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(total)
+
+
+def flow_graph(
+    elevation: np.ndarray,
+    drainage: np.ndarray,
+    cell_x: float,
+    cell_y: float,
+    convergence: float = 5,
+    sfd_cells: np.ndarray = None,
+):
+    """Weighted flow graph of an elevation array (NaN for no data) as a compressed edge list.
+
+    A cell sends its flow to its lower neighbours in proportion to (drop / distance) ** convergence,
+    as the MFD routing of r.watershed. A cell without lower neighbours, or that r.watershed routes to a
+    neighbour that is not lower (ex: out of a depression), sends its flow along its drainage direction,
+    a r.watershed drainage code. So do the cells of sfd_cells, a flat boolean array.
+    Flow leaving the raster or entering no data cells is lost.
+    Returns (indptr, targets, fractions): the edges of cell i are targets[indptr[i]:indptr[i + 1]].
+    """
+    rows, cols = elevation.shape
+    size = rows * cols
+    index_type = np.int32 if size < 2**31 else np.int64
+    valid = ~np.isnan(elevation)
+    diagonal = np.hypot(cell_x, cell_y)
+
+    def weights(d_row, d_col):
+        distance = diagonal if d_row and d_col else (cell_y if d_row else cell_x)
+        drop = (elevation - _neighbour(elevation, d_row, d_col, np.nan)) / distance
+        return np.where(drop > 0, drop, 0) ** convergence
+
+    total_weight = np.zeros(elevation.shape)
+    lower_count = np.zeros(elevation.shape, dtype=np.int8)
+    for d_row, d_col in _NEIGHBOURS:
+        weight = weights(d_row, d_col)
+        total_weight += weight
+        lower_count += weight > 0
+
+    # single flow direction of r.watershed, negative codes leave the raster
+    code = np.where(valid & (drainage > 0) & (drainage <= 8), drainage, 0).astype(int)
+    row_index, col_index = np.indices(elevation.shape)
+    target_row = row_index + _DRAINAGE_ROWS[code]
+    target_col = col_index + _DRAINAGE_COLS[code]
+    has_target = (
+        (code > 0)
+        & (target_row >= 0)
+        & (target_row < rows)
+        & (target_col >= 0)
+        & (target_col < cols)
+    )
+    target = np.where(has_target, target_row * cols + target_col, 0)
+    has_target &= valid.ravel()[target].reshape(elevation.shape)
+    target_lower = has_target & (
+        elevation.ravel()[target].reshape(elevation.shape) < elevation
+    )
+
+    mfd = valid & (lower_count > 0) & ~(has_target & ~target_lower)
+    if sfd_cells is not None:
+        mfd &= ~sfd_cells.reshape(elevation.shape)
+    sfd = valid & ~mfd & has_target
+
+    counts = np.where(mfd, lower_count, sfd).ravel()
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    targets = np.empty(indptr[-1], dtype=index_type)
+    fractions = np.empty(indptr[-1], dtype=np.float32)
+
+    filled = np.zeros(size, dtype=np.int64)
+    total_weight = total_weight.ravel()
+    for d_row, d_col in _NEIGHBOURS:
+        weight = weights(d_row, d_col).ravel()
+        sources = np.flatnonzero(mfd.ravel() & (weight > 0))
+        positions = indptr[sources] + filled[sources]
+        targets[positions] = sources + d_row * cols + d_col
+        fractions[positions] = weight[sources] / total_weight[sources]
+        filled[sources] += 1
+    sources = np.flatnonzero(sfd)
+    targets[indptr[sources]] = target.ravel()[sources]
+    fractions[indptr[sources]] = 1
+    return indptr, targets, fractions
+
+
+def propagate(
+    weight: np.ndarray,
+    indptr: np.ndarray,
+    targets: np.ndarray,
+    fractions: np.ndarray,
+    cells: np.ndarray,
+    feedback=None,
+):
+    """Accumulate the flat weight array downstream through a flow graph, level by level.
+    Each level is the set of cells whose upstream cells are all done, starting from the cells
+    without upstream cells. Returns the accumulation, including the weight of each cell, and the
+    flat boolean array of done cells: the cells that are not done are in or below a loop.
+    """
+    accumulation = weight.astype(np.float64)
+    size = accumulation.size
+    pending = np.bincount(targets, minlength=size)
+    done = np.zeros(size, dtype=bool)
+    frontier = np.flatnonzero(cells & (pending == 0))
+    total = max(int(cells.sum()), 1)
+    processed = 0
+    level = 0
+    while frontier.size:
+        if feedback is not None and level % _PROGRESS_LEVELS == 0:
+            if feedback.isCanceled():
+                raise QgsProcessingException("Processing canceled.")
+            feedback.setProgress(100 * processed / total)
+        done[frontier] = True
+        processed += frontier.size
+        level += 1
+
+        starts = indptr[frontier]
+        counts = indptr[frontier + 1] - starts
+        if not counts.any():
+            break
+        edges = _edge_ids(starts, counts)
+        flow = np.repeat(accumulation[frontier], counts) * fractions[edges]
+        downstream, inverse = np.unique(targets[edges], return_inverse=True)
+        accumulation[downstream] += np.bincount(inverse, weights=flow)
+        pending[downstream] -= np.bincount(inverse)
+        frontier = downstream[pending[downstream] == 0]
+    return accumulation, done
+
+
+def loop_cells(
+    indptr: np.ndarray, targets: np.ndarray, stuck: np.ndarray
+) -> np.ndarray:
+    """Cells left over by propagate that are on a loop or between loops, as a flat boolean array.
+    The cells only downstream of a loop are peeled off from the outlets up, level by level.
+    """
+    sources = np.flatnonzero(stuck)
+    counts = indptr[sources + 1] - indptr[sources]
+    edges = _edge_ids(indptr[sources], counts)
+    sources = np.repeat(sources, counts)
+    downstream = targets[edges]
+    inner = stuck[downstream]
+    sources, downstream = sources[inner], downstream[inner]
+
+    # reversed edge list, compressed by downstream cell
+    sources = sources[np.argsort(downstream, kind="stable")]
+    reverse_indptr = np.zeros(stuck.size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(downstream, minlength=stuck.size), out=reverse_indptr[1:])
+    remaining = np.bincount(sources, minlength=stuck.size)
+    loops = stuck.copy()
+    frontier = np.flatnonzero(stuck & (remaining == 0))
+    while frontier.size:
+        loops[frontier] = False
+        starts = reverse_indptr[frontier]
+        counts = reverse_indptr[frontier + 1] - starts
+        upstream, upstream_counts = np.unique(
+            sources[_edge_ids(starts, counts)], return_counts=True
+        )
+        remaining[upstream] -= upstream_counts
+        frontier = upstream[remaining[upstream] == 0]
+    return loops
+
+
+def mfd_accumulation(
+    elevation: np.ndarray,
+    weight: np.ndarray,
+    drainage: np.ndarray,
+    cell_x: float,
+    cell_y: float,
+    convergence: float = 5,
+    feedback=None,
+) -> np.ndarray:
+    """MFD accumulation of a weight array over an elevation array (NaN for no data).
+    drainage is the single flow direction of r.watershed, used to route the flow out of depressions.
+    Where MFD flow would go back into the depression it leaves, the cells of the loop are routed
+    along their drainage direction only, which is free of loops. Cells still in a loop after that
+    (ex: drainage directions that loop) only hold the flow that reached them, with a warning.
+    """
+    valid = ~np.isnan(elevation).ravel()
+    weight = np.where(np.isnan(weight), 0, weight).ravel()
+    graph = flow_graph(elevation, drainage, cell_x, cell_y, convergence)
+    accumulation, done = propagate(weight, *graph, valid, feedback)
+    stuck = valid & ~done
+    if stuck.any():
+        sfd_cells = loop_cells(graph[0], graph[1], stuck)
+        # release the first pass before building the second graph
+        graph = accumulation = None
+        graph = flow_graph(
+            elevation, drainage, cell_x, cell_y, convergence, sfd_cells=sfd_cells
+        )
+        accumulation, done = propagate(weight, *graph, valid, feedback)
+        stuck = valid & ~done
+        if stuck.any() and feedback is not None:
+            feedback.pushWarning(
+                f"MFD accumulation is incomplete in {int(stuck.sum())} cells that are in or "
+                "below a flow loop."
+            )
+    return accumulation.reshape(elevation.shape)
+
+
+def mfd_material_transport(
+    elevation,
+    weight,
+    context,
+    feedback,
+    output=QgsProcessing.TEMPORARY_OUTPUT,
+    convergence=5,
+    mask=None,
+) -> dict:
+    """MFD accumulation of a weight raster with the numpy engine, a faster alternative to
+    r.watershed MFD routing. r.watershed runs in SFD mode only for the drainage directions.
+    As grass_material_transport, the output is 0 where there is weight but no accumulation,
+    nodata where the weight is nodata, and nodata where the elevation is nodata if a mask is given.
+    The rasters are read whole, so the engine needs about MFD_BYTES_PER_CELL bytes per cell.
+    Rasters that need more than mfd_memory_limit() are accumulated with the MFD routing of
+    r.watershed instead, which streams them.
+    """
+    elev_ds = open_raster(elevation, context)
+    cells = elev_ds.RasterXSize * elev_ds.RasterYSize
+    elev_ds = None
+    needed = cells * MFD_BYTES_PER_CELL
+    limit = mfd_memory_limit()
+    if needed > limit:
+        feedback.pushWarning(
+            f"The MFD accumulation of {cells} cells needs about {needed / 1024**3:.1f} GB of memory, "
+            f"more than the {limit / 1024**3:.1f} GB available. GRASS r.watershed MFD routing is "
+            "used instead."
+        )
+        return grass_material_transport(
+            elevation=elevation,
+            weight=weight,
+            context=context,
+            feedback=feedback,
+            mfd=True,
+            output=output,
+            mask=mask,
+        )
+
+    alg_params = {
+        "-4": False,
+        "-a": True,
+        "-b": False,
+        "-m": False,
+        "-s": True,  # single flow direction
+        "GRASS_RASTER_FORMAT_META": "",
+        "GRASS_RASTER_FORMAT_OPT": "",
+        "GRASS_REGION_CELLSIZE_PARAMETER": 0,
+        "GRASS_REGION_PARAMETER": None,
+        "blocking": None,
+        "convergence": convergence,
+        "depression": None,
+        "disturbed_land": None,
+        "elevation": elevation,
+        "flow": None,
+        "max_slope_length": None,
+        "memory": 300,
+        "threshold": None,
+        "drainage": QgsProcessing.TEMPORARY_OUTPUT,
+    }
+    feedback.pushInfo("\nGRASS Input parameters:")
+    feedback.pushCommandInfo(str(alg_params))
+    grass_drainage = processing.run(
+        "grass7:r.watershed",
+        alg_params,
+        context=context,
+        feedback=None,
+        is_child_algorithm=True,
+    )["drainage"]
+    if feedback.isCanceled():
+        raise QgsProcessingException("Processing canceled.")
+
+    arrays = {}
+    for name, raster in [
+        ("elevation", elevation),
+        ("weight", weight),
+        ("drainage", grass_drainage),
+    ]:
+        ds = open_raster(raster, context)
+        band = ds.GetRasterBand(1)
+        array = band.ReadAsArray()
+        arrays[name] = (array, valid_data(array, band.GetNoDataValue()))
+        if name == "elevation":
+            ref_ds = ds
+            geo_transform = ds.GetGeoTransform()
+        band = None
+        ds = None
+
+    elev, elev_valid = arrays["elevation"]
+    flow, flow_valid = arrays["weight"]
+    drainage, drainage_valid = arrays["drainage"]
+    accumulation = mfd_accumulation(
+        np.where(elev_valid, elev, np.nan).astype(np.float64),
+        np.where(flow_valid, flow, 0).astype(np.float64),
+        np.where(drainage_valid, drainage, 0),
+        abs(geo_transform[1]),
+        abs(geo_transform[5]),
+        convergence,
+        feedback,
+    )
+    outside = NODATA if mask is not None else 0
+    accumulation = np.where(elev_valid, accumulation, outside)
+
+    out_path = resolve_output(output, "accumulation")
+    out_ds = create_raster_like(ref_ds, out_path)
+    out_ds.GetRasterBand(1).WriteArray(np.where(flow_valid, accumulation, NODATA))
+    out_ds.FlushCache()
+    out_ds = None
+    ref_ds = None
+    return {"OUTPUT": out_path}
@@ -0,0 +1,105 @@
+"""
+Store functions that check the grids of input rasters before any heavy processing.
+Only raster headers are read, and they are cached per file so repeated checks are free.
+"""
+
+import os
+from collections import namedtuple
+
+from osgeo import gdal, osr
+from qgis.core import QgsProcessingException
+
+from QNSPECT.processing.algorithms.block_utils import raster_source
+
+RasterHeader = namedtuple(
+    "RasterHeader", ["source", "crs_wkt", "transform", "x_size", "y_size", "nodata"]
+)
+
+_HEADER_CACHE = {}
+_TOLERANCE = 1e-6  # in cells
+
+
+def read_header(raster, context=None) -> RasterHeader:
+    """Read the grid metadata of a raster without reading any cell.
+    Headers are cached by source and file modification time."""
+    source = raster_source(raster, context)
+    try:
+        stat = os.stat(source)
+        key = (source, stat.st_mtime_ns, stat.st_size)
+    except OSError:  # not a plain file, ex: a GDAL connection string
+        key = (source, None, None)
+
+    if key not in _HEADER_CACHE:
+        ds = gdal.Open(source)
+        if ds is None:
+            raise QgsProcessingException(f"Unable to open raster {source}")
+        _HEADER_CACHE[key] = RasterHeader(
+            source=source,
+            crs_wkt=ds.GetProjection(),
+            transform=ds.GetGeoTransform(),
+            x_size=ds.RasterXSize,
+            y_size=ds.RasterYSize,
+            nodata=ds.GetRasterBand(1).GetNoDataValue(),
+        )
+        ds = None
+    return _HEADER_CACHE[key]
+
+
+def grid_mismatches(header: RasterHeader, ref: RasterHeader) -> list:
+    """Describe how the grid of a raster differs from the reference grid"""
+    problems = []
+    srs = osr.SpatialReference(wkt=header.crs_wkt)
+    ref_srs = osr.SpatialReference(wkt=ref.crs_wkt)
+    if not header.crs_wkt or not srs.IsSame(ref_srs):
+        problems.append("has a different CRS")
+
+    res = header.transform[1], header.transform[5]
+    ref_res = ref.transform[1], ref.transform[5]
+    if any(abs(r - rr) > _TOLERANCE * abs(rr) for r, rr in zip(res, ref_res)):
+        problems.append(
+            f"has a cell size of {abs(res[0])} x {abs(res[1])} instead of {abs(ref_res[0])} x {abs(ref_res[1])}"
+        )
+    elif any(
+        abs(header.transform[i] - ref.transform[i]) > _TOLERANCE * abs(ref_res[0])
+        for i in (0, 3)
+    ):
+        problems.append("has a different origin")
+
+    if (header.x_size, header.y_size) != (ref.x_size, ref.y_size):
+        problems.append(
+            f"has {header.x_size} x {header.y_size} cells instead of {ref.x_size} x {ref.y_size}"
+        )
+    return problems
+
+
+def validate_input_grids(rasters: dict, context, feedback) -> None:
+    """Check that all input rasters share the CRS, cell size, origin and size of the first raster.
+    rasters maps display names to rasters, ex: {"Elevation Raster": layer}.
+    All mismatches are reported together before any heavy stage runs."""
+    headers = {
+        name: read_header(raster, context)
+        for name, raster in rasters.items()
+        if raster is not None
+    }
+    ref_name, ref = next(iter(headers.items()))
+
+    problems = []
+    for name, header in headers.items():
+        if header.nodata is None:
+            feedback.pushWarning(f"{name} does not have a no data value.")
+        if name == ref_name:
+            continue
+        problems += [
+            (
+                f"{name} {problem} than {ref_name}."
+                if problem.startswith("has a different")
+                else f"{name} {problem}."
+            )
+            for problem in grid_mismatches(header, ref)
+        ]
+
+    if problems:
+        raise QgsProcessingException(
+            "The input rasters are not aligned. Use the Align Rasters tool to align them to the same grid.\n"
+            + "\n".join(problems)
+        )
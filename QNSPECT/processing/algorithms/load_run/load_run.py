@@ -29,6 +29,8 @@ from qgis.core import (
 )
 
 from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 
 class LoadPreviousRun(QNSPECTAlgorithm):
@@ -48,6 +50,8 @@ class LoadPreviousRun(QNSPECTAlgorithm):
             )
         )
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = "NOAA"
+__date__ = "2026-10-18"
+__copyright__ = "(C) 2021 by NOAA"
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = "$Format:%H$"
+
+import math
+from pathlib import Path
+
+import numpy as np
+from osgeo import gdal, gdal_array, ogr, osr
+from qgis.core import (
+    NULL,
+    QgsFeatureRequest,
+    QgsProcessingException,
+    QgsProcessingUtils,
+    QgsRasterFileWriter,
+    QgsRectangle,
+    QgsSpatialIndex,
+)
+
+from QNSPECT.processing.algorithms.block_utils import BLOCK_SIZE, open_raster
+
+CHANGE_RECORD_SUFFIX = ".lcc.npz"
+
+
+def land_cover_lookup(table) -> dict:
+    """Map the compacted lower case lc_name of a lookup table to its lc_value"""
+    field_names = table.fields().names()
+    for required in ("lc_name", "lc_value"):
+        if required not in field_names:
+            raise QgsProcessingException(
+                f'Field "{required}" required for the coefficients table.'
+            )
+    return {
+        compact_name(feature.attribute("lc_name")): int(feature.attribute("lc_value"))
+        for feature in table.getFeatures()
+        if feature.attribute("lc_name") and feature.attribute("lc_value") != NULL
+    }
+
+
+def compact_name(name: str) -> str:
+    return str(name).lower().replace(" ", "")
+
+
+class ChangeRecorder:
+    """Collects the cells changed by a LandCoverEditor as a sparse change record.
+
+    Passed as on_change to LandCoverEditor.apply. The record stores the flat cell index
+    (row * x_size + col) with the old and new land cover codes of each changed cell, and
+    the (x offset, y offset, width, height) windows that contain changes."""
+
+    def __init__(self, editor: "LandCoverEditor"):
+        self.editor = editor
+        self.indices = []
+        self.old_values = []
+        self.new_values = []
+        self.windows = []
+
+    def __call__(self, x_off: int, y_off: int, before, after):
+        rows, cols = np.nonzero(before != after)
+        self.indices.append(
+            (rows + y_off).astype(np.int64) * self.editor.x_size + cols + x_off
+        )
+        self.old_values.append(before[rows, cols])
+        self.new_values.append(after[rows, cols])
+        self.windows.append((x_off, y_off, *before.shape[::-1]))
+
+    def save(self, path: str) -> str:
+        """Write the record as a compressed numpy archive"""
+        if not path.endswith(CHANGE_RECORD_SUFFIX):
+            path = str(Path(path).with_suffix("")) + CHANGE_RECORD_SUFFIX
+        dtype = gdal_array.GDALTypeCodeToNumericTypeCode(
+            self.editor.base_ds.GetRasterBand(1).DataType
+        )
+        with open(path, "wb") as file:
+            np.savez_compressed(
+                file,
+                index=np.concatenate(self.indices or [np.zeros(0, np.int64)]),
+                old=np.concatenate(self.old_values or [np.zeros(0, dtype)]),
+                new=np.concatenate(self.new_values or [np.zeros(0, dtype)]),
+                windows=np.array(self.windows, dtype=np.int64).reshape(-1, 4),
+                shape=np.array(
+                    [self.editor.y_size, self.editor.x_size], dtype=np.int64
+                ),
+                geotransform=np.array(self.editor.transform, dtype=np.float64),
+                projection=np.array(self.editor.base_ds.GetProjection()),
+            )
+        return path
+
+
+def load_change_record(path: str) -> dict:
+    """Read a change record written by ChangeRecorder.save into a dict of arrays"""
+    with np.load(path) as record:
+        return {key: record[key] for key in record.files}
+
+
+class LandCoverEditor:
+    """Burns land cover values of polygons into a copy of a land cover raster.
+
+    The polygons are kept in a spatial index and only the BLOCK_SIZE windows they touch
+    are read, rasterized in memory, and written back to the copy. Polygons added with a
+    higher priority are burnt last, so they win where edits overlap."""
+
+    def __init__(self, base_raster, context=None):
+        self.context = context
+        self.base_ds = open_raster(base_raster, context)
+        self.transform = self.base_ds.GetGeoTransform()
+        if self.transform[2] != 0 or self.transform[4] != 0:
+            raise QgsProcessingException(
+                "Rotated land cover rasters are not supported."
+            )
+        self.x_size = self.base_ds.RasterXSize
+        self.y_size = self.base_ds.RasterYSize
+        self.srs = osr.SpatialReference()
+        self.srs.ImportFromWkt(self.base_ds.GetProjection())
+        self.edits = []  # (ogr geometry, land cover value, priority)
+        self.index = QgsSpatialIndex()
+
+    def add_source(
+        self,
+        source,
+        crs,
+        value=None,
+        field: str = None,
+        priority: int = 0,
+        expression: str = None,
+        feedback=None,
+    ) -> int:
+        """Add the polygons of a feature source with a fixed value or the value of a field.
+        crs is the CRS of the land cover raster. Features without a value, or not matching
+        the filter expression if given, are skipped. Returns the number of polygons added.
+        """
+        request = QgsFeatureRequest()
+        if expression:
+            request.setFilterExpression(expression)
+        if self.context is not None:
+            request.setDestinationCrs(crs, self.context.transformContext())
+        added = 0
+        for feature in source.getFeatures(request):
+            if feedback is not None and feedback.isCanceled():
+                break
+            burn_value = feature.attribute(field) if field else value
+            if burn_value is None or burn_value == NULL:
+                continue
+            geometry = feature.geometry()
+            if geometry.isEmpty():
+                continue
+            edit_id = len(self.edits)
+            self.edits.append(
+                (
+                    ogr.CreateGeometryFromWkb(bytes(geometry.asWkb())),
+                    float(burn_value),
+                    priority,
+                )
+            )
+            self.index.addFeature(edit_id, geometry.boundingBox())
+            added += 1
+        return added
+
+    def window_extent(self, x_off: int, y_off: int, width: int, height: int):
+        x_min = self.transform[0] + x_off * self.transform[1]
+        y_max = self.transform[3] + y_off * self.transform[5]
+        return QgsRectangle(
+            x_min,
+            y_max + height * self.transform[5],
+            x_min + width * self.transform[1],
+            y_max,
+        )
+
+    def touched_windows(self) -> list:
+        """Sorted (x offset, y offset, width, height) windows that the edit bounding boxes overlap"""
+        x_blocks = math.ceil(self.x_size / BLOCK_SIZE)
+        y_blocks = math.ceil(self.y_size / BLOCK_SIZE)
+        blocks = set()
+        for geometry, _, _ in self.edits:
+            x_min, x_max, y_min, y_max = geometry.GetEnvelope()
+            col_min = math.floor((x_min - self.transform[0]) / self.transform[1])
+            col_max = math.floor((x_max - self.transform[0]) / self.transform[1])
+            row_min = math.floor((y_max - self.transform[3]) / self.transform[5])
+            row_max = math.floor((y_min - self.transform[3]) / self.transform[5])
+            block_cols = range(
+                max(col_min // BLOCK_SIZE, 0), min(col_max // BLOCK_SIZE + 1, x_blocks)
+            )
+            block_rows = range(
+                max(row_min // BLOCK_SIZE, 0), min(row_max // BLOCK_SIZE + 1, y_blocks)
+            )
+            blocks.update((row, col) for row in block_rows for col in block_cols)
+        return [
+            (
+                col * BLOCK_SIZE,
+                row * BLOCK_SIZE,
+                min(BLOCK_SIZE, self.x_size - col * BLOCK_SIZE),
+                min(BLOCK_SIZE, self.y_size - row * BLOCK_SIZE),
+            )
+            for row, col in sorted(blocks)
+        ]
+
+    def burn_window(self, band, x_off: int, y_off: int, width: int, height: int):
+        """Rasterize the edits overlapping a window over its current values.
+        Returns the arrays before and after the edits."""
+        before = band.ReadAsArray(x_off, y_off, width, height)
+        edit_ids = sorted(
+            self.index.intersects(self.window_extent(x_off, y_off, width, height)),
+            key=lambda edit_id: (self.edits[edit_id][2], edit_id),
+        )
+        if not edit_ids:
+            return before, before
+
+        mem_ds = gdal.GetDriverByName("MEM").Create("", width, height, 1, band.DataType)
+        mem_ds.SetGeoTransform(
+            (
+                self.transform[0] + x_off * self.transform[1],
+                self.transform[1],
+                0,
+                self.transform[3] + y_off * self.transform[5],
+                0,
+                self.transform[5],
+            )
+        )
+        mem_ds.SetProjection(self.base_ds.GetProjection())
+        mem_ds.GetRasterBand(1).WriteArray(before)
+
+        vector_ds = ogr.GetDriverByName("Memory").CreateDataSource("")
+        layer = vector_ds.CreateLayer("edits", self.srs, ogr.wkbUnknown)
+        layer.CreateField(ogr.FieldDefn("value", ogr.OFTReal))
+        for edit_id in edit_ids:
+            geometry, burn_value, _ = self.edits[edit_id]
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetGeometry(geometry)
+            feature.SetField("value", burn_value)
+            layer.CreateFeature(feature)
+        gdal.RasterizeLayer(mem_ds, [1], layer, options=["ATTRIBUTE=value"])
+        after = mem_ds.GetRasterBand(1).ReadAsArray()
+        return before, after
+
+    def changed_windows(self, band=None, feedback=None):
+        """Yield (x offset, y offset, before, after) for each touched window with changed cells.
+        The windows are read from band, the base raster if not given, and nothing is written.
+        Stops early when canceled, so callers must check the feedback before using the result.
+        """
+        if band is None:
+            band = self.base_ds.GetRasterBand(1)
+        windows = self.touched_windows()
+        for i, (x_off, y_off, width, height) in enumerate(windows):
+            if feedback is not None:
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(100 * i / len(windows))
+            before, after = self.burn_window(band, x_off, y_off, width, height)
+            if after is before or (after == before).all():
+                continue
+            yield x_off, y_off, before, after
+
+    def apply(self, output: str, feedback=None, on_change=None) -> str:
+        """Copy the base raster to output and burn the edits into the windows they touch.
+        The format of output follows its extension, GeoTIFF if it is not known.
+        on_change(x_off, y_off, before, after) is called for every window with changed cells.
+        Returns the output path, or None if canceled, in which case the partial output is deleted.
+        """
+        driver_name = QgsRasterFileWriter.driverForExtension(Path(output).suffix)
+        driver = gdal.GetDriverByName(driver_name or "GTiff")
+        if driver.GetMetadataItem(gdal.DCAP_CREATE) == "YES":
+            target = output
+        else:
+            # formats that can only be written by a copy, ex: PNG, are edited as a GeoTIFF first
+            driver = gdal.GetDriverByName("GTiff")
+            target = QgsProcessingUtils.generateTempFilename("land_cover.tif")
+        options = (
+            ["TILED=YES", "BIGTIFF=IF_SAFER"] if driver.ShortName == "GTiff" else []
+        )
+        out_ds = driver.CreateCopy(target, self.base_ds, options=options)
+        if out_ds is None:
+            raise QgsProcessingException(
+                f"Unable to copy land cover raster: {gdal.GetLastErrorMsg()}"
+            )
+        band = out_ds.GetRasterBand(1)
+
+        for x_off, y_off, before, after in self.changed_windows(band, feedback):
+            band.WriteArray(after, x_off, y_off)
+            if on_change is not None:
+                on_change(x_off, y_off, before, after)
+
+        band.FlushCache()
+        band = None
+        if feedback is not None and feedback.isCanceled():
+            out_ds = None
+            driver.Delete(target)
+            return None
+        if target != output:
+            copy_ds = gdal.GetDriverByName(driver_name).CreateCopy(output, out_ds)
+            if copy_ds is None:
+                raise QgsProcessingException(
+                    f"Unable to write land cover raster: {gdal.GetLastErrorMsg()}"
+                )
+            copy_ds = None
+        out_ds = None
+        return output
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = "NOAA"
+__date__ = "2026-10-18"
+__copyright__ = "(C) 2021 by NOAA"
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = "$Format:%H$"
+
+import re
+from pathlib import Path
+
+from qgis.core import (
+    QgsExpression,
+    QgsFeatureRequest,
+    QgsProcessing,
+    QgsProcessingContext,
+    QgsProcessingMultiStepFeedback,
+    QgsProcessingParameterVectorLayer,
+    QgsProcessingParameterRasterLayer,
+    QgsProcessingParameterMatrix,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterFolderDestination,
+    QgsProcessingUtils,
+    QgsProcessingException,
+    QgsVectorLayer,
+)
+
+from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithms.modify_land_cover.land_cover_utils import (
+    LandCoverEditor,
+    ChangeRecorder,
+    CHANGE_RECORD_SUFFIX,
+    land_cover_lookup,
+    compact_name,
+)
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
+
+EDIT_COLUMNS = [
+    "Scenario",
+    "Areas Layer",
+    "Filter Expression",
+    "Land Cover",
+    "Priority",
+]
+
+# characters that are not allowed in file names on Windows, including the path separators
+INVALID_NAME_CHARACTERS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+RESERVED_NAMES = {"CON", "PRN", "AUX", "NUL"} | {
+    f"{device}{i}" for device in ("COM", "LPT") for i in range(1, 10)
+}
+
+
+class ModifyLandCoverBatch(QNSPECTAlgorithm):
+    inputRaster = "InputRaster"
+    inputTable = "InputTable"
+    edits = "Edits"
+    loadOutputs = "LoadOutputs"
+    changeRecords = "ChangeRecords"
+    outputDir = "OutputDirectory"
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterRasterLayer(
+                self.inputRaster, "Land Cover Raster", defaultValue=None
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.inputTable,
+                "Land Cover Lookup Table",
+                optional=True,
+                types=[QgsProcessing.TypeVector],
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterMatrix(
+                self.edits,
+                "Land Cover Edits",
+                optional=False,
+                headers=EDIT_COLUMNS,
+                defaultValue=["Scenario 1", "", "", "", "0"],
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.loadOutputs,
+                "Open output files after running algorithm",
+                defaultValue=True,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.changeRecords,
+                "Write Land Cover Change Records",
+                defaultValue=False,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.outputDir,
+                "Output Folder",
+                createByDefault=True,
+                defaultValue=None,
+            )
+        )
+
+    @streamed
+    @profiled
+    def processAlgorithm(self, parameters, context, model_feedback):
+        results = {}
+
+        edits = self.parameterAsMatrix(parameters, self.edits, context)
+        if not edits or len(edits) % len(EDIT_COLUMNS):
+            raise QgsProcessingException(
+                f"Each row of the Land Cover Edits table needs {len(EDIT_COLUMNS)} columns: {', '.join(EDIT_COLUMNS)}."
+            )
+        table = self.parameterAsVectorLayer(parameters, self.inputTable, context)
+        lookup = land_cover_lookup(table) if table else {}
+
+        # Group the edits by scenario, checking all of them before anything is written
+        scenarios = {}
+        layers = {}
+        for i in range(0, len(edits), len(EDIT_COLUMNS)):
+            scenario, layer_name, expression, land_cover, priority = [
+                str(value).strip() if value is not None else ""
+                for value in edits[i : i + len(EDIT_COLUMNS)]
+            ]
+            row = i // len(EDIT_COLUMNS) + 1
+            self.check_scenario_name(scenario, row)
+            if layer_name not in layers:
+                layer = QgsProcessingUtils.mapLayerFromString(layer_name, context)
+                if not isinstance(layer, QgsVectorLayer) or not layer.isValid():
+                    raise QgsProcessingException(
+                        f'Row {row}: unable to load the areas layer "{layer_name}".'
+                    )
+                layers[layer_name] = layer
+            if expression:
+                self.check_expression(expression, layers[layer_name], row)
+            scenarios.setdefault(scenario, []).append(
+                (
+                    row,
+                    layers[layer_name],
+                    expression,
+                    self.land_cover_value(land_cover, lookup, row),
+                    self.priority_value(priority, row),
+                )
+            )
+
+        land_cover_layer = self.parameterAsRasterLayer(
+            parameters, self.inputRaster, context
+        )
+        output_dir = Path(self.parameterAsString(parameters, self.outputDir, context))
+        output_dir.mkdir(parents=True, exist_ok=True)
+        load_outputs = self.parameterAsBool(parameters, self.loadOutputs, context)
+        write_records = self.parameterAsBool(parameters, self.changeRecords, context)
+
+        feedback = QgsProcessingMultiStepFeedback(2 * len(scenarios), model_feedback)
+        step = 0
+        for scenario, scenario_edits in scenarios.items():
+            # One copy of the base raster per scenario with all of its edits burnt in one pass
+            feedback.setCurrentStep(step)
+            feedback.pushInfo(f"Modifying land cover for {scenario}...")
+            editor = LandCoverEditor(land_cover_layer, context)
+            for row, layer, expression, value, priority in scenario_edits:
+                added = editor.add_source(
+                    layer,
+                    land_cover_layer.crs(),
+                    value=value,
+                    priority=priority,
+                    expression=expression,
+                    feedback=feedback,
+                )
+                if not added and not feedback.isCanceled():
+                    feedback.pushWarning(
+                        f"Row {row}: no polygons of {layer.name()} match the edit, it changes nothing."
+                    )
+            feedback.setCurrentStep(step + 1)
+            if feedback.isCanceled():
+                return {}
+
+            recorder = ChangeRecorder(editor) if write_records else None
+            output = editor.apply(
+                str(output_dir / f"{scenario}.tif"), feedback, on_change=recorder
+            )
+            if feedback.isCanceled():
+                return {}
+            results[scenario] = output
+            if recorder is not None:
+                recorder.save(str(output_dir / f"{scenario}{CHANGE_RECORD_SUFFIX}"))
+            if load_outputs:
+                context.addLayerToLoadOnCompletion(
+                    output,
+                    QgsProcessingContext.LayerDetails(
+                        scenario, context.project(), scenario
+                    ),
+                )
+            step += 2
+
+        results[self.outputDir] = str(output_dir)
+        return results
+
+    @staticmethod
+    def check_scenario_name(scenario: str, row: int) -> None:
+        """Scenario names are used as file names, so they cannot hold a path"""
+        if not scenario:
+            raise QgsProcessingException(f"Row {row} has no Scenario name.")
+        if (
+            INVALID_NAME_CHARACTERS.search(scenario)
+            or scenario.endswith(".")
+            or scenario.split(".")[0].upper() in RESERVED_NAMES
+        ):
+            raise QgsProcessingException(
+                f'Row {row}: "{scenario}" cannot be used as a file name. '
+                'Scenario names cannot contain any of < > : " / \\ | ? * or end with a dot.'
+            )
+
+    @staticmethod
+    def check_expression(expression: str, layer: QgsVectorLayer, row: int) -> None:
+        """Check the filter expression of a row before anything is written"""
+        parsed = QgsExpression(expression)
+        if parsed.hasParserError():
+            raise QgsProcessingException(
+                f"Row {row}: invalid Filter Expression: {parsed.parserErrorString()}"
+            )
+        field_names = [name.lower() for name in layer.fields().names()]
+        missing = [
+            column
+            for column in parsed.referencedColumns()
+            if column != QgsFeatureRequest.ALL_ATTRIBUTES
+            and column.lower() not in field_names
+        ]
+        if missing:
+            raise QgsProcessingException(
+                f"Row {row}: field {', '.join(missing)} of the Filter Expression not found in {layer.name()}."
+            )
+
+    @staticmethod
+    def land_cover_value(land_cover: str, lookup: dict, row: int) -> int:
+        """Land cover code from a numeric value or a name in the lookup table"""
+        try:
+            return int(land_cover)
+        except ValueError:
+            pass
+        if not lookup:
+            raise QgsProcessingException(
+                f'Row {row}: "{land_cover}" is not a land cover value and no Land Cover Lookup Table was provided.'
+            )
+        if compact_name(land_cover) not in lookup:
+            raise QgsProcessingException(
+                f"Row {row}: unable to find {land_cover} in the table."
+            )
+        return lookup[compact_name(land_cover)]
+
+    @staticmethod
+    def priority_value(priority: str, row: int) -> int:
+        if not priority:
+            return 0
+        try:
+            return int(priority)
+        except ValueError:
+            raise QgsProcessingException(
+                f'Row {row}: priority "{priority}" is not an integer.'
+            )
+
+    def name(self):
+        return "modify_land_cover_batch"
+
+    def displayName(self):
+        return self.tr("Modify Land Cover (Batch)")
+
+    def group(self):
+        return self.tr("Data Preparation")
+
+    def groupId(self):
+        return "data_preparation"
+
+    def createInstance(self):
+        return ModifyLandCoverBatch()
+
+    def shortHelpString(self):
+        return """<html><body>
+<h2>Algorithm Description</h2>
+
+<p>The `Modify Land Cover (Batch)` algorithm applies many land cover edits to a land cover raster in one call. The edits are grouped by scenario and one modified land cover raster is created for each scenario.
+For each scenario the land cover raster is copied once and all of its edits are burnt in a single pass, rewriting only the parts of the raster the areas overlap.</p>
+
+<h2>Input Parameters</h2>
+
+<h3>Land Cover Raster</h3>
+<p>Land cover raster that needs to be modified.</p>
+
+<h3>Land Cover Lookup Table</h3>
+<p>Optional lookup table used to map land cover names to raster values. The lookup table must include the land cover name in a field called "lc_name" and a corresponding value in a field called "lc_value". It is only needed if land covers are given by name.</p>
+
+<h3>Land Cover Edits</h3>
+<p>Table with one row per edit:</p>
+<ul>
+<li>Scenario: name of the output raster the edit is applied to. Rows with the same scenario are applied to the same raster. As it is used as a file name, it cannot contain any of &lt; &gt; : " / \\ | ? * or end with a dot.</li>
+<li>Areas Layer: polygon layer, given by its name in the project or its path, that overlaps the pixels that should be changed.</li>
+<li>Filter Expression: optional expression selecting the polygons of the Areas Layer to use. All polygons are used if left empty. The expressions are checked before any raster is written, and a warning is shown for the rows that select no polygons.</li>
+<li>Land Cover: land cover value, or land cover name from the lookup table, the pixels will be changed to.</li>
+<li>Priority: where edits of a scenario overlap, the edit with the higher priority is used. Defaults to 0. Among edits with the same priority, the later row is used.</li>
+</ul>
+<p>You must click OK after editing to save your changes.</p>
+
+<h3>Open output files after running algorithm</h3>
+<p>If checked, the modified land cover rasters will be added to the project.</p>
+
+<h3>Write Land Cover Change Records</h3>
+<p>If checked, a change record is saved next to each modified land cover raster (scenario name with the .lcc.npz extension). It records the cells that were changed, with their old and new land cover codes, and the raster windows that contain changes, so other tools can find what changed without comparing the full rasters.</p>
+
+<h2>Outputs</h2>
+
+<h3>Output Folder</h3>
+<p>The folder the modified land cover rasters will be saved to. Each raster is named after its scenario.</p>
+
+</body></html>"""
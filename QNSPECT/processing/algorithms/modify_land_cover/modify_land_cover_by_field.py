@@ -28,10 +28,17 @@ from qgis.core import (
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterField,
     QgsProcessingParameterRasterDestination,
+    QgsProcessingParameterFileDestination,
 )
-import processing
 
 from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithms.modify_land_cover.land_cover_utils import (
+    LandCoverEditor,
+    ChangeRecorder,
+    CHANGE_RECORD_SUFFIX,
+)
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 
 class ModifyLandCover(QNSPECTAlgorithm):
@@ -39,6 +46,7 @@ class ModifyLandCover(QNSPECTAlgorithm):
     field = "Field"
     inputRaster = "InputRaster"
     output = "OutputRaster"
+    changeRecord = "ChangeRecord"
 
     def initAlgorithm(self, config=None):
         self.addParameter(
@@ -73,55 +81,57 @@ class ModifyLandCover(QNSPECTAlgorithm):
                 defaultValue=None,
             )
         )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.changeRecord,
+                "Land Cover Change Record",
+                fileFilter=f"Land Cover Change Record (*{CHANGE_RECORD_SUFFIX})",
+                optional=True,
+                createByDefault=False,
+                defaultValue=None,
+            )
+        )
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
-        # Rasterize with overwrite was the best method for accomplishing this. Since it directly changes the input, the original needs to be copied prior to execution
         feedback = QgsProcessingMultiStepFeedback(2, model_feedback)
         results = {}
-        outputs = {}
+
+        field = self.parameterAsString(parameters, self.field, context) or "lc_value"
+        areas_fields = self.parameterAsSource(
+            parameters, self.inputVector, context
+        ).fields()
+        if field not in areas_fields.names():
+            feedback.reportError(f'Field "{field}" not found in the Areas to Modify.')
+            return {}
 
         parameters[self.output].destinationName = "Modified Land Cover"
-        # Uses clip raster to get a copy of the original raster
-        # Some other method of copying in a way that allows for temporary output would be better for this part
-        alg_params = {
-            "DATA_TYPE": 0,
-            "EXTRA": "",
-            "INPUT": parameters[self.inputRaster],
-            "NODATA": None,
-            "OPTIONS": "",
-            "PROJWIN": parameters[self.inputRaster],
-            "OUTPUT": parameters[self.output],
-        }
-        outputs["ClipRasterByExtent"] = processing.run(
-            "gdal:cliprasterbyextent",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
+        output = self.parameterAsOutputLayer(parameters, self.output, context)
+        land_cover_layer = self.parameterAsRasterLayer(
+            parameters, self.inputRaster, context
         )
+        areas = self.parameterAsSource(parameters, self.inputVector, context)
+
+        # The areas are indexed so only the windows they touch are rewritten in the copy of the raster
+        editor = LandCoverEditor(land_cover_layer, context)
+        editor.add_source(areas, land_cover_layer.crs(), field=field, feedback=feedback)
 
         feedback.setCurrentStep(1)
         if feedback.isCanceled():
             return {}
 
-        # Rasterize (overwrite with attribute)
-        alg_params = {
-            "ADD": False,
-            "EXTRA": "",
-            "FIELD": parameters[self.field],
-            "INPUT": parameters[self.inputVector],
-            "INPUT_RASTER": outputs["ClipRasterByExtent"]["OUTPUT"],
-        }
-        outputs["RasterizeOverwriteWithAttribute"] = processing.run(
-            "gdal:rasterize_over",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
+        change_record = self.parameterAsFileOutput(
+            parameters, self.changeRecord, context
         )
-
+        recorder = ChangeRecorder(editor) if change_record else None
+        results[self.output] = editor.apply(output, feedback, on_change=recorder)
+        if feedback.isCanceled():
+            return {}
+        if recorder is not None:
+            results[self.changeRecord] = recorder.save(change_record)
         return results
 
     def name(self):
@@ -164,4 +174,7 @@ lc_value
 <h3>Modified Land Cover Raster</h3>
 <p>The location the modified land cover raster will be saved to.</p>
 
+<h3>Land Cover Change Record</h3>
+<p>Optional file recording the cells that were changed, with their old and new land cover codes, and the raster windows that contain changes. It lets other tools find what changed without comparing the full rasters.</p>
+
 </body></html>"""
@@ -27,12 +27,19 @@ from qgis.core import (
     QgsProcessingParameterVectorLayer,
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterRasterDestination,
+    QgsProcessingParameterFileDestination,
     QgsProcessingParameterString,
     QgsProcessingParameterFeatureSource,
 )
-import processing
 
 from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithms.modify_land_cover.land_cover_utils import (
+    LandCoverEditor,
+    ChangeRecorder,
+    CHANGE_RECORD_SUFFIX,
+)
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 
 class ModifyLandCoverByName(QNSPECTAlgorithm):
@@ -40,6 +47,7 @@ class ModifyLandCoverByName(QNSPECTAlgorithm):
     inputVector = "InputVector"
     inputRaster = "InputRaster"
     output = "OutputRaster"
+    changeRecord = "ChangeRecord"
     landCover = "LandCover"
 
     def initAlgorithm(self, config=None):
@@ -80,13 +88,24 @@ class ModifyLandCoverByName(QNSPECTAlgorithm):
                 defaultValue=None,
             )
         )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.changeRecord,
+                "Land Cover Change Record",
+                fileFilter=f"Land Cover Change Record (*{CHANGE_RECORD_SUFFIX})",
+                optional=True,
+                createByDefault=False,
+                defaultValue=None,
+            )
+        )
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
         feedback = QgsProcessingMultiStepFeedback(2, model_feedback)
         results = {}
-        outputs = {}
 
         # Find the named values
         coefficient_name = self.parameterAsString(parameters, self.landCover, context)
@@ -110,44 +129,31 @@ class ModifyLandCoverByName(QNSPECTAlgorithm):
             return {}
 
         parameters[self.output].destinationName = "Modified Land Cover"
-        # Uses clip raster to get a copy of the original raster
-        # Some other method of copying in a way that allows for temporary output would be better for this part
-        alg_params = {
-            "DATA_TYPE": 0,
-            "EXTRA": "",
-            "INPUT": parameters[self.inputRaster],
-            "NODATA": None,
-            "OPTIONS": "",
-            "PROJWIN": parameters[self.inputRaster],
-            "OUTPUT": parameters[self.output],
-        }
-        outputs["ClipRasterByExtent"] = processing.run(
-            "gdal:cliprasterbyextent",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
+        output = self.parameterAsOutputLayer(parameters, self.output, context)
+        land_cover_layer = self.parameterAsRasterLayer(
+            parameters, self.inputRaster, context
+        )
+        areas = self.parameterAsSource(parameters, self.inputVector, context)
+
+        # The areas are indexed so only the windows they touch are rewritten in the copy of the raster
+        editor = LandCoverEditor(land_cover_layer, context)
+        editor.add_source(
+            areas, land_cover_layer.crs(), value=lc_value, feedback=feedback
         )
 
         feedback.setCurrentStep(1)
         if feedback.isCanceled():
             return {}
 
-        # Rasterize (overwrite with fixed value)
-        alg_params = {
-            "ADD": False,
-            "BURN": lc_value,
-            "EXTRA": lc_value,
-            "INPUT": parameters[self.inputVector],
-            "INPUT_RASTER": outputs["ClipRasterByExtent"]["OUTPUT"],
-        }
-        outputs["RasterizeOverwriteWithFixedValue"] = processing.run(
-            "gdal:rasterize_over_fixed_value",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
+        change_record = self.parameterAsFileOutput(
+            parameters, self.changeRecord, context
         )
+        recorder = ChangeRecorder(editor) if change_record else None
+        results[self.output] = editor.apply(output, feedback, on_change=recorder)
+        if feedback.isCanceled():
+            return {}
+        if recorder is not None:
+            results[self.changeRecord] = recorder.save(change_record)
         return results
 
     def name(self):
@@ -194,4 +200,7 @@ lc_value
 <h3>Modified Land Cover Raster</h3>
 <p>The location the modified land cover raster will be saved to.</p>
 
+<h3>Land Cover Change Record</h3>
+<p>Optional file recording the cells that were changed, with their old and new land cover codes, and the raster windows that contain changes. It lets other tools find what changed without comparing the full rasters.</p>
+
 </body></html>"""
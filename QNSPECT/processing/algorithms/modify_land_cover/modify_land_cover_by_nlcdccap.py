@@ -20,7 +20,6 @@ __copyright__ = "(C) 2021 by NOAA"
 __revision__ = "$Format:%H$"
 
 import csv
-import processing
 from typing import Dict
 from pathlib import Path
 
@@ -32,16 +31,25 @@ from qgis.core import (
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterRasterDestination,
+    QgsProcessingParameterFileDestination,
     QgsProcessingParameterFeatureSource,
 )
 
 from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithms.modify_land_cover.land_cover_utils import (
+    LandCoverEditor,
+    ChangeRecorder,
+    CHANGE_RECORD_SUFFIX,
+)
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 
 class ModifyLandCoverByNLCDCCAP(QNSPECTAlgorithm):
     inputVector = "InputVector"
     inputRaster = "InputRaster"
     output = "OutputRaster"
+    changeRecord = "ChangeRecord"
     landCover = "LandCover"
 
     def initAlgorithm(self, config=None):
@@ -88,56 +96,57 @@ class ModifyLandCoverByNLCDCCAP(QNSPECTAlgorithm):
                 defaultValue=None,
             )
         )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.changeRecord,
+                "Land Cover Change Record",
+                fileFilter=f"Land Cover Change Record (*{CHANGE_RECORD_SUFFIX})",
+                optional=True,
+                createByDefault=False,
+                defaultValue=None,
+            )
+        )
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
         feedback = QgsProcessingMultiStepFeedback(2, model_feedback)
         results = {}
-        outputs = {}
+
+        enum_value = self.parameterAsInt(parameters, self.landCover, context)
+        land_cover_name = self.choices[enum_value]
 
         parameters[self.output].destinationName = "Modified Land Cover"
-        # Uses clip raster to get a copy of the original raster
-        # Some other method of copying in a way that allows for temporary output would be better for this part
-        alg_params = {
-            "DATA_TYPE": 0,
-            "EXTRA": "",
-            "INPUT": parameters[self.inputRaster],
-            "NODATA": None,
-            "OPTIONS": "",
-            "PROJWIN": parameters[self.inputRaster],
-            "OUTPUT": parameters[self.output],
-        }
-        outputs["ClipRasterByExtent"] = processing.run(
-            "gdal:cliprasterbyextent",
-            alg_params,
-            context=context,
+        output = self.parameterAsOutputLayer(parameters, self.output, context)
+        land_cover_layer = self.parameterAsRasterLayer(
+            parameters, self.inputRaster, context
+        )
+        areas = self.parameterAsSource(parameters, self.inputVector, context)
+
+        # The areas are indexed so only the windows they touch are rewritten in the copy of the raster
+        editor = LandCoverEditor(land_cover_layer, context)
+        editor.add_source(
+            areas,
+            land_cover_layer.crs(),
+            value=self.coefficients[land_cover_name],
             feedback=feedback,
-            is_child_algorithm=True,
         )
 
         feedback.setCurrentStep(1)
         if feedback.isCanceled():
             return {}
 
-        enum_value = self.parameterAsInt(parameters, self.landCover, context)
-        land_cover_name = self.choices[enum_value]
-
-        # Rasterize (overwrite with fixed value)
-        alg_params = {
-            "ADD": False,
-            "BURN": self.coefficients[land_cover_name],
-            "EXTRA": "",
-            "INPUT": parameters[self.inputVector],
-            "INPUT_RASTER": outputs["ClipRasterByExtent"]["OUTPUT"],
-        }
-        outputs["RasterizeOverwriteWithFixedValue"] = processing.run(
-            "gdal:rasterize_over_fixed_value",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
+        change_record = self.parameterAsFileOutput(
+            parameters, self.changeRecord, context
         )
+        recorder = ChangeRecorder(editor) if change_record else None
+        results[self.output] = editor.apply(output, feedback, on_change=recorder)
+        if feedback.isCanceled():
+            return {}
+        if recorder is not None:
+            results[self.changeRecord] = recorder.save(change_record)
         return results
 
     def name(self):
@@ -181,4 +190,7 @@ The pixels of the input raster layer that overlap with the areas of the input ve
 <h3>Modified Land Cover Raster</h3>
 <p>The location the modified land cover raster will be saved to.</p>
 
+<h3>Land Cover Change Record</h3>
+<p>Optional file recording the cells that were changed, with their old and new land cover codes, and the raster windows that contain changes. It lets other tools find what changed without comparing the full rasters.</p>
+
 </body></html>"""
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = "NOAA"
+__date__ = "2026-10-18"
+__copyright__ = "(C) 2026 by NOAA"
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = "$Format:%H$"
+
+import numpy as np
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingMultiStepFeedback,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingException,
+    QgsProcessingUtils,
+    QgsCoordinateTransform,
+    QgsRasterLayer,
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsPointXY,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import QVariant
+
+from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithms.qnspect_utils import (
+    load_run_file,
+    run_output_rasters,
+)
+from QNSPECT.processing.algorithms.block_utils import open_raster
+from QNSPECT.processing.algorithms.outlet_loads.outlet_utils import (
+    world_to_cell,
+    cell_center,
+    inside_grid,
+    snap_to_max_accumulation,
+    sample_cells,
+)
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
+
+
+class OutletLoads(QNSPECTAlgorithm):
+    runFile = "RunFile"
+    outlets = "Outlets"
+    snapRadius = "SnapRadius"
+    output = "Output"
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.runFile,
+                "Run File",
+                behavior=QgsProcessingParameterFile.File,
+                fileFilter="QNSPECT Files (*pol.json *ero.json)",
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(
+                self.outlets,
+                "Outlets",
+                types=[QgsProcessing.TypeVectorPoint],
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.snapRadius,
+                "Snap Radius (cells)",
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                defaultValue=3,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.output,
+                "Outlet Loads",
+                type=QgsProcessing.TypeVectorPoint,
+                createByDefault=True,
+                defaultValue=None,
+            )
+        )
+
+    @streamed
+    @profiled
+    def processAlgorithm(self, parameters, context, model_feedback):
+        run_file = self.parameterAsString(parameters, self.runFile, context)
+        accumulated = {
+            name: raster
+            for name, raster in run_output_rasters(
+                load_run_file(run_file), run_file
+            ).items()
+            if name.endswith(" Accumulated")
+        }
+        if not accumulated:
+            raise QgsProcessingException(
+                "The run file does not list any accumulated outputs."
+            )
+
+        # Runoff accumulation follows the flow network most closely; erosion runs only have sediment
+        snap_name = (
+            "Runoff Accumulated"
+            if "Runoff Accumulated" in accumulated
+            else next(iter(accumulated))
+        )
+
+        feedback = QgsProcessingMultiStepFeedback(len(accumulated) + 1, model_feedback)
+
+        source = self.parameterAsSource(parameters, self.outlets, context)
+        if source is None:
+            raise QgsProcessingException(
+                self.invalidSourceError(parameters, self.outlets)
+            )
+        radius = self.parameterAsInt(parameters, self.snapRadius, context)
+
+        snap_layer = QgsRasterLayer(accumulated[snap_name], snap_name, "gdal")
+        if not snap_layer.isValid():
+            raise QgsProcessingException(
+                f"Unable to open raster {accumulated[snap_name]}"
+            )
+        raster_crs = snap_layer.crs()
+        transform = QgsCoordinateTransform(
+            source.sourceCrs(), raster_crs, context.transformContext()
+        )
+
+        features = []
+        points = []
+        for feat in source.getFeatures():
+            geom = feat.geometry()
+            if geom.isNull() or geom.isEmpty():
+                feedback.pushWarning(f"Outlet {feat.id()} has no geometry; skipped.")
+                continue
+            point = geom.asMultiPoint()[0] if geom.isMultipart() else geom.asPoint()
+            features.append(feat)
+            points.append(transform.transform(point))
+        if not features:
+            raise QgsProcessingException("No outlets with a geometry were provided.")
+
+        ## Snap outlets to the highest accumulation cell nearby
+        feedback.pushInfo(f"Snapping outlets to the highest {snap_name} cell ...")
+        snap_ds = open_raster(accumulated[snap_name])
+        geo_transform = snap_ds.GetGeoTransform()
+        snap_band = snap_ds.GetRasterBand(1)
+        rows, cols = world_to_cell(
+            geo_transform,
+            np.array([p.x() for p in points]),
+            np.array([p.y() for p in points]),
+        )
+        inside = inside_grid(snap_band, rows, cols)
+        for i in np.nonzero(~inside)[0]:
+            feedback.pushWarning(
+                f"Outlet {features[i].id()} is outside of the run outputs."
+            )
+        rows[inside], cols[inside] = snap_to_max_accumulation(
+            snap_band, rows[inside], cols[inside], radius
+        )
+        snap_band = None
+        snap_ds = None
+
+        ## Read all accumulated outputs at the snapped cells
+        values = {}
+        for step, (name, raster) in enumerate(accumulated.items(), start=1):
+            feedback.setCurrentStep(step)
+            if feedback.isCanceled():
+                return {}
+            feedback.pushInfo(f"Reading {name} at outlets ...")
+            ds = open_raster(raster)
+            if ds.GetGeoTransform() != geo_transform:
+                raise QgsProcessingException(
+                    f"{name} is not on the same grid as {snap_name}."
+                )
+            values[name] = sample_cells(ds.GetRasterBand(1), rows, cols)
+            ds = None
+
+        ## Write one feature per outlet at the snapped cell
+        load_fields = QgsFields()
+        load_fields.append(QgsField("Snapped", QVariant.Bool))
+        for name in accumulated:
+            load_fields.append(QgsField(name, QVariant.Double))
+        fields = QgsProcessingUtils.combineFields(source.fields(), load_fields)
+
+        sink, dest_id = self.parameterAsSink(
+            parameters,
+            self.output,
+            context,
+            fields,
+            QgsWkbTypes.Point,
+            raster_crs,
+        )
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.output))
+
+        x, y = cell_center(geo_transform, rows, cols)
+        for i, feat in enumerate(features):
+            out_feat = QgsFeature(fields)
+            attributes = feat.attributes()
+            if inside[i]:
+                out_feat.setGeometry(
+                    QgsGeometry.fromPointXY(QgsPointXY(float(x[i]), float(y[i])))
+                )
+                attributes.append(True)
+            else:
+                out_feat.setGeometry(QgsGeometry.fromPointXY(points[i]))
+                attributes.append(False)
+            for name in accumulated:
+                value = values[name][i]
+                attributes.append(None if np.isnan(value) else float(value))
+            out_feat.setAttributes(attributes)
+            sink.addFeature(out_feat, QgsFeatureSink.FastInsert)
+
+        return {self.output: dest_id}
+
+    def name(self):
+        return "outlet_loads"
+
+    def displayName(self):
+        return self.tr("Outlet Loads")
+
+    def group(self):
+        return self.tr("Analysis")
+
+    def groupId(self):
+        return "analysis"
+
+    def createInstance(self):
+        return OutletLoads()
+
+    def shortHelpString(self):
+        return """<html><body>
+<h2>Algorithm Description</h2>
+
+<p>The `Outlet Loads` algorithm reports the accumulated outputs of a `Run Pollution Analysis` or `Run Erosion Analysis` run at outlet points such as stream gauges or outfalls.
+Each outlet is snapped to the cell with the highest accumulation within the snap radius so that points digitized next to a stream land on the flow path. All accumulated outputs are then read at the snapped cells.</p>
+
+<h2>Input Parameters</h2>
+
+<h3>Run File</h3>
+<p>JSON file created by the `Run Pollution Analysis` or `Run Erosion Analysis` algorithms. The file must have the extension `.pol.json` for a pollution analysis and `.ero.json` for an erosion analysis.</p>
+
+<h3>Outlets</h3>
+<p>Point layer with the outlets. The layer is reprojected to the CRS of the run outputs if needed.</p>
+
+<h3>Snap Radius (cells)</h3>
+<p>Outlets are moved to the cell with the highest accumulation within this many cells. Runoff accumulation is used for pollution runs and sediment accumulation for erosion runs. Use 0 to keep outlets at their location.</p>
+
+<h2>Outputs</h2>
+
+<h3>Outlet Loads</h3>
+<p>Point layer with one feature per outlet at the center of the snapped cell. It keeps the attributes of the outlets and adds the value of every accumulated output of the run. `Snapped` is false for outlets outside of the run outputs; their values are empty.</p>
+
+</body></html>"""
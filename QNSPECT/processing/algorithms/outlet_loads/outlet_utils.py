@@ -0,0 +1,77 @@
+"""
+Store functions that locate outlet cells on a run grid and sample run outputs at those cells
+"""
+
+import numpy as np
+from osgeo import gdal
+
+from QNSPECT.processing.algorithms.block_utils import BLOCK_SIZE, valid_data
+
+
+def world_to_cell(transform: tuple, x: np.ndarray, y: np.ndarray) -> tuple:
+    """Row and column of the cells containing the coordinates on a north up grid"""
+    cols = np.floor((x - transform[0]) / transform[1]).astype(np.int64)
+    rows = np.floor((y - transform[3]) / transform[5]).astype(np.int64)
+    return rows, cols
+
+
+def cell_center(transform: tuple, rows: np.ndarray, cols: np.ndarray) -> tuple:
+    """Coordinates of the center of the cells on a north up grid"""
+    x = transform[0] + (cols + 0.5) * transform[1]
+    y = transform[3] + (rows + 0.5) * transform[5]
+    return x, y
+
+
+def inside_grid(band: gdal.Band, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Boolean array that is True where the cell is on the raster"""
+    return (rows >= 0) & (rows < band.YSize) & (cols >= 0) & (cols < band.XSize)
+
+
+def snap_to_max_accumulation(
+    band: gdal.Band, rows: np.ndarray, cols: np.ndarray, radius: int
+) -> tuple:
+    """Move every cell to the cell with the highest accumulation within radius cells.
+    Cells with only no data around them are left in place.
+    All cells must be on the raster."""
+    nodata = band.GetNoDataValue()
+    snapped_rows = rows.copy()
+    snapped_cols = cols.copy()
+    for i, (row, col) in enumerate(zip(rows, cols)):
+        y_off = max(row - radius, 0)
+        x_off = max(col - radius, 0)
+        height = min(row + radius + 1, band.YSize) - y_off
+        width = min(col + radius + 1, band.XSize) - x_off
+        window = band.ReadAsArray(int(x_off), int(y_off), int(width), int(height))
+        valid = valid_data(window, nodata)
+        if not valid.any():
+            continue
+        window = np.where(valid, window.astype(np.float64), -np.inf)
+        win_row, win_col = np.unravel_index(np.argmax(window), window.shape)
+        snapped_rows[i] = y_off + win_row
+        snapped_cols[i] = x_off + win_col
+    return snapped_rows, snapped_cols
+
+
+def sample_cells(band: gdal.Band, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Read the value of the raster at the cells, reading each block that holds cells only once.
+    Cells that are off the raster or no data are returned as nan."""
+    nodata = band.GetNoDataValue()
+    values = np.full(rows.shape, np.nan)
+    inside = np.nonzero(inside_grid(band, rows, cols))[0]
+    if inside.size == 0:
+        return values
+
+    n_block_cols = (band.XSize + BLOCK_SIZE - 1) // BLOCK_SIZE
+    keys = (rows[inside] // BLOCK_SIZE) * n_block_cols + cols[inside] // BLOCK_SIZE
+    for key in np.unique(keys):
+        idx = inside[keys == key]
+        block_row, block_col = divmod(int(key), n_block_cols)
+        x_off = block_col * BLOCK_SIZE
+        y_off = block_row * BLOCK_SIZE
+        width = min(BLOCK_SIZE, band.XSize - x_off)
+        height = min(BLOCK_SIZE, band.YSize - y_off)
+        block = band.ReadAsArray(x_off, y_off, width, height)
+        cell_values = block[rows[idx] - y_off, cols[idx] - x_off]
+        valid = valid_data(cell_values, nodata)
+        values[idx[valid]] = cell_values[valid].astype(np.float64)
+    return values
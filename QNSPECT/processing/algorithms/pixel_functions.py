@@ -0,0 +1,83 @@
+"""
+Store GDAL VRT pixel functions used to derive QNSPECT outputs on the fly.
+Derived outputs are written as small VRT files that reference existing rasters,
+so they take no extra full raster write and are computed whenever they are read.
+"""
+
+import os
+from xml.sax.saxutils import escape
+
+import numpy as np
+from osgeo import gdal
+
+from QNSPECT.processing.algorithms.block_utils import NODATA, open_raster
+
+TRUSTED_MODULE = __name__
+
+
+def enable_pixel_functions() -> None:
+    """Allow GDAL to run the pixel functions of this module when a derived VRT is read"""
+    trusted = gdal.GetConfigOption("GDAL_VRT_PYTHON_TRUSTED_MODULES") or ""
+    modules = [module for module in trusted.split(",") if module]
+    if TRUSTED_MODULE not in modules:
+        modules.append(TRUSTED_MODULE)
+        gdal.SetConfigOption("GDAL_VRT_PYTHON_TRUSTED_MODULES", ",".join(modules))
+
+
+def concentration(
+    in_ar,
+    out_ar,
+    xoff,
+    yoff,
+    xsize,
+    ysize,
+    raster_xsize,
+    raster_ysize,
+    buf_radius,
+    gt,
+    **kwargs,
+):
+    """Concentration (mg/L) from an accumulated load (kg) and accumulated runoff (L)"""
+    load = in_ar[0].astype(np.float64)
+    runoff = in_ar[1].astype(np.float64)
+    conc = np.divide(load, runoff, out=np.zeros_like(load), where=(runoff != 0))
+    valid = (load != NODATA) & (runoff != NODATA)
+    out_ar[:] = np.where(valid, conc * 1e6, NODATA)  # Convert kg back to mg
+
+
+def create_derived_vrt(output: str, sources: list, pixel_function: str) -> str:
+    """Write a single band Float32 VRT that applies a pixel function of this module to the sources.
+    Sources in the folder of the VRT are referenced relative to it so the run folder can be moved.
+    """
+    ref_ds = open_raster(sources[0])
+    transform = ", ".join(repr(value) for value in ref_ds.GetGeoTransform())
+    x_size, y_size = ref_ds.RasterXSize, ref_ds.RasterYSize
+    srs = ref_ds.GetProjection()
+    ref_ds = None
+
+    out_dir = os.path.dirname(os.path.abspath(output))
+    source_xml = []
+    for source in sources:
+        source = os.path.abspath(str(source))
+        relative = os.path.dirname(source) == out_dir
+        filename = os.path.basename(source) if relative else source
+        source_xml.append(f"""    <SimpleSource>
+      <SourceFilename relativeToVRT="{int(relative)}">{escape(filename)}</SourceFilename>
+      <SourceBand>1</SourceBand>
+    </SimpleSource>""")
+    sources_xml = "\n".join(source_xml)
+
+    vrt = f"""<VRTDataset rasterXSize="{x_size}" rasterYSize="{y_size}">
+  <SRS>{escape(srs)}</SRS>
+  <GeoTransform>{transform}</GeoTransform>
+  <VRTRasterBand dataType="Float32" band="1" subClass="VRTDerivedRasterBand">
+    <NoDataValue>{NODATA}</NoDataValue>
+    <PixelFunctionType>{escape(f"{TRUSTED_MODULE}.{pixel_function}")}</PixelFunctionType>
+    <PixelFunctionLanguage>Python</PixelFunctionLanguage>
+{sources_xml}
+  </VRTRasterBand>
+</VRTDataset>
+"""
+    with open(output, "w") as f:
+        f.write(vrt)
+    return str(output)
@@ -1,6 +1,11 @@
 """
 Store common functions that are required by different QNSPECT Modules
 """
+import os
+import json
+
+import numpy as np
+
 from qgis.core import (
     QgsRasterBandStats,
     QgsSingleBandPseudoColorRenderer,
@@ -9,6 +14,7 @@ from qgis.core import (
     QgsProcessing,
     QgsLayerTreeGroup,
     QgsLayerTree,
+    QgsProcessingException,
 )
 
 from qgis.PyQt.QtGui import QColor
@@ -18,6 +24,13 @@ from qgis.PyQt.QtCore import *
 
 import processing
 
+from QNSPECT.processing.algorithms.block_utils import (
+    evaluate_expression,
+    open_raster,
+    process_blocks,
+    valid_data,
+)
+
 
 class LayerPostProcessor(QgsProcessingLayerPostProcessorInterface):
     def __init__(self, display_name, layer_color1, layer_color2):
@@ -91,6 +104,32 @@ def select_group(name: str) -> bool:
         return False
 
 
+def default_worker_count() -> int:
+    """Default number of concurrent jobs for algorithms that dispatch independent child runs"""
+    return min(4, os.cpu_count() or 1)
+
+
+def load_run_file(run_file: str) -> dict:
+    """Read the configuration file written by the Run Pollution or Run Erosion Analysis algorithms"""
+    if not run_file.lower().endswith((".pol.json", ".ero.json")):
+        raise QgsProcessingException("Wrong or missing parameter value: Run File")
+    with open(run_file) as f:
+        return json.load(f)
+
+
+def run_output_rasters(run_dict: dict, run_file: str = None) -> dict:
+    """Raster outputs of a run keyed by output name, ex: {"Lead Local": ".../Lead Local.tif"}
+    If the run folder was moved, outputs are looked up next to the run file."""
+    rasters = {}
+    for name, path in run_dict["Outputs"].items():
+        if not (isinstance(path, str) and path.lower().endswith((".tif", ".vrt"))):
+            continue
+        if run_file and not os.path.isfile(path):
+            path = os.path.join(os.path.dirname(run_file), os.path.basename(path))
+        rasters[name] = path
+    return rasters
+
+
 def filter_matrix(matrix: list) -> list:
     matrix_filtered = [
         matrix[i]
@@ -106,8 +145,25 @@ def perform_raster_math(
     context,
     feedback,
     output=QgsProcessing.TEMPORARY_OUTPUT,
+    mask=None,
 ) -> dict:
-    """Wrapper around QGIS GDAL Raster Calculator"""
+    """Wrapper around QGIS GDAL Raster Calculator.
+    If the block mask of the run is given, the expression is evaluated in process instead,
+    skipping the blocks outside of the watershed and computing only the valid cells of the others.
+    """
+    inputs = {
+        name.upper(): input_dict[f"input_{name}"]
+        for name in "abcdef"
+        if input_dict.get(f"input_{name}", None) is not None
+    }
+    if mask is not None and all(
+        str(input_dict.get(f"band_{name.lower()}", 1)) == "1" for name in inputs
+    ):
+        return {
+            "OUTPUT": evaluate_expression(
+                exprs, inputs, output, mask=mask, feedback=feedback, context=context
+            )
+        }
 
     alg_params = {
         "BAND_A": input_dict.get("band_a", None),
@@ -146,6 +202,7 @@ def grass_material_transport(
     mfd=True,
     output=QgsProcessing.TEMPORARY_OUTPUT,
     threshold=500,
+    mask=None,
 ) -> dict:
     # r.watershed
     alg_params = {
@@ -179,33 +236,28 @@ def grass_material_transport(
         is_child_algorithm=True,
     )["accumulation"]
 
-    # Grass output has 0 values marked as nodata
-    # Following is a temporary workaround, refer Github issue #29
+    # Grass output has 0 values marked as nodata, refer Github issue #29
+    # They are set to 0 and the nodata cells of the weight raster are restored in one pass
+    accumulation_ds = open_raster(grass_accumulation, context)
+    accumulation_nodata = accumulation_ds.GetRasterBand(1).GetNoDataValue()
+    accumulation_ds = None
 
-    # Fill NoData cells
-    alg_params = {
-        "BAND": 1,
-        "FILL_VALUE": 0,
-        "INPUT": grass_accumulation,
-        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-    }
-    all_filled = processing.run(
-        "native:fillnodata",
-        alg_params,
-        context=context,
-        feedback=feedback,
-        is_child_algorithm=True,
-    )["OUTPUT"]
-
-    # Get back original nodata cells
-    input_dict = {
-        "input_a": all_filled,
-        "band_a": 1,
-        "input_b": weight,
-        "band_b": 1,
-    }
-    exprs = "A + ( B * 0)"
+    def restore_nodata(arrays, valid):
+        accumulation = arrays["A"]
+        return {
+            "OUTPUT": np.where(
+                valid_data(accumulation, accumulation_nodata), accumulation, 0
+            )
+        }
 
-    return perform_raster_math(
-        exprs, input_dict, context=context, feedback=feedback, output=output
-    )
+    return {
+        "OUTPUT": process_blocks(
+            {"A": grass_accumulation, "B": weight},
+            {"OUTPUT": output},
+            restore_nodata,
+            feedback=feedback,
+            context=context,
+            mask=mask,
+            nodata_inputs=["B"],
+        )["OUTPUT"]
+    }
@@ -26,11 +26,25 @@ from qgis.core import (
     QgsProcessingParameterVectorLayer,
     QgsProcessingParameterDistance,
     QgsProcessingParameterField,
+    QgsProcessingParameterRasterLayer,
     QgsProcessingParameterRasterDestination,
 )
-import processing
+from osgeo import gdal
 
 from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithms.rasterize_soil.soil_utils import (
+    HSG_NODATA,
+    K_NODATA,
+    invalid_hsg_values,
+    invalid_k_factor_values,
+    hsg_code_sql,
+    k_factor_sql,
+    quote_identifier,
+    ogr_source,
+    rasterize_attributes,
+)
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 
 class RasterizeSoil(QNSPECTAlgorithm):
@@ -74,6 +88,14 @@ class RasterizeSoil(QNSPECTAlgorithm):
                 defaultValue=30,
             )
         )
+        self.addParameter(
+            QgsProcessingParameterRasterLayer(
+                "ReferenceRaster",
+                "Reference Raster",
+                optional=True,
+                defaultValue=None,
+            )
+        )
         self.addParameter(
             QgsProcessingParameterRasterDestination(
                 "Hsg",
@@ -88,127 +110,101 @@ class RasterizeSoil(QNSPECTAlgorithm):
             )
         )
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
-        feedback = QgsProcessingMultiStepFeedback(4, model_feedback)
+        feedback = QgsProcessingMultiStepFeedback(3, model_feedback)
         results = {}
-        outputs = {}
+
+        soil_layer = self.parameterAsVectorLayer(
+            parameters, "HydrologicSoilGroupLayer", context
+        )
+        hsg_field = parameters["HydrologicSoilGroupField"]
+        k_field = parameters["KFactorField"]
+        if not (hsg_field or k_field):
+            return {}
 
         # Assertions
-        if parameters["HydrologicSoilGroupField"]:
-            soil_layer = self.parameterAsVectorLayer(
-                parameters, "HydrologicSoilGroupLayer", context
-            )
-            hsg_field = parameters["HydrologicSoilGroupField"]
-
-            for feat in soil_layer.getFeatures():
-                if feat[hsg_field] not in [
-                    None,
-                    "A",
-                    "B",
-                    "C",
-                    "D",
-                    "A/D",
-                    "B/D",
-                    "C/D",
-                    "W",
-                ]:
-                    error_message = f"""Field {hsg_field} contain value(s) other than allowed Hydrologic Soil Groups [Null, 'A', 'B', 'C' , 'D', 'A/D', 'B/D', 'C/D', 'W']"""
-                    feedback.reportError(
-                        error_message,
-                        True,
-                    )
-                    return {}
+        if hsg_field:
+            invalid_values = invalid_hsg_values(soil_layer, hsg_field)
+            if invalid_values:
+                error_message = f"""Field {hsg_field} contain value(s) other than allowed Hydrologic Soil Groups [Null, 'A', 'B', 'C' , 'D', 'A/D', 'B/D', 'C/D', 'W']: {invalid_values}"""
+                feedback.reportError(
+                    error_message,
+                    True,
+                )
+                return {}
+
+        if k_field:
+            invalid_values = invalid_k_factor_values(soil_layer, k_field)
+            if invalid_values:
+                feedback.reportError(
+                    f"Field {k_field} contain value(s) that are not numbers: {invalid_values}",
+                    True,
+                )
+                return {}
+
+        # Output grid: snapped to the reference raster if given, otherwise the soil layer extent
+        ref_layer = self.parameterAsRasterLayer(parameters, "ReferenceRaster", context)
+        if ref_layer:
+            target_crs = ref_layer.crs()
+            extent = ref_layer.extent()
+            res = (ref_layer.rasterUnitsPerPixelX(), ref_layer.rasterUnitsPerPixelY())
+        else:
+            target_crs = None
+            extent = soil_layer.extent()
+            cell_size = self.parameterAsDouble(parameters, "RasterCellSize", context)
+            res = (cell_size, cell_size)
 
         feedback.setCurrentStep(1)
         if feedback.isCanceled():
             return {}
 
-        if parameters["KFactorField"]:
-
+        # Burn HSG code and K-Factor from one opening of the polygons straight into the outputs
+        path, layer_name = ogr_source(soil_layer, context, feedback, target_crs)
+        columns = []
+        outputs = {}
+        if hsg_field:
+            columns.append(f"{hsg_code_sql(hsg_field)} AS __hsg__")
+            parameters["Hsg"].destinationName = "HSG"
+            outputs["__hsg__"] = (
+                self.parameterAsOutputLayer(parameters, "Hsg", context),
+                gdal.GDT_Byte,
+                HSG_NODATA,
+            )
+        if k_field:
+            columns.append(f"{k_factor_sql(k_field)} AS __k__")
             parameters["K_factor"].destinationName = "K-Factor"
-
-            # Rasterize K-Factor
-            alg_params = {
-                "BURN": 0,
-                "DATA_TYPE": 5,
-                "EXTENT": parameters["HydrologicSoilGroupLayer"],
-                "EXTRA": "",
-                "FIELD": parameters["KFactorField"],
-                "HEIGHT": parameters["RasterCellSize"],
-                "INIT": None,
-                "INPUT": parameters["HydrologicSoilGroupLayer"],
-                "INVERT": False,
-                "NODATA": -999999,
-                "OPTIONS": "",
-                "UNITS": 1,
-                "WIDTH": parameters["RasterCellSize"],
-                "OUTPUT": parameters["K_factor"],
-            }
-            outputs["RasterizeKfactor"] = processing.run(
-                "gdal:rasterize",
-                alg_params,
-                context=context,
-                feedback=feedback,
-                is_child_algorithm=True,
+            outputs["__k__"] = (
+                self.parameterAsOutputLayer(parameters, "K_factor", context),
+                gdal.GDT_Float32,
+                K_NODATA,
             )
-            results["K_factor"] = outputs["RasterizeKfactor"]["OUTPUT"]
+        sql = f"SELECT *, {', '.join(columns)} FROM {quote_identifier(layer_name)}"
 
         feedback.setCurrentStep(2)
         if feedback.isCanceled():
             return {}
 
-        if parameters["HydrologicSoilGroupField"]:
-            # Field calculator
-            alg_params = {
-                "FIELD_LENGTH": 2,
-                "FIELD_NAME": "__h_s_g__",
-                "FIELD_PRECISION": 0,
-                "FIELD_TYPE": 1,
-                "FORMULA": f"map_get(map( 'A', 1, 'B', 2, 'C', 3, 'D', 4, 'A/D', 5, 'B/D', 6, 'C/D', 7, 'W', 8, 'Null', 9), coalesce(\"{hsg_field}\", 'Null'))",
-                "INPUT": parameters["HydrologicSoilGroupLayer"],
-                "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-            }
-            outputs["FieldCalculator"] = processing.run(
-                "native:fieldcalculator",
-                alg_params,
-                context=context,
-                feedback=feedback,
-                is_child_algorithm=True,
-            )
-
-            feedback.setCurrentStep(3)
-            if feedback.isCanceled():
-                return {}
-
-            parameters["Hsg"].destinationName = "HSG"
-
-            # Rasterize HSG
-            alg_params = {
-                "BURN": 0,
-                "DATA_TYPE": 0,
-                "EXTENT": parameters["HydrologicSoilGroupLayer"],
-                "EXTRA": "",
-                "FIELD": "__h_s_g__",
-                "HEIGHT": parameters["RasterCellSize"],
-                "INIT": None,
-                "INPUT": outputs["FieldCalculator"]["OUTPUT"],
-                "INVERT": False,
-                "NODATA": 255,
-                "OPTIONS": "",
-                "UNITS": 1,
-                "WIDTH": parameters["RasterCellSize"],
-                "OUTPUT": parameters["Hsg"],
-            }
-            outputs["RasterizeHsg"] = processing.run(
-                "gdal:rasterize",
-                alg_params,
-                context=context,
-                feedback=feedback,
-                is_child_algorithm=True,
-            )
-            results["Hsg"] = outputs["RasterizeHsg"]["OUTPUT"]
+        paths = rasterize_attributes(
+            path,
+            sql,
+            outputs,
+            bounds=(
+                extent.xMinimum(),
+                extent.yMinimum(),
+                extent.xMaximum(),
+                extent.yMaximum(),
+            ),
+            res=res,
+            feedback=feedback,
+        )
+        if hsg_field:
+            results["Hsg"] = paths["__hsg__"]
+        if k_field:
+            results["K_factor"] = paths["__k__"]
 
         return results
 
@@ -230,6 +226,7 @@ class RasterizeSoil(QNSPECTAlgorithm):
         <h2>Algorithm description</h2>
 <p>The algorithm converts a vector polygon layer into Hydrologic Soul Group and/or K-Factor rasters. The value of the raster pixels is determined by the vector layer's attributes.</p>
 <p>Two soil parameters are needed: the hydrologic soils group, which is a measure of how permeable the soils are; and the K-factor, which is a measure of how erodible the soils are.</p>
+<p>Both rasters are burnt directly into their outputs from one opening of the Soil Layer, without intermediate rasters.</p>
 <h2>Input parameters</h2>
 <h3>Soil Layer</h3>
 <p>Vector layer representing the soil properties.</p>
@@ -239,12 +236,14 @@ class RasterizeSoil(QNSPECTAlgorithm):
 <h3>K-Factor Field</h3>
 <p>Field of the Soil Layer representing the K-Factor. The picklist values comes from the fields in the Soil Layer. This will default to 'kffact' if it is present in the Soil Layer. If this is left emtpy, no K-Factor raster will be created.</p>
 <h3>Raster Cell Size</h3>
-<p>The cell size of the output raster(s). The units will default to the units of the CRS of the Soil Layer.</p>
+<p>The cell size of the output raster(s). The units will default to the units of the CRS of the Soil Layer. Ignored if a Reference Raster is provided.</p>
+<h3>Reference Raster</h3>
+<p>Optional raster, usually the elevation raster of the analysis. If provided, the outputs are created on its grid (CRS, extent, and cell size) so they do not need to be aligned with the Align Rasters algorithm.</p>
 <h2>Outputs</h2>
 <h3>Hydrologic Soil Group Raster</h3>
-<p>The output path of the Hydrologic Soil Group raster. The raster will inherit the CRS of the Soil Layer if no other units are specified.</p>
+<p>The output path of the Hydrologic Soil Group raster. The raster will inherit the CRS of the Soil Layer, or of the Reference Raster if provided.</p>
 <h3>K-Factor Raster</h3>
-<p>The output path of the K-Factor raster. The raster will inherit the CRS of the Soil Layer.</p>
+<p>The output path of the K-Factor raster. The raster will inherit the CRS of the Soil Layer, or of the Reference Raster if provided. Polygons without a K-Factor are given 0.</p>
 <br></body></html>"""
 
     def createInstance(self):
@@ -0,0 +1,188 @@
+"""
+Store functions that rasterize soil polygons with GDAL directly from their data source
+"""
+
+from osgeo import gdal, ogr
+from qgis.core import (
+    QgsProcessingException,
+    QgsProcessingUtils,
+    QgsProviderRegistry,
+)
+import processing
+
+HSG_CODES = {
+    "A": 1,
+    "B": 2,
+    "C": 3,
+    "D": 4,
+    "A/D": 5,
+    "B/D": 6,
+    "C/D": 7,
+    "W": 8,
+}
+HSG_NULL_CODE = 9
+HSG_NODATA = 255
+K_NODATA = -999999
+
+
+def invalid_hsg_values(soil_layer, hsg_field: str) -> list:
+    """Distinct values of the field that are not Hydrologic Soil Groups.
+    Uses the provider's unique values query instead of iterating over the features."""
+    field_index = soil_layer.fields().indexFromName(hsg_field)
+    return sorted(
+        str(value)
+        for value in soil_layer.uniqueValues(field_index)
+        if value not in [None, *HSG_CODES]
+    )
+
+
+def invalid_k_factor_values(soil_layer, k_field: str) -> list:
+    """Distinct values of the field that are not numbers.
+    Null values are allowed and rasterized as 0."""
+    field_index = soil_layer.fields().indexFromName(k_field)
+    invalid = []
+    for value in soil_layer.uniqueValues(field_index):
+        if value is None or value == None:  # QGIS NULL
+            continue
+        try:
+            float(value)
+        except (TypeError, ValueError):
+            invalid.append(str(value))
+    return sorted(invalid)
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def hsg_code_sql(hsg_field: str) -> str:
+    """SQLite expression mapping the Hydrologic Soil Group to its raster code, Null to 9"""
+    cases = " ".join(f"WHEN '{hsg}' THEN {code}" for hsg, code in HSG_CODES.items())
+    return f"CASE {quote_identifier(hsg_field)} {cases} ELSE {HSG_NULL_CODE} END"
+
+
+def k_factor_sql(k_field: str) -> str:
+    """SQLite expression of the K-Factor as a number, Null to 0 as gdal_rasterize does"""
+    return f"COALESCE(CAST({quote_identifier(k_field)} AS REAL), 0)"
+
+
+def ogr_source(soil_layer, context, feedback, target_crs=None) -> tuple:
+    """Path and layer name GDAL can read the soil polygons from.
+    Layers that are not plain OGR files (memory layers, filtered layers...) or that are not
+    in the target CRS are first written to a temporary GeoPackage."""
+    same_crs = target_crs is None or target_crs == soil_layer.crs()
+    if (
+        soil_layer.providerType() == "ogr"
+        and not soil_layer.subsetString()
+        and same_crs
+    ):
+        parts = QgsProviderRegistry.instance().decodeUri("ogr", soil_layer.source())
+        path = parts.get("path")
+        ds = ogr.Open(path) if path else None
+        if ds is not None:
+            layer_name = parts.get("layerName")
+            if not layer_name:
+                layer = ds.GetLayer(parts.get("layerId") or 0)
+                layer_name = layer.GetName() if layer is not None else None
+            ds = None
+            if layer_name:
+                return path, layer_name
+
+    alg_params = {
+        "INPUT": soil_layer,
+        "OPERATION": "",
+        "TARGET_CRS": target_crs or soil_layer.crs(),
+        "OUTPUT": QgsProcessingUtils.generateTempFilename("soil.gpkg"),
+    }
+    path = processing.run(
+        "native:reprojectlayer",
+        alg_params,
+        context=context,
+        feedback=feedback,
+        is_child_algorithm=True,
+    )["OUTPUT"]
+    ds = ogr.Open(path)
+    layer_name = ds.GetLayer(0).GetName()
+    ds = None
+    return path, layer_name
+
+
+def rasterize_attributes(
+    path: str,
+    sql: str,
+    outputs: dict,
+    bounds: tuple,
+    res: tuple,
+    feedback=None,
+) -> dict:
+    """Burn attributes of the features selected by a SQLite statement into new GeoTIFFs.
+    outputs maps attribute names to (output path, GDAL data type, nodata). The source is opened
+    once and each attribute is burnt from the same result layer straight into its output,
+    without intermediate rasters.
+    bounds are (xmin, ymin, xmax, ymax) and res is (x cell size, y cell size), the grid of
+    gdal_rasterize with -te and -tr. Returns a dict of output paths keyed by attribute.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    x_size = max(int(0.5 + (xmax - xmin) / res[0]), 1)
+    y_size = max(int(0.5 + (ymax - ymin) / res[1]), 1)
+
+    source_ds = ogr.Open(path)
+    if source_ds is None:
+        raise QgsProcessingException(f"Unable to open {path}: {gdal.GetLastErrorMsg()}")
+    layer = source_ds.ExecuteSQL(sql, dialect="SQLite")
+    if layer is None:
+        raise QgsProcessingException(f"Unable to read {path}: {gdal.GetLastErrorMsg()}")
+    srs = layer.GetSpatialRef()
+
+    out_datasets = {}
+    for attribute, (output, data_type, nodata) in outputs.items():
+        out_ds = gdal.GetDriverByName("GTiff").Create(
+            output,
+            x_size,
+            y_size,
+            1,
+            data_type,
+            options=["TILED=YES", "BIGTIFF=IF_SAFER"],
+        )
+        out_ds.SetGeoTransform((xmin, res[0], 0, ymax, 0, -res[1]))
+        if srs is not None:
+            out_ds.SetProjection(srs.ExportToWkt())
+        out_ds.GetRasterBand(1).SetNoDataValue(nodata)
+        out_ds.GetRasterBand(1).Fill(nodata)
+        out_datasets[attribute] = out_ds
+
+    error = 0
+    canceled = False
+    for i, (attribute, out_ds) in enumerate(out_datasets.items()):
+
+        def progress(complete, message, data):
+            if feedback is None:
+                return 1
+            feedback.setProgress(100 * (i + complete) / len(out_datasets))
+            return 0 if feedback.isCanceled() else 1
+
+        error = gdal.RasterizeLayer(
+            out_ds, [1], layer, options=[f"ATTRIBUTE={attribute}"], callback=progress
+        )
+        if error != 0:
+            canceled = feedback is not None and feedback.isCanceled()
+            message = gdal.GetLastErrorMsg()
+            break
+
+    source_ds.ReleaseResultSet(layer)
+    layer = None
+    source_ds = None
+    for out_ds in out_datasets.values():
+        out_ds.FlushCache()
+    out_ds = None
+    paths = {attribute: outputs[attribute][0] for attribute in out_datasets}
+    out_datasets.clear()
+
+    if error != 0:
+        # partial outputs must not be mistaken for results
+        for output in paths.values():
+            gdal.GetDriverByName("GTiff").Delete(output)
+        if canceled:
+            raise QgsProcessingException("Processing canceled.")
+        raise QgsProcessingException(f"Unable to rasterize {path}: {message}")
+    return paths
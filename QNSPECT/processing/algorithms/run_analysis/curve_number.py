@@ -29,6 +29,7 @@ from qgis.core import (
 import processing
 
 from QNSPECT.processing.algorithms.qnspect_utils import perform_raster_math
+from QNSPECT.processing.algorithms.block_utils import BlockMask
 
 
 class CurveNumber:
@@ -44,6 +45,7 @@ class CurveNumber:
         lookup_layer: QgsVectorLayer,
         context: QgsProcessingContext,
         feedback: QgsProcessingMultiStepFeedback,
+        mask: BlockMask = None,
     ):
         self.outputs = {}
         self.lookup_layer = lookup_layer
@@ -52,6 +54,7 @@ class CurveNumber:
         self.dual_soil_type = dual_soil_type
         self.context = context
         self.feedback = feedback
+        self.mask = mask
         self._cn_expression = ""
 
     def generate_cn_exprs(self) -> None:
@@ -98,7 +101,11 @@ class CurveNumber:
                 }
             )
             self.outputs["CN"] = perform_raster_math(
-                self._cn_expression, input_params, self.context, self.feedback
+                self._cn_expression,
+                input_params,
+                self.context,
+                self.feedback,
+                mask=self.mask,
             )
 
         elif self.dual_soil_type == 2:
@@ -109,7 +116,11 @@ class CurveNumber:
                 }
             )
             self.outputs["CNUndrain"] = perform_raster_math(
-                self._cn_expression, input_params, self.context, self.feedback
+                self._cn_expression,
+                input_params,
+                self.context,
+                self.feedback,
+                mask=self.mask,
             )
 
             input_params.update(
@@ -119,7 +130,11 @@ class CurveNumber:
                 }
             )
             self.outputs["CNDrain"] = perform_raster_math(
-                self._cn_expression, input_params, self.context, self.feedback
+                self._cn_expression,
+                input_params,
+                self.context,
+                self.feedback,
+                mask=self.mask,
             )
 
             # average undrain and drain CN rasters
@@ -34,7 +34,14 @@ import os
 from pathlib import Path
 from json import load
 
-from qgis.core import QgsVectorLayer, QgsProcessingException
+from qgis.core import (
+    QgsVectorLayer,
+    QgsProcessing,
+    QgsProcessingException,
+    QgsProcessingParameterVectorLayer,
+    QgsProcessingParameterField,
+    QgsProcessingParameterDefinition,
+)
 
 from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
 from QNSPECT.processing.algorithms.qnspect_utils import (
@@ -42,6 +49,10 @@ from QNSPECT.processing.algorithms.qnspect_utils import (
     select_group,
     create_group,
 )
+from QNSPECT.processing.algorithms.block_utils import BlockMask
+from QNSPECT.processing.algorithms.zonal_summary.zonal_utils import (
+    summarize_run_outputs_by_zone,
+)
 
 
 class QNSPECTRunAlgorithm(QNSPECTAlgorithm):
@@ -49,6 +60,11 @@ class QNSPECTRunAlgorithm(QNSPECTAlgorithm):
     Base class for QNSPECT Run Algorithms
     """
 
+    zoneLayer = "ZoneLayer"
+    zoneField = "ZoneField"
+    zonalSummary = "Zonal Summary"
+    mask = None  # BlockMask of the run
+
     _land_cover_TABLES = {1: "C-CAP", 2: "NLCD"}
     _land_cover_PATH = (
         f"file:///{Path(__file__).parents[3] / 'resources' / 'coefficients'}"
@@ -80,6 +96,64 @@ class QNSPECTRunAlgorithm(QNSPECTAlgorithm):
 
         return {}
 
+    def create_block_mask(self, elev_raster, context, feedback) -> BlockMask:
+        """Index the blocks of the elevation raster that hold data.
+        The raster math of the run skips the other blocks, ex: outside of a masked watershed,
+        and leaves the cells without elevation as no data in the blocks it computes."""
+        self.mask = BlockMask.from_raster(elev_raster, context, feedback)
+        skipped = 1 - self.mask.occupied_fraction()
+        if skipped:
+            feedback.pushInfo(
+                f"{skipped:.0%} of the raster blocks have no elevation data and will be skipped."
+            )
+        return self.mask
+
+    def add_zone_parameters(self) -> None:
+        """Add the optional advanced parameters to summarize run outputs by zone"""
+        param = QgsProcessingParameterVectorLayer(
+            self.zoneLayer,
+            "Summarize Outputs by Zones",
+            optional=True,
+            types=[QgsProcessing.TypeVectorPolygon],
+            defaultValue=None,
+        )
+        param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(param)
+        param = QgsProcessingParameterField(
+            self.zoneField,
+            "Zone Field",
+            optional=True,
+            type=QgsProcessingParameterField.Any,
+            parentLayerParameterName=self.zoneLayer,
+            allowMultiple=False,
+            defaultValue=None,
+        )
+        param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(param)
+
+    def zones_requested(self, parameters) -> bool:
+        """Check if the run outputs should be summarized by zone"""
+        if not parameters.get(self.zoneLayer):
+            return False
+        if not parameters.get(self.zoneField):
+            raise QgsProcessingException(
+                "Zone Field must be provided to summarize outputs by zones.\n"
+            )
+        return True
+
+    def summarize_by_zone(self, parameters, context, feedback, rasters, run_out_dir):
+        """Summarize all run outputs by zone and return the path of the summary CSV"""
+        return summarize_run_outputs_by_zone(
+            zone_layer=self.parameterAsVectorLayer(parameters, self.zoneLayer, context),
+            zone_field=self.parameterAsString(parameters, self.zoneField, context),
+            rasters=rasters,
+            output_path=os.path.join(
+                run_out_dir, f"{self.run_name} {self.zonalSummary}.csv"
+            ),
+            context=context,
+            feedback=feedback,
+        )
+
     def extract_lookup_table(
         self,
         parameters,
@@ -1,50 +1,109 @@
-import math
+import numpy as np
+from osgeo import gdal
 
-from qgis.core import QgsRasterLayer, QgsProcessing
-import processing
+from qgis.core import QgsProcessing, QgsProcessingException
 
-from QNSPECT.processing.algorithms.qnspect_utils import perform_raster_math
+from QNSPECT.processing.algorithms.block_utils import (
+    NODATA,
+    BlockMask,
+    create_raster_like,
+    iterate_windows,
+    open_raster,
+    read_window_with_halo,
+    resolve_output,
+)
 
 __all__ = ("create_relief_length_ratio_raster",)
 
+# Horn weights of the three rows (or columns) of the 3 x 3 stencil
+_HORN_WEIGHTS = (1, 2, 1)
+
+
+def _horn_derivative(z: np.ndarray, axis: int, cell_size: float) -> np.ndarray:
+    """First derivative of a NaN padded elevation window along an axis with Horn's stencil.
+    As in the native slope algorithm, a missing neighbour is replaced by a one sided difference
+    with the center of its row, and the weights of the remaining differences are renormalized.
+    NaN where no difference is available."""
+    if axis == 0:
+        z = z.T
+    height, width = z.shape[0] - 2, z.shape[1] - 2
+    total = np.zeros((height, width))
+    weight = np.zeros((height, width))
+    for row, row_weight in enumerate(_HORN_WEIGHTS):
+        left = z[row : row + height, :width]
+        center = z[row : row + height, 1 : width + 1]
+        right = z[row : row + height, 2:]
+        valid_left = ~np.isnan(left)
+        valid_center = ~np.isnan(center)
+        valid_right = ~np.isnan(right)
+
+        both = valid_left & valid_right
+        right_only = ~both & valid_right & valid_center
+        left_only = ~both & valid_left & valid_center
+        total += row_weight * np.where(both, right - left, 0)
+        total += row_weight * np.where(right_only, right - center, 0)
+        total += row_weight * np.where(left_only, center - left, 0)
+        weight += row_weight * (2 * both + right_only + left_only)
+
+    derivative = np.divide(
+        total, weight * cell_size, out=np.full_like(total, np.nan), where=weight > 0
+    )
+    return derivative.T if axis == 0 else derivative
+
+
+def relief_length_ratio(z: np.ndarray, cell_x: float, cell_y: float) -> np.ndarray:
+    """Relief-length ratio of the interior of a window padded with one halo cell.
+    NaN where the elevation is no data."""
+    dz_dx = _horn_derivative(z, 1, cell_x)
+    dz_dy = _horn_derivative(z, 0, cell_y)
+    # the gradient magnitude is the tangent of the slope, rise over run
+    ratio = np.hypot(dz_dx, dz_dy) / 1000.0
+    ratio[np.isnan(z[1:-1, 1:-1])] = np.nan
+    return ratio
+
 
 def create_relief_length_ratio_raster(
     dem_raster,
-    cell_size_sq_meters,
     context,
     feedback,
+    output=QgsProcessing.TEMPORARY_OUTPUT,
+    mask: BlockMask = None,
 ) -> str:
     """Relief-length ratio is the ratio between the vertical distance and horizontal distance along a slope.
-    This algorithm calculates the height between each cell and its neighbor using the pythagorean theorem.
-    It uses the cell slope value and cell size to calculate rise.
-    The result is divided by 1000 to yield units of m/km."""
-    slope_raster = create_slope(dem_raster, context, feedback)
-
-    input_dict = {"input_a": slope_raster, "band_a": 1}
-    cell_size_meters = math.sqrt(cell_size_sq_meters)
-
-    adjacent_expr = f"( {cell_size_meters} * tan(A * 3.14159 / 180.0) )"  # meters
-
-    expr = f"{adjacent_expr} / {cell_size_meters} / 1000.0"
-    return perform_raster_math(
-        exprs=expr,
-        input_dict=input_dict,
-        context=context,
-        feedback=feedback,
-    )["OUTPUT"]
-
-
-def create_slope(dem_raster: QgsRasterLayer, context, feedback) -> str:
-    # QGIS Native Slope
-    alg_params = {
-        "INPUT": dem_raster,
-        "Z_FACTOR": 1,
-        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-    }
-    return processing.run(
-        "native:slope",
-        alg_params,
-        context=context,
-        feedback=feedback,
-        is_child_algorithm=True,
-    )["OUTPUT"]
+    The gradient of the DEM is computed block by block with Horn's 3 x 3 stencil, the same one used by
+    the native slope algorithm, reading one cell of halo around each block.
+    The gradient magnitude (rise over run) is divided by 1000, so no slope raster in degrees is needed.
+    """
+    dem_ds = open_raster(dem_raster, context)
+    band = dem_ds.GetRasterBand(1)
+    geo_transform = dem_ds.GetGeoTransform()
+    cell_x = abs(geo_transform[1])
+    cell_y = abs(geo_transform[5])
+
+    out_path = resolve_output(output, "relief_length")
+    out_ds = create_raster_like(dem_ds, out_path)
+    out_band = out_ds.GetRasterBand(1)
+
+    if mask is not None and not mask.matches(dem_ds):
+        mask = None
+
+    windows = list(iterate_windows(dem_ds.RasterXSize, dem_ds.RasterYSize))
+    for i, (x_off, y_off, width, height) in enumerate(windows):
+        if feedback.isCanceled():
+            out_band = None
+            out_ds = None
+            gdal.GetDriverByName("GTiff").Delete(out_path)
+            raise QgsProcessingException("Processing canceled.")
+        feedback.setProgress(100 * i / len(windows))
+        if mask is not None and not mask.is_occupied(x_off, y_off):
+            continue
+        z = read_window_with_halo(band, x_off, y_off, width, height)
+        ratio = relief_length_ratio(z, cell_x, cell_y)
+        out_band.WriteArray(np.where(np.isnan(ratio), NODATA, ratio), x_off, y_off)
+
+    out_ds.FlushCache()
+    out_band = None
+    out_ds = None
+    band = None
+    dem_ds = None
+    return out_path
@@ -20,13 +20,14 @@ __copyright__ = "(C) 2022 by NOAA"
 __revision__ = "$Format:%H$"
 
 
-import os
 import math
 import datetime
 import json
 
 from pathlib import Path
 
+import numpy as np
+
 from qgis.core import (
     QgsProcessing,
     QgsProcessingMultiStepFeedback,
@@ -51,6 +52,10 @@ from QNSPECT.processing.algorithms.run_analysis.analysis_utils import (
     convert_raster_data_type_to_float,
     check_raster_values_in_lookup_table,
 )
+from QNSPECT.processing.algorithms.grid_utils import validate_input_grids
+from QNSPECT.processing.algorithms.block_utils import process_blocks
+from QNSPECT.processing.algorithms.flow_accumulation import mfd_material_transport
+from QNSPECT.processing.algorithms.stage_profiler import StageProfiler
 from QNSPECT.processing.algorithms.run_analysis.curve_number import CurveNumber
 from QNSPECT.processing.algorithms.run_analysis.relief_length_ratio import (
     create_relief_length_ratio_raster,
@@ -58,6 +63,8 @@ from QNSPECT.processing.algorithms.run_analysis.relief_length_ratio import (
 from QNSPECT.processing.algorithms.run_analysis.qnspect_run_algorithm import (
     QNSPECTRunAlgorithm,
 )
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 DEFAULT_URBAN_K_FACTOR_VALUE = 0.3
 
@@ -71,7 +78,7 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
     rFactorRaster = "RFactorRaster"
     landCoverRaster = "LandCoverRaster"
     projectLocation = "ProjectLocation"
-    mfd = False  # "MFD"
+    mfd = "MFD"
     rusle = "RUSLE"
     sedimentYieldLocal = "Sediment Local"
     sedimentYieldAccumulated = "Sediment Accumulated"
@@ -147,13 +154,11 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
                 defaultValue=True,
             )
         )
-        # param = QgsProcessingParameterBoolean(
-        #     self.mfd,
-        #     "Use Multi Flow Direction [MFD] Routing",
-        #     defaultValue=False
-        # )
-        # param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
-        # self.addParameter(param)
+        param = QgsProcessingParameterBoolean(
+            self.mfd, "Use Multi Flow Direction [MFD] Routing", defaultValue=False
+        )
+        param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(param)
 
         param = QgsProcessingParameterEnum(
             self.dualSoils,
@@ -165,6 +170,7 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         )
         param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(param)
+        self.add_zone_parameters()
         self.addParameter(
             QgsProcessingParameterFolderDestination(
                 self.projectLocation,
@@ -174,10 +180,15 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
             )
         )
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
-        feedback = QgsProcessingMultiStepFeedback(11, model_feedback)
+        zonal_out = self.zones_requested(parameters)
+        feedback = QgsProcessingMultiStepFeedback(10 + int(zonal_out), model_feedback)
+        profiler = StageProfiler(feedback)
+        profiler.start("Input Checks")
         results = {}
         outputs = {}
         run_dict = {}
@@ -192,10 +203,30 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         )
 
         cell_size_sq_meters = self.cell_size_in_sq_meters(elev_raster)
+        profiler.set_cells(elev_raster.width() * elev_raster.height())
 
         if cell_size_sq_meters is None:
             raise QgsProcessingException("Invalid Elevation Raster CRS units.")
 
+        # Check that the input rasters share one grid before any heavy stage runs
+        validate_input_grids(
+            {
+                "Elevation Raster": elev_raster,
+                "Land Cover Raster": land_cover_raster,
+                "Hydrologic Soils Group Raster": self.parameterAsRasterLayer(
+                    parameters, self.soilRaster, context
+                ),
+                "K-Factor Raster": self.parameterAsRasterLayer(
+                    parameters, self.kFactorRaster, context
+                ),
+                "R-Factor Raster": self.parameterAsRasterLayer(
+                    parameters, self.rFactorRaster, context
+                ),
+            },
+            context,
+            feedback,
+        )
+
         lookup_layer = self.extract_lookup_table(parameters, context)
 
         check_raster_values_in_lookup_table(
@@ -205,6 +236,9 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
             feedback=feedback,
         )
 
+        # Blocks outside of the watershed are skipped by all raster math of the run
+        self.create_block_mask(elev_raster, context, feedback)
+
         # Folder I/O
         project_loc = Path(
             self.parameterAsString(parameters, self.projectLocation, context)
@@ -219,6 +253,7 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Preprocessing K-Factor ...")
+        profiler.start("K-Factor Fill")
         erodability_raster = self.fill_zero_k_factor_cells(
             parameters, feedback, context
         )
@@ -228,6 +263,7 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Creating C-Factor ...")
+        profiler.start("C-Factor")
         # All final outputs that are not returned to user should be saved in outputs
         c_factor_raster = outputs["C-Factor"] = self.create_c_factor_raster(
             lookup_layer=lookup_layer,
@@ -241,6 +277,7 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Creating LS-Factor ...")
+        profiler.start("LS-Factor")
         ls_factor = outputs["LS-Factor"] = self.create_ls_factor(parameters, context)
 
         # RUSLE Soil Loss calculation
@@ -248,6 +285,7 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Performing RUSLE calculations ...")
+        profiler.start("RUSLE")
         rusle = outputs["RUSLE Soil Loss"] = self.run_rusle(
             c_factor=c_factor_raster,
             ls_factor=ls_factor,
@@ -264,11 +302,12 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Creating Relief Length Ratio ...")
+        profiler.start("Relief Length Ratio")
         rl_raster = outputs["Relief Length Ratio"] = create_relief_length_ratio_raster(
             dem_raster=elev_raster,
-            cell_size_sq_meters=cell_size_sq_meters,
             context=context,
             feedback=feedback,
+            mask=self.mask,
         )
 
         # Curve number part
@@ -276,6 +315,7 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Creating curve numbers ...")
+        profiler.start("Curve Number")
         cn = CurveNumber(
             parameters[self.landCoverRaster],
             parameters[self.soilRaster],
@@ -283,31 +323,22 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
             lookup_layer=lookup_layer,
             context=context,
             feedback=feedback,
+            mask=self.mask,
         )
         cn.generate_cn_raster()
         outputs["Curve Number"] = cn.cn_raster
 
-        # Multiply RL and CN
+        # Combine RL, CN and RUSLE
         feedback.setCurrentStep(7)
         if feedback.isCanceled():
             return {}
-        feedback.pushInfo("Performing SDR calculations ...")
-        sdr = outputs["Sediment Delivery Ratio"] = self.run_sediment_delivery_ratio(
+        feedback.pushInfo("Generating local sediments raster ...")
+        profiler.start("Sediment Local")
+        sediment_local_path = str(run_out_dir / (self.sedimentYieldLocal + ".tif"))
+        sediment_local, sediments_local_Mg = self.run_sediment_yield(
             cell_size_sq_meters=cell_size_sq_meters,
             relief_length=rl_raster,
             curve_number=cn.cn_raster,
-            context=context,
-            feedback=feedback,
-        )
-
-        ## Output results
-        feedback.setCurrentStep(8)
-        if feedback.isCanceled():
-            return {}
-        feedback.pushInfo("Generating local sediments raster ...")
-        sediment_local_path = str(run_out_dir / (self.sedimentYieldLocal + ".tif"))
-        sediment_local = self.run_sediment_yield(
-            sediment_delivery_ratio=sdr,
             rusle=rusle,
             context=context,
             feedback=feedback,
@@ -322,25 +353,17 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
                 "sediment", sediment_local_path, "Sediment Local (kg/year)", context
             )
 
-        feedback.setCurrentStep(9)
+        feedback.setCurrentStep(8)
         if feedback.isCanceled():
             return {}
 
-        # convert to Mg
         feedback.pushInfo("Generating accumulated sediments raster ...")
-        input_params = {
-            "input_a": sediment_local,
-            "band_a": "1",
-        }
-        sediments_local_Mg = perform_raster_math(
-            "(A / 1000)", input_params, context, feedback
-        )["OUTPUT"]
-
+        profiler.start("Sediment Accumulation")
         sediment_acc_path = str(run_out_dir / (self.sedimentYieldAccumulated + ".tif"))
         sediment_acc = self.run_sediment_yield_accumulated(
             sediment_yield=sediments_local_Mg,
             elev_raster=elev_raster,
-            mfd=False,  # self.parameterAsBool(parameters, self.mfd, context),
+            mfd=self.parameterAsBool(parameters, self.mfd, context),
             context=context,
             feedback=feedback,
             output=sediment_acc_path,
@@ -354,10 +377,21 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
                 "sediment", sediment_acc, "Sediment Accumulation (Mg/year)", context
             )
 
-        feedback.setCurrentStep(10)
+        if zonal_out:
+            feedback.setCurrentStep(9)
+            if feedback.isCanceled():
+                return {}
+            feedback.pushInfo("Summarizing outputs by zone ...")
+            profiler.start("Zonal Summary")
+            results[self.zonalSummary] = self.summarize_by_zone(
+                parameters, context, feedback, dict(results), str(run_out_dir)
+            )
+
+        feedback.setCurrentStep(9 + int(zonal_out))
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Creating run configuration file ...")
+        profiler.stop()
         run_dict = self.create_config_file(
             parameters=parameters,
             context=context,
@@ -366,7 +400,9 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
             lookup_layer=lookup_layer,
             elev_raster=elev_raster,
             land_cover_raster=land_cover_raster,
+            profile=profiler.as_dict(),
         )
+        profiler.report()
 
         ## Uncomment following two lines to print debugging info
         # feedback.pushCommandInfo("\n" + str(outputs))
@@ -392,6 +428,7 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
             input_dict=input_dict,
             context=context,
             feedback=feedback,
+            mask=self.mask,
         )["OUTPUT"]
 
     def create_c_factor_raster(
@@ -435,70 +472,42 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         elif raster_units == QgsUnitTypes.AreaSquareFeet:
             return area * 0.09290304
 
-    def run_sediment_delivery_ratio(
+    def run_sediment_yield(
         self,
         cell_size_sq_meters: float,
         relief_length,
         curve_number,
-        context,
-        feedback,
-    ) -> str:
-        """Runs a raster calculator using QGIS's native raster calculator class.
-        Modifies given tif names."""
-
-        # GDAL perform raster math function producing correct results but giving RuntimeWarning in power
-        # thus using qgis native raster calculator
-        # expression for GDAL Raster math 1.366 * (10**(-11)) * ((({math.sqrt(cell_size_sq_meters)} / 1000.0) ** 2) **(-0.0998)) * (A **0.3629) * (B**5.444)
-
-        relief_length_new = Path(relief_length).with_stem("relief_length").as_posix()
-        curve_number_new = Path(curve_number).with_stem("curve_number").as_posix()
-        os.rename(relief_length, relief_length_new)
-        os.rename(curve_number, curve_number_new)
-
-        expr = " * ".join(
-            [
-                "1.366",
-                "(10 ^ -11)",
-                f"({(math.sqrt(cell_size_sq_meters) / 1_000.0) ** 2} ^ -0.0998)",  # convert to sq km
-                '("relief_length@1" ^ 0.3629)',
-                '("curve_number@1" ^ 5.444)',
-            ]
-        )
-        alg_params = {
-            "EXPRESSION": expr,
-            "LAYERS": [relief_length_new, curve_number_new],
-            "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
-        }
-        return processing.run(
-            "qgis:rastercalculator",
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True,
-        )["OUTPUT"]
-
-    def run_sediment_yield(
-        self,
-        sediment_delivery_ratio,
         rusle,
         context,
         feedback,
         output,
-    ) -> str:
-        input_dict = {
-            "input_a": sediment_delivery_ratio,
-            "band_a": 1,
-            "input_b": rusle,
-            "band_b": 1,
-        }
-        exprs = "A * B * 907.18474"  # Multiply by 907.18474 to convert from ton to kg
-        return perform_raster_math(
-            exprs=exprs,
-            input_dict=input_dict,
-            context=context,
+    ) -> tuple:
+        """Compute the sediment delivery ratio (SDR) and the local sediment yield in one block-wise pass.
+        Returns the paths of the local sediment yield in kg and of the same yield in Mg,
+        which is the weight of the sediment accumulation."""
+        # SDR = 1.366 * 10^-11 * (cell area in sq km)^-0.0998 * RL^0.3629 * CN^5.444
+        area_factor = 1.366e-11 * ((math.sqrt(cell_size_sq_meters) / 1_000.0) ** 2) ** (
+            -0.0998
+        )
+
+        def sediment(arrays, valid):
+            local = np.zeros(valid.shape, dtype=np.float64)
+            relief_length = arrays["RL"][valid].astype(np.float64)
+            curve_number = arrays["CN"][valid].astype(np.float64)
+            sdr = area_factor * relief_length**0.3629 * curve_number**5.444
+            # Multiply by 907.18474 to convert from ton to kg
+            local[valid] = sdr * arrays["RUSLE"][valid] * 907.18474
+            return {"Local": local, "Mg": local / 1000}
+
+        paths = process_blocks(
+            {"RL": relief_length, "CN": curve_number, "RUSLE": rusle},
+            {"Local": output, "Mg": QgsProcessing.TEMPORARY_OUTPUT},
+            sediment,
             feedback=feedback,
-            output=output,
-        )["OUTPUT"]
+            context=context,
+            mask=self.mask,
+        )
+        return paths["Local"], paths["Mg"]
 
     def run_sediment_yield_accumulated(
         self,
@@ -509,13 +518,25 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         feedback,
         output,
     ) -> str:
+        if mfd:
+            # numpy engine, faster than the MFD routing of r.watershed it falls back to
+            # on rasters too large for the available memory
+            return mfd_material_transport(
+                elevation=elev_raster,
+                weight=sediment_yield,
+                context=context,
+                feedback=feedback,
+                output=output,
+                mask=self.mask,
+            )["OUTPUT"]
         return grass_material_transport(
             elevation=elev_raster,
             weight=sediment_yield,
             context=context,
             feedback=feedback,
             output=output,
-            mfd=mfd,
+            mfd=False,
+            mask=self.mask,
         )["OUTPUT"]
 
     def run_rusle(
@@ -548,6 +569,7 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
             context,
             feedback,
             output=QgsProcessing.TEMPORARY_OUTPUT,
+            mask=self.mask,
         )["OUTPUT"]
 
     def create_config_file(
@@ -559,6 +581,7 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         lookup_layer,
         elev_raster,
         land_cover_raster,
+        profile: dict = None,
     ) -> dict:
         """Create a config file with the name of the run in the outputs folder.
         Uses the "ero" key word to differentiate it from the results of the pollution analysis."""
@@ -577,9 +600,15 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
         ).source()
         if parameters[self.lookupTable]:
             config["Inputs"][self.lookupTable] = lookup_layer.source()
+        if parameters.get(self.zoneLayer):
+            config["Inputs"][self.zoneLayer] = self.parameterAsVectorLayer(
+                parameters, self.zoneLayer, context
+            ).source()
         config["Outputs"] = results
         config["RunTime"] = str(datetime.datetime.now())
         config["QNSPECTVersion"] = self._version
+        if profile is not None:
+            config["Profile"] = profile
         config_file = run_out_dir / f"{self.run_name}.ero.json"
         json.dump(config, config_file.open("w"), indent=4)
         return config
@@ -650,13 +679,19 @@ class RunErosionAnalysis(QNSPECTRunAlgorithm):
 
 <h2>Advanced Parameters</h2>
 
-<!--h3 >Use Multi Flow Direction [MFD] Routing</h3-->
-<!--p >By default, the Single Flow Direction [SFD] option is used for flow routing. Multi Flow Direction [MFD] routing will be utilized if this option is checked. The algorithm passes these flags to GRASS r.watershed function, which is the computational engine for accumulation calculations</p-->
+<h3>Use Multi Flow Direction [MFD] Routing</h3>
+<p>By default, the Single Flow Direction [SFD] option is used for routing the sediment accumulation, with GRASS r.watershed as the computational engine. Multi Flow Direction [MFD] routing will be utilized if this option is checked. MFD accumulation is computed by the QNSPECT flow accumulation engine, which splits the flow of each cell between its lower neighbours as r.watershed does. Flats, depressions and cells that would send flow back into a depression send all their flow along the SFD direction of r.watershed, and flow leaving the raster edge is lost, so the results differ from the r.watershed MFD routing used by Run Pollution Analysis in and below flats and depressions. The whole raster is held in memory during the accumulation, about 250 bytes per cell; if that is more than the available memory, r.watershed MFD routing is used instead and a warning is shown. The LS-Factor is always calculated with SFD routing.</p>
 
 <h3>Treat Dual Category Soils as</h3>
 <p>Certain areas can have dual soil types (A/D, B/D, or C/D). These areas possess characteristics of Hydrologic Soil Group D during undrained conditions and characteristics of Hydrologic Soil Group A/B/C for drained conditions.</p>
 <p>In this parameter, the user can specify if these areas should be treated as drained, undrained, or average of both conditions. If the average option is selected, the algorithm will use the average of drained and undrained Curve Number for Sediment Delivery Ratio calculations.</p>
 
+<h3>Summarize Outputs by Zones</h3>
+<p>Optional polygon layer, for example HUC-12 subwatersheds or parcels. If provided, all outputs of the run are summarized by zone in a single pass and saved as `{Run Name} Zonal Summary.csv` in the run folder. The `Zonal Summary` tool can do the same for an existing run.</p>
+
+<h3>Zone Field</h3>
+<p>Field identifying each zone. Required if zones are provided.</p>
+
 <h2>Outputs</h2>
 
 <h3>Folder for Run Outputs</h3>
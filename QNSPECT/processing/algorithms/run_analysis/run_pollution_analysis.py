@@ -46,6 +46,9 @@ from QNSPECT.processing.algorithms.qnspect_utils import (
     grass_material_transport,
     filter_matrix,
 )
+from QNSPECT.processing.algorithms.pixel_functions import create_derived_vrt
+from QNSPECT.processing.algorithms.grid_utils import validate_input_grids
+from QNSPECT.processing.algorithms.stage_profiler import StageProfiler
 from QNSPECT.processing.algorithms.run_analysis.analysis_utils import (
     reclassify_land_cover_raster_by_table_field,
     check_raster_values_in_lookup_table,
@@ -53,6 +56,8 @@ from QNSPECT.processing.algorithms.run_analysis.analysis_utils import (
 from QNSPECT.processing.algorithms.run_analysis.qnspect_run_algorithm import (
     QNSPECTRunAlgorithm,
 )
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
 
 
 class RunPollutionAnalysis(QNSPECTRunAlgorithm):
@@ -172,6 +177,13 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
         )
         param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(param)
+        param = QgsProcessingParameterBoolean(
+            "ConcVirtual",
+            "Write Concentration Rasters as Virtual Rasters (VRT)",
+            defaultValue=False,
+        )
+        param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(param)
         param = QgsProcessingParameterBoolean(
             "MFD", "Use Multi Flow Direction [MFD] Routing", defaultValue=False
         )
@@ -187,6 +199,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
         )
         param.setFlags(param.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(param)
+        self.add_zone_parameters()
         self.addParameter(
             QgsProcessingParameterFolderDestination(
                 "ProjectLocation",
@@ -196,6 +209,8 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
             )
         )
 
+    @streamed
+    @profiled
     def processAlgorithm(self, parameters, context, model_feedback):
         # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
         # overall progress through the model
@@ -215,6 +230,8 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
 
         mfd = self.parameterAsBool(parameters, "MFD", context)
         conc_out = self.parameterAsBool(parameters, "ConcOutputs", context)
+        conc_virtual = self.parameterAsBool(parameters, "ConcVirtual", context)
+        zonal_out = self.zones_requested(parameters)
         self.load_outputs = self.parameterAsBool(parameters, "LoadOutputs", context)
 
         self.run_name = self.parameterAsString(parameters, "RunName", context)
@@ -232,7 +249,24 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
         if conc_out:
             # additional round if concentration is returned
             total_steps += len(desired_outputs)
+        if zonal_out:
+            total_steps += 1
         feedback = QgsProcessingMultiStepFeedback(total_steps, model_feedback)
+        profiler = StageProfiler(feedback)
+        profiler.start("Input Checks")
+        profiler.set_cells(elev_raster.width() * elev_raster.height())
+
+        ## Check that the input rasters share one grid before any heavy stage runs
+        validate_input_grids(
+            {
+                "Elevation Raster": elev_raster,
+                "Land Cover Raster": lc_raster,
+                "Hydrologic Soils Group Raster": soil_raster,
+                "Precipitation Raster": precip_raster,
+            },
+            context,
+            feedback,
+        )
 
         ## Extract Lookup Table
         lookup_layer = self.extract_lookup_table(parameters, context)
@@ -258,17 +292,19 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
                 + f"Missing Pollutants:\n{[pol.lower() for pol in desired_pollutants if not pol.lower() in lookup_fields.keys()]}\n"
             )
 
-        # to do: assert all Raster CRS are same and Raster Pixel Units too
-
         # Folder I/O
         run_out_dir = os.path.join(proj_loc, self.run_name)
         os.makedirs(run_out_dir, exist_ok=True)
 
+        # Blocks outside of the watershed are skipped by all raster math of the run
+        mask = self.create_block_mask(elev_raster, context, feedback)
+
         ## Generate CN Raster
         feedback.setCurrentStep(1)
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Generating curve numbers ...")
+        profiler.start("Curve Number")
         cn = CurveNumber(
             parameters["LandCoverRaster"],
             parameters["HSGRaster"],
@@ -276,6 +312,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
             lookup_layer,
             context,
             feedback,
+            mask=mask,
         )
 
         # All final outputs that are not returned to user should be saved in outputs
@@ -293,6 +330,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Generating local runoff volume ...")
+        profiler.start("Runoff")
         runoff_vol = RunoffVolume(
             parameters["PrecipRaster"],
             outputs["CN"]["OUTPUT"],
@@ -301,6 +339,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
             raining_days,
             context,
             feedback,
+            mask=mask,
         )
         # not putting (L) in the name because special characs don't go well in file names
         # should be handled in post processor through display name
@@ -327,6 +366,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
                 return {}
             # Calculate pollutant per LU (mg/L)
             feedback.pushInfo(f"Generating {pol} raster using lookup table ...")
+            profiler.start(f"{pol} Reclass")
             outputs[pol + "_lu"] = reclassify_land_cover_raster_by_table_field(
                 parameters["LandCoverRaster"],
                 lookup_layer,
@@ -335,6 +375,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
                 feedback,
             )
             # multiply by Runoff Liters to get local effect (mg)
+            profiler.start(f"{pol} Local")
             input_params = {
                 "input_a": outputs["Runoff Local"]["OUTPUT"],
                 "band_a": "1",
@@ -347,6 +388,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
                 context,
                 feedback,
                 os.path.join(run_out_dir, f"{pol} Local.tif"),
+                mask=mask,
             )
             results[pol + " Local"] = outputs[pol + " Local"]["OUTPUT"]
             if self.load_outputs:
@@ -363,6 +405,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Generating accumulated runoff volume ...")
+        profiler.start("Runoff Accumulation")
         if "runoff" in [out.lower() for out in desired_outputs]:
             runoff_output = os.path.join(run_out_dir, f"Runoff Accumulated.tif")
 
@@ -373,6 +416,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
                 feedback,
                 mfd,
                 runoff_output,
+                mask=mask,
             )
             results["Runoff Accumulated"] = outputs["Runoff Accumulated"]["OUTPUT"]
             if self.load_outputs:
@@ -389,6 +433,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
                 context,
                 feedback,
                 mfd,
+                mask=mask,
             )
 
         # Accumulated Pollutants
@@ -400,6 +445,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
 
             # convert local pollutants to kg
             feedback.pushInfo(f"Generating {pol} accumulated raster ...")
+            profiler.start(f"{pol} Accumulation")
             input_params = {
                 "input_a": outputs[pol + " Local"]["OUTPUT"],
                 "band_a": "1",
@@ -409,6 +455,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
                 input_params,
                 context,
                 feedback,
+                mask=mask,
             )
 
             # Accumulated Pollutant (kg)
@@ -419,6 +466,7 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
                 feedback,
                 mfd,
                 os.path.join(run_out_dir, f"{pol} Accumulated.tif"),
+                mask=mask,
             )
 
             results[pol + " Accumulated"] = outputs[pol + " Accumulated"]["OUTPUT"]
@@ -439,19 +487,34 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
                     return {}
                 # Concentration Pollutant (mg/L)
                 feedback.pushInfo(f"Generating {pol} concentration raster ...")
-                input_params = {
-                    "input_a": outputs[pol + " Accumulated"]["OUTPUT"],
-                    "band_a": "1",
-                    "input_b": outputs["Runoff Accumulated"]["OUTPUT"],
-                    "band_b": "1",
-                }
-                outputs[pol + " Concentration"] = perform_raster_math(
-                    "numpy.divide(A, B, out=numpy.zeros_like(A), where=(B!=0)) * 1e6",  # Convert kg back to mg
-                    input_params,
-                    context,
-                    feedback,
-                    os.path.join(run_out_dir, f"{pol} Concentration.tif"),
-                )
+                profiler.start(f"{pol} Concentration")
+                if conc_virtual:
+                    # computed from the accumulated rasters whenever it is read
+                    outputs[pol + " Concentration"] = {
+                        "OUTPUT": create_derived_vrt(
+                            os.path.join(run_out_dir, f"{pol} Concentration.vrt"),
+                            [
+                                outputs[pol + " Accumulated"]["OUTPUT"],
+                                outputs["Runoff Accumulated"]["OUTPUT"],
+                            ],
+                            "concentration",
+                        )
+                    }
+                else:
+                    input_params = {
+                        "input_a": outputs[pol + " Accumulated"]["OUTPUT"],
+                        "band_a": "1",
+                        "input_b": outputs["Runoff Accumulated"]["OUTPUT"],
+                        "band_b": "1",
+                    }
+                    outputs[pol + " Concentration"] = perform_raster_math(
+                        "numpy.divide(A, B, out=numpy.zeros_like(A), where=(B!=0)) * 1e6",  # Convert kg back to mg
+                        input_params,
+                        context,
+                        feedback,
+                        os.path.join(run_out_dir, f"{pol} Concentration.tif"),
+                        mask=mask,
+                    )
                 results[pol + " Concentration"] = outputs[pol + " Concentration"][
                     "OUTPUT"
                 ]
@@ -463,11 +526,24 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
                         context,
                     )
 
+        # Zonal Summary
+        if zonal_out:
+            feedback.setCurrentStep(current_step)
+            current_step += 1
+            if feedback.isCanceled():
+                return {}
+            feedback.pushInfo("Summarizing outputs by zone ...")
+            profiler.start("Zonal Summary")
+            results[self.zonalSummary] = self.summarize_by_zone(
+                parameters, context, feedback, dict(results), run_out_dir
+            )
+
         # Configuration file
         feedback.setCurrentStep(current_step)
         if feedback.isCanceled():
             return {}
         feedback.pushInfo("Creating run configuration file ...")
+        profiler.stop()
         run_dict["Inputs"] = parameters
         run_dict["Inputs"]["ElevationRaster"] = elev_raster.source()
         run_dict["Inputs"]["LandCoverRaster"] = lc_raster.source()
@@ -475,11 +551,17 @@ class RunPollutionAnalysis(QNSPECTRunAlgorithm):
         run_dict["Inputs"]["HSGRaster"] = soil_raster.source()
         if parameters["LookupTable"]:
             run_dict["Inputs"]["LookupTable"] = lookup_layer.source()
+        if parameters.get(self.zoneLayer):
+            run_dict["Inputs"][self.zoneLayer] = self.parameterAsVectorLayer(
+                parameters, self.zoneLayer, context
+            ).source()
         run_dict["Outputs"] = results
         run_dict["RunTime"] = str(datetime.now())
+        run_dict["Profile"] = profiler.as_dict()
         run_dict["QNSPECTVersion"] = self._version
         with open(os.path.join(run_out_dir, f"{self.run_name}.pol.json"), "w") as f:
             f.write(dumps(run_dict, indent=4))
+        profiler.report()
 
         ## Uncomment following two lines to print debugging info
         # feedback.pushCommandInfo("\n"+ str(outputs))
@@ -532,11 +614,17 @@ To exclude an output from the analysis, write N in the Output column. You must c
 <h2>Advanced Parameters</h2>
 <h3>Output Concentration Raster</h3>
 <p>The concentration raster will only be outputted if the Output Concentration Raster option is checked in Advanced Parameters. Default is unchecked.</p>
+<h3>Write Concentration Rasters as Virtual Rasters (VRT)</h3>
+<p>If checked, concentration rasters are saved as small virtual rasters (`.vrt`) that compute the concentration from the accumulated pollutant and runoff rasters whenever they are read, instead of writing a full raster for every pollutant. The virtual rasters can only be read in QGIS with the QNSPECT plugin loaded. Default is unchecked.</p>
 <h3>Use Multi Flow Direction [MFD] Routing</h3>
-<p>By default, the Single Flow Direction [SFD] option is used for flow routing. Multi Flow Direction [MFD] routing will be utilized for the whole analysis if this option is checked. The algorithm passes these flags to GRASS `r.watershed` function, which is the computational engine for runoff direction and accumulation calculations.</p>
+<p>By default, the Single Flow Direction [SFD] option is used for flow routing. Multi Flow Direction [MFD] routing will be utilized for the whole analysis if this option is checked. The algorithm passes these flags to GRASS `r.watershed` function, which is the computational engine for runoff direction and accumulation calculations. Run Erosion Analysis computes its MFD accumulation with the QNSPECT flow accumulation engine instead, which routes flats and depressions along the SFD directions, so the MFD results of the two analyses differ in and below flats and depressions.</p>
 <h3>Treat Dual Category Soils as</h3>
 <p>Certain areas can have dual soil types (A/D, B/D, or C/D). These areas possess characteristics of Hydrologic Soil Group D during undrained conditions and characterstics of Hydrologic Soil Group A/B/C for drained conditions.</p>
 <p>In this parameter, user can specify if these areas should be treated as drained, undrained, or average of both conditions. If the average option is selected, the algorithm will use the average of drained and undrained Curve Number for runoff estimations.</p>
+<h3>Summarize Outputs by Zones</h3>
+<p>Optional polygon layer, for example HUC-12 subwatersheds or parcels. If provided, all outputs of the run are summarized by zone in a single pass and saved as `{Run Name} Zonal Summary.csv` in the run folder. The `Zonal Summary` tool can do the same for an existing run.</p>
+<h3>Zone Field</h3>
+<p>Field identifying each zone. Required if zones are provided.</p>
 <h2>Outputs</h2>
 <h3>Folder for Run Outputs</h3>
 <p>The algorithm outputs and configuration file will be saved in this directory in a separate folder.</p>
@@ -30,6 +30,7 @@ from qgis.core import (
 )
 
 from QNSPECT.processing.algorithms.qnspect_utils import perform_raster_math
+from QNSPECT.processing.algorithms.block_utils import BlockMask
 
 
 class RunoffVolume:
@@ -44,6 +45,7 @@ class RunoffVolume:
         raining_days: int,
         context: QgsProcessingContext,
         feedback: QgsProcessingMultiStepFeedback,
+        mask: BlockMask = None,
     ):
         self.precip_raster = precip_raster
         self.cn_raster = cn_raster
@@ -52,6 +54,7 @@ class RunoffVolume:
         self.raining_days = raining_days
         self.context = context
         self.feedback = feedback
+        self.mask = mask
         self.outputs = {}
 
     def preprocess_precipitation(self) -> None:
@@ -65,6 +68,7 @@ class RunoffVolume:
                 input_params,
                 self.context,
                 self.feedback,
+                mask=self.mask,
             )
             self.precip_raster_in = self.outputs["P"]["OUTPUT"]
         else:
@@ -83,6 +87,7 @@ class RunoffVolume:
             input_params,
             self.context,
             self.feedback,
+            mask=self.mask,
         )
 
     def calculate_Q(self, output=QgsProcessing.TEMPORARY_OUTPUT) -> dict:
@@ -118,6 +123,7 @@ class RunoffVolume:
             input_params,
             self.context,
             self.feedback,
+            mask=self.mask,
         )
 
         input_params = {
@@ -136,6 +142,7 @@ class RunoffVolume:
             input_params,
             self.context,
             self.feedback,
+            mask=self.mask,
         )
 
         input_params = {
@@ -151,6 +158,7 @@ class RunoffVolume:
             input_params,
             self.context,
             self.feedback,
+            mask=self.mask,
             output=output,
         )
 
@@ -0,0 +1,199 @@
+"""
+Store the stage instrumentation used by the QNSPECT run algorithms.
+Each stage records wall time, CPU time, growth of the peak memory, bytes read and written, and temporary
+files created, so the Profile section of a run file shows where the time of a run went.
+Stages are also sent to the event stream of the run, if there is one.
+"""
+
+import os
+import time
+
+from qgis.core import QgsProcessingUtils
+
+from QNSPECT.processing.event_stream import current_stream
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def _peak_rss_mb() -> dict:
+    """Peak resident memory of QGIS and of its finished child processes (GRASS, GDAL) in MB"""
+    if resource is not None:
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        scale = 1 / 1024 if os.uname().sysname != "Darwin" else 1 / 1024**2
+        return {
+            "Self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            "Children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+        }
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        # peak_wset is the Windows peak working set
+        return {"Self": getattr(info, "peak_wset", info.rss) / 1024**2}
+    return {}
+
+
+def _io_bytes() -> tuple:
+    """Bytes read and written by the process so far, None if unknown"""
+    if psutil is not None:
+        try:
+            counters = psutil.Process().io_counters()
+            return counters.read_bytes, counters.write_bytes
+        except (AttributeError, psutil.Error):
+            pass
+    try:
+        with open("/proc/self/io") as f:
+            values = dict(line.split(": ") for line in f.read().splitlines())
+        return int(values["read_bytes"]), int(values["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _temp_entries() -> set:
+    """Names of the entries of the processing temporary folder.
+    Each temporary output is created in a new subfolder, so only the top level is listed."""
+    try:
+        with os.scandir(QgsProcessingUtils.tempFolder()) as entries:
+            return {entry.name for entry in entries}
+    except OSError:
+        return set()
+
+
+def _temp_files(names) -> tuple:
+    """Number and total size of the files in the given entries of the processing temporary folder"""
+    folder = QgsProcessingUtils.tempFolder()
+    count = size = 0
+    for name in names:
+        path = os.path.join(folder, name)
+        if os.path.isfile(path):
+            paths = [path]
+        else:
+            paths = [
+                os.path.join(root, file_name)
+                for root, _, files in os.walk(path)
+                for file_name in files
+            ]
+        for path in paths:
+            try:
+                size += os.path.getsize(path)
+                count += 1
+            except OSError:
+                continue
+    return count, size
+
+
+def _snapshot() -> dict:
+    children = os.times()
+    return {
+        "wall": time.perf_counter(),
+        "cpu": time.process_time(),
+        "children_cpu": children.children_user + children.children_system,
+        "io": _io_bytes(),
+        "peak_rss": _peak_rss_mb(),
+        "temp": _temp_entries(),
+    }
+
+
+class StageProfiler:
+    """Times consecutive stages of a run. Starting a stage ends the previous one.
+
+    profiler = StageProfiler(feedback)
+    profiler.start("Curve Number")
+    ...
+    profiler.start("Runoff")
+    ...
+    profiler.stop()
+    run_dict["Profile"] = profiler.as_dict()
+    """
+
+    def __init__(self, feedback=None):
+        self.feedback = feedback
+        self.stages = {}
+        self.cells = None
+        self._current = None
+        self._start = None
+        self._run_start = _snapshot()
+
+    def set_cells(self, cells: int) -> None:
+        """Number of cells processed by the run, for throughput and ETA estimates"""
+        self.cells = cells
+        stream = current_stream()
+        if stream is not None:
+            stream.set_cells(cells)
+
+    def start(self, name: str) -> None:
+        self.stop()
+        self._current = name
+        self._start = _snapshot()
+        stream = current_stream()
+        if stream is not None:
+            stream.stage(name)
+
+    def stop(self) -> None:
+        if self._current is None:
+            return
+        end = _snapshot()
+        stage = {
+            "WallSeconds": round(end["wall"] - self._start["wall"], 3),
+            "CPUSeconds": round(end["cpu"] - self._start["cpu"], 3),
+            "ChildCPUSeconds": round(
+                end["children_cpu"] - self._start["children_cpu"], 3
+            ),
+            # ru_maxrss and the peak working set only grow, so a stage can only report
+            # how much it raised the peak of the process
+            "PeakRSSGrowthMB": {
+                key: round(value - self._start["peak_rss"].get(key, 0), 1)
+                for key, value in end["peak_rss"].items()
+            },
+        }
+        stage["TempFilesCreated"], stage["TempBytesWritten"] = _temp_files(
+            end["temp"] - self._start["temp"]
+        )
+        if end["io"] is not None and self._start["io"] is not None:
+            stage["BytesRead"] = end["io"][0] - self._start["io"][0]
+            stage["BytesWritten"] = end["io"][1] - self._start["io"][1]
+        self.stages[self._current] = stage
+        stream = current_stream()
+        if stream is not None:
+            stream.end_stage()
+        if self.feedback is not None:
+            self.feedback.pushDebugInfo(
+                f"{self._current}: {stage['WallSeconds']} s wall, {stage['CPUSeconds']} s CPU, {stage['ChildCPUSeconds']} s child process CPU"
+            )
+        self._current = None
+
+    def as_dict(self) -> dict:
+        self.stop()
+        profile = {
+            "TotalWallSeconds": round(time.perf_counter() - self._run_start["wall"], 3),
+            "PeakRSSMB": {
+                key: round(value, 1) for key, value in _peak_rss_mb().items()
+            },
+            "Stages": self.stages,
+        }
+        if self.cells is not None:
+            profile["Cells"] = self.cells
+        return profile
+
+    def report(self) -> None:
+        """Push a table of the stages sorted by wall time to the feedback log"""
+        if self.feedback is None:
+            return
+        profile = self.as_dict()
+        total = profile["TotalWallSeconds"] or 1
+        lines = [f"Run profile ({profile['TotalWallSeconds']} s):"]
+        for name, stage in sorted(
+            self.stages.items(), key=lambda item: -item[1]["WallSeconds"]
+        ):
+            lines.append(
+                f"  {name}: {stage['WallSeconds']} s ({100 * stage['WallSeconds'] / total:.0f}%), "
+                f"CPU {stage['CPUSeconds']} s, child CPU {stage['ChildCPUSeconds']} s, "
+                f"{stage['TempFilesCreated']} temp files"
+            )
+        self.feedback.pushInfo("\n".join(lines))
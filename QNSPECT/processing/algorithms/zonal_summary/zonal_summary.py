@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = "NOAA"
+__date__ = "2026-10-18"
+__copyright__ = "(C) 2026 by NOAA"
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = "$Format:%H$"
+
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingMultiStepFeedback,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterVectorLayer,
+    QgsProcessingParameterField,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingException,
+)
+
+from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithms.qnspect_utils import (
+    load_run_file,
+    run_output_rasters,
+)
+from QNSPECT.processing.algorithms.zonal_summary.zonal_utils import (
+    rasterize_zones,
+    summarize_zones,
+    write_zonal_summary,
+)
+from QNSPECT.processing.algorithm_profiler import profiled
+from QNSPECT.processing.event_stream import streamed
+
+
+class ZonalSummary(QNSPECTAlgorithm):
+    runFile = "RunFile"
+    zoneLayer = "ZoneLayer"
+    zoneField = "ZoneField"
+    output = "Output"
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.runFile,
+                "Run File",
+                behavior=QgsProcessingParameterFile.File,
+                fileFilter="QNSPECT Files (*pol.json *ero.json)",
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.zoneLayer,
+                "Zones",
+                types=[QgsProcessing.TypeVectorPolygon],
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.zoneField,
+                "Zone Field",
+                type=QgsProcessingParameterField.Any,
+                parentLayerParameterName=self.zoneLayer,
+                allowMultiple=False,
+                defaultValue=None,
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.output,
+                "Zonal Summary",
+                fileFilter="CSV files (*.csv)",
+                createByDefault=True,
+                defaultValue=None,
+            )
+        )
+
+    @streamed
+    @profiled
+    def processAlgorithm(self, parameters, context, model_feedback):
+        # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
+        # overall progress through the model
+        feedback = QgsProcessingMultiStepFeedback(2, model_feedback)
+        results = {}
+
+        run_file = self.parameterAsString(parameters, self.runFile, context)
+        rasters = run_output_rasters(load_run_file(run_file), run_file)
+        if not rasters:
+            raise QgsProcessingException(
+                "The run file does not list any raster outputs."
+            )
+
+        zone_layer = self.parameterAsVectorLayer(parameters, self.zoneLayer, context)
+        zone_field = self.parameterAsString(parameters, self.zoneField, context)
+        output = self.parameterAsFileOutput(parameters, self.output, context)
+
+        feedback.pushInfo("Rasterizing zones ...")
+        label_raster, label_zones = rasterize_zones(
+            zone_layer, zone_field, next(iter(rasters.values())), context, feedback
+        )
+
+        feedback.setCurrentStep(1)
+        if feedback.isCanceled():
+            return {}
+        feedback.pushInfo(f"Summarizing {len(rasters)} outputs by zone ...")
+        summaries = summarize_zones(label_raster, label_zones, rasters, feedback)
+
+        results[self.output] = write_zonal_summary(summaries, zone_field, output)
+        return results
+
+    def name(self):
+        return "zonal_summary"
+
+    def displayName(self):
+        return self.tr("Zonal Summary")
+
+    def group(self):
+        return self.tr("Analysis")
+
+    def groupId(self):
+        return "analysis"
+
+    def createInstance(self):
+        return ZonalSummary()
+
+    def shortHelpString(self):
+        return """<html><body>
+<h2>Algorithm Description</h2>
+
+<p>The `Zonal Summary` algorithm summarizes all raster outputs of a `Run Pollution Analysis` or `Run Erosion Analysis` run by zone, for example by HUC-12 subwatershed or parcel.
+The zones are rasterized once on the grid of the run outputs and all outputs are then summarized in a single pass.</p>
+
+<h2>Input Parameters</h2>
+
+<h3>Run File</h3>
+<p>JSON file created by the `Run Pollution Analysis` or `Run Erosion Analysis` algorithms. The file must have the extension `.pol.json` for a pollution analysis and `.ero.json` for an erosion analysis.</p>
+
+<h3>Zones</h3>
+<p>Polygon layer with the zones to summarize by. The layer is reprojected to the CRS of the run outputs if needed.</p>
+
+<h3>Zone Field</h3>
+<p>Field identifying each zone. Polygons sharing the same value are summarized together.</p>
+
+<h2>Outputs</h2>
+
+<h3>Zonal Summary</h3>
+<p>CSV file with one row per zone. For every output raster it lists the number of cells, and the sum, mean and maximum of the cell values in the zone. For accumulated outputs, the maximum is the value at the most downstream cell of the zone, which includes the load from upstream areas.</p>
+
+</body></html>"""
@@ -0,0 +1,208 @@
+"""
+Store functions that summarize run outputs by zone polygons
+"""
+
+import csv
+
+import numpy as np
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingUtils,
+    QgsProcessingException,
+    NULL,
+)
+import processing
+
+from QNSPECT.processing.algorithms.block_utils import (
+    open_raster,
+    iterate_windows,
+    valid_data,
+)
+
+ZONE_LABEL_FIELD = "__zone__"
+
+
+def rasterize_zones(zone_layer, zone_field: str, ref_raster, context, feedback):
+    """Burn the zone polygons once into an integer label grid aligned to the reference raster.
+    Returns the label raster and a list mapping each label (list index) to its zone value.
+    """
+    ref_layer = open_raster(ref_raster, context)
+    x_size, y_size = ref_layer.RasterXSize, ref_layer.RasterYSize
+    transform = ref_layer.GetGeoTransform()
+    ref_layer = None
+
+    # Reproject so the labels can be burnt directly on the reference grid
+    alg_params = {
+        "INPUT": zone_layer,
+        "OPERATION": "",
+        "TARGET_CRS": ref_raster,
+        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+    }
+    reprojected = processing.run(
+        "native:reprojectlayer",
+        alg_params,
+        context=context,
+        feedback=feedback,
+        is_child_algorithm=True,
+    )["OUTPUT"]
+
+    # Label every feature with its row number; zones with several features are merged when summarizing
+    alg_params = {
+        "FIELD_LENGTH": 10,
+        "FIELD_NAME": ZONE_LABEL_FIELD,
+        "FIELD_PRECISION": 0,
+        "FIELD_TYPE": 1,
+        "FORMULA": "@row_number",
+        "INPUT": reprojected,
+        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+    }
+    labelled = processing.run(
+        "native:fieldcalculator",
+        alg_params,
+        context=context,
+        feedback=feedback,
+        is_child_algorithm=True,
+    )["OUTPUT"]
+
+    labelled_layer = QgsProcessingUtils.mapLayerFromString(labelled, context)
+    label_zones = [None] * (labelled_layer.featureCount() + 1)
+    for feat in labelled_layer.getFeatures():
+        zone = feat[zone_field]
+        label_zones[feat[ZONE_LABEL_FIELD]] = None if zone == NULL else zone
+
+    xmin = transform[0]
+    ymax = transform[3]
+    xmax = xmin + x_size * transform[1]
+    ymin = ymax + y_size * transform[5]
+    alg_params = {
+        "BURN": 0,
+        "DATA_TYPE": 4,  # Int32
+        "EXTENT": f"{xmin},{xmax},{ymin},{ymax}",
+        "EXTRA": "",
+        "FIELD": ZONE_LABEL_FIELD,
+        "HEIGHT": abs(transform[5]),
+        "INIT": 0,
+        "INPUT": labelled,
+        "INVERT": False,
+        "NODATA": 0,
+        "OPTIONS": "",
+        "UNITS": 1,
+        "WIDTH": transform[1],
+        "OUTPUT": QgsProcessing.TEMPORARY_OUTPUT,
+    }
+    label_raster = processing.run(
+        "gdal:rasterize",
+        alg_params,
+        context=context,
+        feedback=feedback,
+        is_child_algorithm=True,
+    )["OUTPUT"]
+
+    return label_raster, label_zones
+
+
+def summarize_zones(
+    label_raster, label_zones: list, rasters: dict, feedback, context=None
+) -> list:
+    """Reduce all rasters by zone in one blocked pass over the label grid.
+    Sums, counts and maxima are accumulated per label with bincount style operations
+    and merged per zone value at the end. Returns one dict per zone.
+    If the feedback is canceled, QgsProcessingException is raised."""
+    n_labels = len(label_zones)
+    label_ds = open_raster(label_raster, context)
+    label_band = label_ds.GetRasterBand(1)
+
+    bands = {}
+    nodata_values = {}
+    datasets = {}
+    for name, raster in rasters.items():
+        datasets[name] = open_raster(raster, context)
+        if (datasets[name].RasterXSize, datasets[name].RasterYSize) != (
+            label_ds.RasterXSize,
+            label_ds.RasterYSize,
+        ):
+            raise QgsProcessingException(
+                f"{name} is not on the same grid as the zone labels."
+            )
+        bands[name] = datasets[name].GetRasterBand(1)
+        nodata_values[name] = bands[name].GetNoDataValue()
+
+    sums = {name: np.zeros(n_labels) for name in rasters}
+    counts = {name: np.zeros(n_labels, dtype=np.int64) for name in rasters}
+    maxima = {name: np.full(n_labels, -np.inf) for name in rasters}
+
+    windows = list(iterate_windows(label_ds.RasterXSize, label_ds.RasterYSize))
+    for i, (x_off, y_off, width, height) in enumerate(windows):
+        if feedback.isCanceled():
+            raise QgsProcessingException("Processing canceled.")
+        feedback.setProgress(100 * i / len(windows))
+
+        labels = label_band.ReadAsArray(x_off, y_off, width, height)
+        in_zone = labels > 0
+        if not in_zone.any():
+            continue
+        for name, band in bands.items():
+            values = band.ReadAsArray(x_off, y_off, width, height)
+            valid = in_zone & valid_data(values, nodata_values[name])
+            zone_labels = labels[valid]
+            zone_values = values[valid].astype(np.float64)
+            sums[name] += np.bincount(
+                zone_labels, weights=zone_values, minlength=n_labels
+            )
+            counts[name] += np.bincount(zone_labels, minlength=n_labels)
+            np.maximum.at(maxima[name], zone_labels, zone_values)
+
+    # merge labels of features that belong to the same zone
+    rows = {}
+    for label in range(1, n_labels):
+        zone = label_zones[label]
+        row = rows.setdefault(zone, {"sums": {}, "counts": {}, "maxima": {}})
+        for name in rasters:
+            row["sums"][name] = row["sums"].get(name, 0.0) + sums[name][label]
+            row["counts"][name] = row["counts"].get(name, 0) + counts[name][label]
+            row["maxima"][name] = max(
+                row["maxima"].get(name, -np.inf), maxima[name][label]
+            )
+
+    summaries = []
+    for zone, row in rows.items():
+        summary = {"Zone": zone}
+        for name in rasters:
+            count = int(row["counts"][name])
+            summary[f"{name} Cells"] = count
+            summary[f"{name} Sum"] = float(row["sums"][name]) if count else None
+            summary[f"{name} Mean"] = (
+                float(row["sums"][name]) / count if count else None
+            )
+            summary[f"{name} Max"] = float(row["maxima"][name]) if count else None
+        summaries.append(summary)
+    return summaries
+
+
+def write_zonal_summary(summaries: list, zone_field: str, output_path) -> str:
+    """Write the zonal summaries to a CSV file with the zone field as first column"""
+    fieldnames = [zone_field]
+    if summaries:
+        fieldnames += [key for key in summaries[0] if key != "Zone"]
+    with open(output_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for summary in summaries:
+            row = dict(summary)
+            row[zone_field] = row.pop("Zone")
+            writer.writerow(row)
+    return str(output_path)
+
+
+def summarize_run_outputs_by_zone(
+    zone_layer, zone_field: str, rasters: dict, output_path, context, feedback
+) -> str:
+    """Rasterize the zones once on the grid of the run outputs and summarize all outputs in one pass"""
+    ref_raster = next(iter(rasters.values()))
+    label_raster, label_zones = rasterize_zones(
+        zone_layer, zone_field, ref_raster, context, feedback
+    )
+    if feedback.isCanceled():
+        raise QgsProcessingException("Processing canceled.")
+    summaries = summarize_zones(label_raster, label_zones, rasters, feedback, context)
+    return write_zonal_summary(summaries, zone_field, output_path)
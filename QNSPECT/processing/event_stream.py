@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+__author__ = "NOAA"
+__date__ = "2026-10-18"
+__copyright__ = "(C) 2021 by NOAA"
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = "$Format:%H$"
+
+import functools
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from qgis.core import QgsApplication
+
+EVENT_STREAM_ENV = "QNSPECT_EVENT_STREAM"
+EVENT_HISTORY_ENV = "QNSPECT_EVENT_HISTORY"
+
+# runs of each algorithm kept in the history used for the ETA
+HISTORY_RUNS = 20
+# progress events are sent at most this often unless a whole percent is passed
+PROGRESS_INTERVAL_SECONDS = 5
+
+_state = threading.local()
+
+
+def current_stream():
+    """Event stream of the algorithm running in this thread, None if events are off"""
+    return getattr(_state, "stream", None)
+
+
+def history_path() -> str:
+    return os.environ.get(EVENT_HISTORY_ENV) or os.path.join(
+        QgsApplication.qgisSettingsDirPath(), "qnspect", "run_history.json"
+    )
+
+
+def load_history(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class EtaEstimator:
+    """Remaining time of a run from the stage times of previous runs of the same algorithm,
+    scaled linearly to the number of cells. Without a history the remaining time is
+    extrapolated from the progress."""
+
+    def __init__(self, records: list, cells: int = None):
+        self.expected = {}
+        if cells:
+            # prefer the runs on a similar data size
+            similar = [
+                record
+                for record in records
+                if record.get("Cells") and 0.5 <= cells / record["Cells"] <= 2
+            ]
+            records = similar or [record for record in records if record.get("Cells")]
+        stage_seconds = {}
+        for record in records:
+            scale = cells / record["Cells"] if cells and record.get("Cells") else 1
+            for stage, seconds in record["Stages"].items():
+                stage_seconds.setdefault(stage, []).append(seconds * scale)
+        self.expected = {
+            stage: statistics.median(seconds)
+            for stage, seconds in stage_seconds.items()
+        }
+
+    def eta(
+        self,
+        elapsed: float,
+        progress: float,
+        done_stages: list,
+        current_stage: str = None,
+        stage_elapsed: float = 0,
+    ):
+        if self.expected:
+            remaining = sum(
+                seconds
+                for stage, seconds in self.expected.items()
+                if stage not in done_stages and stage != current_stage
+            )
+            if current_stage is not None:
+                remaining += max(self.expected.get(current_stage, 0) - stage_elapsed, 0)
+            return round(remaining, 1)
+        if progress > 0:
+            return round(elapsed * (100 - progress) / progress, 1)
+        return None
+
+
+class EventStream:
+    """JSON lines events of an algorithm run, appended to a file or sent to a
+    tcp://host:port or udp://host:port socket"""
+
+    def __init__(self, target: str, algorithm_id: str, feedback=None):
+        self.algorithm_id = algorithm_id
+        self.feedback = feedback
+        self.run_id = uuid.uuid4().hex
+        self.cells = None
+        self.progress = 0.0
+        self.stages = {}
+        self.current_stage = None
+        self._stage_start = None
+        self._start = time.perf_counter()
+        self._last_progress_event = 0.0
+        self._lock = threading.Lock()
+        self._estimator = None
+        self._file = None
+        self._socket = None
+        if target.startswith(("tcp://", "udp://")):
+            host, port = target[6:].rsplit(":", 1)
+            if target.startswith("tcp://"):
+                self._socket = socket.create_connection((host, int(port)), timeout=5)
+            else:
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._socket.connect((host, int(port)))
+        else:
+            self._file = open(target, "a", encoding="utf-8")
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def estimator(self) -> EtaEstimator:
+        if self._estimator is None:
+            records = load_history(history_path()).get(self.algorithm_id, [])
+            self._estimator = EtaEstimator(records, self.cells)
+        return self._estimator
+
+    def eta(self):
+        stage_elapsed = (
+            time.perf_counter() - self._stage_start if self._stage_start else 0
+        )
+        return self.estimator().eta(
+            self.elapsed,
+            self.progress,
+            list(self.stages),
+            self.current_stage,
+            stage_elapsed,
+        )
+
+    def emit(self, event: str, **fields) -> None:
+        record = {
+            "Event": event,
+            "Run": self.run_id,
+            "Algorithm": self.algorithm_id,
+            "Time": datetime.now().isoformat(timespec="milliseconds"),
+            "Elapsed": round(self.elapsed, 3),
+            "Progress": round(self.progress, 1),
+            "Stage": self.current_stage,
+            "Step": len(self.stages) + int(self.current_stage is not None),
+            "Cells": self.cells,
+            "CellsProcessed": (
+                round(self.cells * self.progress / 100) if self.cells else None
+            ),
+            "ETASeconds": self.eta(),
+            **fields,
+        }
+        line = json.dumps(record) + "\n"
+        try:
+            with self._lock:
+                if self._file is not None:
+                    self._file.write(line)
+                    self._file.flush()
+                else:
+                    self._socket.sendall(line.encode("utf-8"))
+        except OSError as e:
+            # monitoring must never stop a run
+            if self.feedback is not None:
+                self.feedback.reportError(f"Event stream failed: {e}")
+            self.close()
+            self._file = None
+            self._socket = None
+            self.emit = lambda *args, **kwargs: None
+
+    def set_cells(self, cells: int) -> None:
+        self.cells = cells
+        self._estimator = None
+
+    def stage(self, name: str) -> None:
+        """Close the current stage and start a new one"""
+        self.end_stage()
+        self.current_stage = name
+        self._stage_start = time.perf_counter()
+        self.emit("stage")
+
+    def end_stage(self) -> None:
+        if self.current_stage is None:
+            return
+        self.stages[self.current_stage] = time.perf_counter() - self._stage_start
+        self.current_stage = None
+        self._stage_start = None
+
+    def on_progress(self, progress: float) -> None:
+        previous = self.progress
+        self.progress = progress
+        if (
+            int(progress) > int(previous)
+            or time.perf_counter() - self._last_progress_event
+            > PROGRESS_INTERVAL_SECONDS
+        ):
+            self._last_progress_event = time.perf_counter()
+            self.emit("progress")
+
+    def record_history(self) -> None:
+        """Add the stage times of a successful run to the history of the ETA estimator"""
+        path = history_path()
+        history = load_history(path)
+        runs = history.setdefault(self.algorithm_id, [])
+        runs.append(
+            {
+                "Cells": self.cells,
+                "Seconds": round(self.elapsed, 3),
+                "Stages": {name: round(s, 3) for name, s in self.stages.items()},
+            }
+        )
+        del runs[:-HISTORY_RUNS]
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(history, f)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        if self._socket is not None:
+            self._socket.close()
+
+
+def streamed(process_algorithm):
+    """Wrap processAlgorithm to send started, stage, progress and finished or failed events
+    to the target of the QNSPECT_EVENT_STREAM environment variable"""
+
+    @functools.wraps(process_algorithm)
+    def wrapper(self, parameters, context, feedback):
+        target = os.environ.get(EVENT_STREAM_ENV)
+        if not target or current_stream() is not None:
+            return process_algorithm(self, parameters, context, feedback)
+        try:
+            stream = EventStream(target, self.id(), feedback)
+        except (OSError, ValueError) as e:
+            feedback.reportError(f"Unable to open the event stream {target}: {e}")
+            return process_algorithm(self, parameters, context, feedback)
+
+        _state.stream = stream
+        feedback.progressChanged.connect(stream.on_progress)
+        stream.emit("started")
+        try:
+            results = process_algorithm(self, parameters, context, feedback)
+        except Exception as e:
+            stream.end_stage()
+            stream.emit("failed", Error=str(e))
+            raise
+        else:
+            stream.end_stage()
+            if feedback.isCanceled():
+                stream.emit("canceled")
+            else:
+                stream.emit("finished", ETASeconds=0)
+                if stream.stages:
+                    stream.record_history()
+            return results
+        finally:
+            feedback.progressChanged.disconnect(stream.on_progress)
+            _state.stream = None
+            stream.close()
+
+    return wrapper
@@ -41,6 +41,11 @@ from qgis.core import QgsProcessingAlgorithm
 class QNSPECTAlgorithm(QgsProcessingAlgorithm):
     """
     Base class for QNSPECT Algorithms
+
+    processAlgorithm of the algorithms is decorated with profiled and streamed: when the
+    QNSPECT_PROFILE environment variable is set, it runs under cProfile or pyinstrument and the
+    profile is written next to the outputs. When the QNSPECT_EVENT_STREAM environment variable
+    is set, the run sends JSON lines events to it.
     """
 
     _version = "0.0.1"
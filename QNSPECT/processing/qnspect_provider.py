@@ -38,6 +38,7 @@ from qgis.core import QgsProcessingProvider
 
 from QNSPECT.processing import algorithms
 from QNSPECT.processing.qnspect_algorithm import QNSPECTAlgorithm
+from QNSPECT.processing.algorithms.pixel_functions import enable_pixel_functions
 
 
 class QNSPECTProvider(QgsProcessingProvider):
@@ -58,6 +59,8 @@ class QNSPECTProvider(QgsProcessingProvider):
         """
         Loads all algorithms belonging to this provider.
         """
+        # derived VRT outputs (ex: concentration) are read through QNSPECT pixel functions
+        enable_pixel_functions()
 
         alg_classes = [
             m[1]
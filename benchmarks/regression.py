@@ -0,0 +1,230 @@
+"""
+Benchmark history and performance regression gate.
+
+Results of benchmarks.run_benchmarks are recorded per commit in a SQLite history, and a new
+result file is compared with a baseline commit per stage and raster size. A stage regresses when
+its median time is slower than the baseline median by more than the relative threshold and by more
+than the noise of the samples (median absolute deviation), so single noisy repetitions do not fail
+the gate. A stage that ran on the baseline but fails now is also a regression.
+
+    python -m benchmarks.regression record results.json
+    python -m benchmarks.regression compare results.json --baseline <commit>
+
+compare exits with 1 if a regression was found, so it can gate a release or a CI job.
+"""
+
+import argparse
+import json
+import sqlite3
+import statistics
+import sys
+from pathlib import Path
+
+DEFAULT_HISTORY = Path(__file__).parent / "history.sqlite"
+
+# consistent estimate of the standard deviation from the median absolute deviation
+MAD_SCALE = 1.4826
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    git_commit TEXT,
+    timestamp TEXT,
+    environment TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER REFERENCES runs(id) ON DELETE CASCADE,
+    stage TEXT,
+    size INTEGER,
+    cells INTEGER,
+    status TEXT,
+    median_seconds REAL,
+    samples TEXT
+);
+CREATE INDEX IF NOT EXISTS results_stage_size ON results(stage, size);
+"""
+
+
+def connect(path=DEFAULT_HISTORY) -> sqlite3.Connection:
+    connection = sqlite3.connect(str(path))
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def record(connection: sqlite3.Connection, report: dict) -> int:
+    """Store a benchmark report, returns the id of the run"""
+    environment = report.get("Environment", {})
+    cursor = connection.execute(
+        "INSERT INTO runs (git_commit, timestamp, environment) VALUES (?, ?, ?)",
+        (
+            environment.get("Commit"),
+            environment.get("Timestamp"),
+            json.dumps(environment),
+        ),
+    )
+    run_id = cursor.lastrowid
+    connection.executemany(
+        "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                run_id,
+                result["Stage"],
+                result["Size"],
+                result.get("Cells"),
+                result["Status"],
+                result.get("MedianSeconds"),
+                json.dumps(result.get("Seconds", [])),
+            )
+            for result in report["Results"]
+        ],
+    )
+    connection.commit()
+    return run_id
+
+
+def latest_commit(connection: sqlite3.Connection, exclude: str = None) -> str:
+    """Most recently recorded commit other than exclude"""
+    row = connection.execute(
+        "SELECT git_commit FROM runs WHERE git_commit IS NOT ? ORDER BY id DESC LIMIT 1",
+        (exclude,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def baseline_samples(connection: sqlite3.Connection, commit: str) -> dict:
+    """Successful samples of every recorded run of a commit, pooled per (stage, size).
+    A commit may be abbreviated."""
+    rows = connection.execute(
+        """SELECT stage, size, samples FROM results JOIN runs ON runs.id = results.run_id
+        WHERE runs.git_commit LIKE ? AND status = 'ok'""",
+        (f"{commit}%",),
+    ).fetchall()
+    samples = {}
+    for stage, size, values in rows:
+        samples.setdefault((stage, size), []).extend(json.loads(values))
+    return samples
+
+
+def noise(samples: list) -> float:
+    """Robust standard deviation of the samples"""
+    if len(samples) < 2:
+        return 0.0
+    median = statistics.median(samples)
+    return MAD_SCALE * statistics.median(abs(sample - median) for sample in samples)
+
+
+def compare(
+    report: dict,
+    baseline: dict,
+    threshold: float = 0.1,
+    noise_factor: float = 3.0,
+    min_seconds: float = 0.05,
+) -> list:
+    """Compare each result of a report with the baseline samples of its stage and size.
+
+    A result regresses when its median is more than threshold (relative) and more than
+    noise_factor times the combined noise of both sample sets slower than the baseline median.
+    Differences under min_seconds are ignored. Returns one row per result."""
+    rows = []
+    for result in report["Results"]:
+        key = (result["Stage"], result["Size"])
+        row = {"Stage": key[0], "Size": key[1], "Status": "new"}
+        rows.append(row)
+        base = baseline.get(key)
+        if not base:
+            continue
+        base_median = statistics.median(base)
+        row["BaselineSeconds"] = round(base_median, 4)
+        if result["Status"] != "ok":
+            row["Status"] = "regression"
+            row["Reason"] = result.get("Error", "failed")
+            continue
+        samples = result["Seconds"]
+        median = statistics.median(samples)
+        change = median - base_median
+        tolerance = max(
+            threshold * base_median,
+            noise_factor * (noise(base) ** 2 + noise(samples) ** 2) ** 0.5,
+            min_seconds,
+        )
+        row.update(
+            Seconds=round(median, 4),
+            Change=round(change / base_median * 100, 1) if base_median else None,
+            ToleranceSeconds=round(tolerance, 4),
+        )
+        if change > tolerance:
+            row["Status"] = "regression"
+        elif -change > tolerance:
+            row["Status"] = "improvement"
+        else:
+            row["Status"] = "unchanged"
+    return rows
+
+
+def format_table(rows: list) -> str:
+    header = f"{'Stage':<24}{'Size':>8}{'Baseline s':>12}{'Now s':>10}{'Change %':>10}  Status"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['Stage']:<24}{row['Size']:>8}"
+            f"{row.get('BaselineSeconds', ''):>12}{row.get('Seconds', ''):>10}"
+            f"{row.get('Change', ''):>10}  {row['Status']}"
+            + (f" ({row['Reason']})" if "Reason" in row else "")
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--history", default=str(DEFAULT_HISTORY), help="SQLite file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="store a result file")
+    record_parser.add_argument("results")
+
+    compare_parser = commands.add_parser("compare", help="compare a result file")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument(
+        "--baseline", help="commit to compare with, the latest other commit by default"
+    )
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser.add_argument("--noise-factor", type=float, default=3.0)
+    compare_parser.add_argument("--min-seconds", type=float, default=0.05)
+    compare_parser.add_argument(
+        "--record", action="store_true", help="store the result file after comparing"
+    )
+    compare_parser.add_argument("--json", help="write the comparison to this JSON file")
+    args = parser.parse_args(argv)
+
+    report = json.loads(Path(args.results).read_text())
+    connection = connect(args.history)
+    if args.command == "record":
+        record(connection, report)
+        return 0
+
+    commit = args.baseline or latest_commit(
+        connection, report.get("Environment", {}).get("Commit")
+    )
+    if commit is None:
+        print("No baseline recorded in the history.", file=sys.stderr)
+        return 2
+    baseline = baseline_samples(connection, commit)
+    if not baseline:
+        print(f"No successful results recorded for {commit}.", file=sys.stderr)
+        return 2
+    rows = compare(
+        report, baseline, args.threshold, args.noise_factor, args.min_seconds
+    )
+    print(f"Baseline: {commit}")
+    print(format_table(rows))
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps({"Baseline": commit, "Results": rows}, indent=4)
+        )
+    if args.record:
+        record(connection, report)
+    return int(any(row["Status"] == "regression" for row in rows))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
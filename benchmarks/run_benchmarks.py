@@ -0,0 +1,367 @@
+"""
+Stage and algorithm benchmarks of QNSPECT on synthetic datasets.
+
+Every public stage (CurveNumber, RunoffVolume, create_relief_length_ratio_raster,
+grass_material_transport, mfd_material_transport, compare_rasters, AlignRasters) and the full
+Run Pollution and Run Erosion analyses are timed on synthetic datasets of each requested size.
+The accumulation is timed with r.watershed SFD and MFD routing and with the numpy MFD engine, and
+the erosion run with SFD and MFD routing, to show the cost of MFD. The results are written as
+JSON so they can be tracked between commits with benchmarks.regression.
+
+Run with the Python of a QGIS install (GRASS is needed for the accumulation stages):
+
+    python -m benchmarks.run_benchmarks --sizes 1024 4096 --repeat 3 --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.synthetic import COEFFICIENTS_DIR, generate_dataset  # noqa: E402
+
+STAGES = (
+    "CurveNumber",
+    "RunoffVolume",
+    "ReliefLengthRatio",
+    "MaterialTransport",
+    "MaterialTransportMFD",
+    "MFDAccumulation",
+    "CompareRasters",
+    "AlignRasters",
+    "RunPollutionAnalysis",
+    "RunErosionAnalysis",
+    "RunErosionAnalysisMFD",
+)
+
+_QGIS_APP = None
+
+
+def start_qgis():
+    """Start a headless QGIS once, with the processing framework and the QNSPECT provider"""
+    global _QGIS_APP
+    if _QGIS_APP is not None:
+        return _QGIS_APP
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from qgis.core import QgsApplication
+
+    _QGIS_APP = QgsApplication([], False)
+    _QGIS_APP.initQgis()
+    from processing.core.Processing import Processing
+
+    Processing.initialize()
+    registry = QgsApplication.processingRegistry()
+    if registry.providerById("grass") is None:
+        try:
+            from grassprovider.grass_provider import GrassProvider
+
+            registry.addProvider(GrassProvider())
+        except ImportError:
+            pass
+    from QNSPECT.processing.qnspect_provider import QNSPECTProvider
+
+    registry.addProvider(QNSPECTProvider())
+    return _QGIS_APP
+
+
+def environment() -> dict:
+    """Description of the code and machine the benchmarks ran on"""
+    from osgeo import gdal
+    from qgis.core import Qgis
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "Commit": commit,
+        "Timestamp": datetime.now().isoformat(timespec="seconds"),
+        "QGIS": Qgis.version(),
+        "GDAL": gdal.__version__,
+        "Python": platform.python_version(),
+        "Platform": platform.platform(),
+        "CPUs": os.cpu_count(),
+    }
+
+
+class StageRunner:
+    """Prepares the inputs of each stage once per dataset and times the stage itself"""
+
+    def __init__(self, dataset: dict, work_dir: Path):
+        from qgis.core import (
+            QgsProcessingContext,
+            QgsProcessingFeedback,
+            QgsRasterLayer,
+            QgsVectorLayer,
+        )
+
+        self.dataset = dataset
+        self.work_dir = work_dir
+        self.context = QgsProcessingContext()
+        self.feedback = QgsProcessingFeedback()
+        self.elevation = QgsRasterLayer(dataset["elevation"], "elevation")
+        self.lookup_layer = QgsVectorLayer(
+            f"file:///{COEFFICIENTS_DIR / 'NLCD.csv'}?delimiter=,",
+            "Land Cover Lookup Table",
+            "delimitedtext",
+        )
+        self._cn_raster = None
+        self._run = 0
+
+    def output_dir(self, name: str) -> Path:
+        self._run += 1
+        path = self.work_dir / f"{name}_{self._run}"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def cn_raster(self) -> str:
+        if self._cn_raster is None:
+            self._cn_raster = self.curve_number()
+        return self._cn_raster
+
+    def curve_number(self) -> str:
+        from QNSPECT.processing.algorithms.run_analysis.curve_number import CurveNumber
+
+        cn = CurveNumber(
+            self.dataset["land_cover"],
+            self.dataset["hsg"],
+            0,
+            self.lookup_layer,
+            self.context,
+            self.feedback,
+        )
+        return cn.generate_cn_raster()["OUTPUT"]
+
+    def setup(self, stage: str) -> None:
+        """Untimed preparation of the inputs of a stage"""
+        if stage == "RunoffVolume":
+            self.cn_raster()
+
+    def run(self, stage: str):
+        if stage == "CurveNumber":
+            return self.curve_number()
+        if stage == "RunoffVolume":
+            from QNSPECT.processing.algorithms.run_analysis.runoff_volume import (
+                RunoffVolume,
+            )
+
+            return RunoffVolume(
+                self.dataset["precipitation"],
+                self.cn_raster(),
+                self.elevation,
+                0,
+                1,
+                self.context,
+                self.feedback,
+            ).calculate_Q()
+        if stage == "ReliefLengthRatio":
+            from QNSPECT.processing.algorithms.run_analysis.relief_length_ratio import (
+                create_relief_length_ratio_raster,
+            )
+
+            return create_relief_length_ratio_raster(
+                self.elevation, self.context, self.feedback
+            )
+        if stage in ["MaterialTransport", "MaterialTransportMFD"]:
+            from QNSPECT.processing.algorithms.qnspect_utils import (
+                grass_material_transport,
+            )
+
+            return grass_material_transport(
+                self.dataset["elevation"],
+                self.dataset["precipitation"],
+                self.context,
+                self.feedback,
+                mfd=stage == "MaterialTransportMFD",
+            )
+        if stage == "MFDAccumulation":
+            from QNSPECT.processing.algorithms.flow_accumulation import (
+                mfd_material_transport,
+            )
+
+            return mfd_material_transport(
+                self.dataset["elevation"],
+                self.dataset["precipitation"],
+                self.context,
+                self.feedback,
+            )
+        if stage == "CompareRasters":
+            from QNSPECT.processing.algorithms.compare_scenarios.comparison_utils import (
+                compare_rasters,
+            )
+
+            out_dir = self.output_dir(stage)
+            return compare_rasters(
+                self.dataset["precipitation"],
+                self.dataset["r_factor"],
+                str(out_dir / "direct.tif"),
+                str(out_dir / "percent.tif"),
+                self.feedback,
+            )
+        return self.run_algorithm(stage)
+
+    def run_algorithm(self, stage: str):
+        import processing
+
+        out_dir = self.output_dir(stage)
+        if stage == "AlignRasters":
+            return processing.run(
+                "qnspect:align_rasters",
+                {
+                    "ReferenceRaster": self.dataset["elevation"],
+                    "RastersToAlign": [
+                        self.dataset["land_cover"],
+                        self.dataset["hsg"],
+                        self.dataset["precipitation"],
+                    ],
+                    "ResamplingMethod": 0,
+                    "LoadOutputs": False,
+                    "OutputDirectory": str(out_dir),
+                },
+                context=self.context,
+                feedback=self.feedback,
+            )
+        common = {
+            "RunName": "benchmark",
+            "LandCoverRaster": self.dataset["land_cover"],
+            "LandCoverType": 2,  # NLCD
+            "LookupTable": None,
+            "ElevationRaster": self.dataset["elevation"],
+            "HSGRaster": self.dataset["hsg"],
+            "DualSoils": 0,
+            "LoadOutputs": False,
+            "ProjectLocation": str(out_dir),
+        }
+        if stage == "RunPollutionAnalysis":
+            return processing.run(
+                "qnspect:run_pollution_analysis",
+                {
+                    **common,
+                    "PrecipRaster": self.dataset["precipitation"],
+                    "PrecipUnits": 0,
+                    "RainingDays": 1,
+                    "PollutantOutputs": [
+                        "Runoff",
+                        "Y",
+                        "Nitrogen",
+                        "Y",
+                        "Phosphorus",
+                        "Y",
+                        "TSS",
+                        "Y",
+                    ],
+                    "ConcOutputs": False,
+                    "MFD": False,
+                },
+                context=self.context,
+                feedback=self.feedback,
+            )
+        if stage in ["RunErosionAnalysis", "RunErosionAnalysisMFD"]:
+            return processing.run(
+                "qnspect:run_erosion_analysis",
+                {
+                    **common,
+                    "KFactorRaster": self.dataset["k_factor"],
+                    "RFactorRaster": self.dataset["r_factor"],
+                    "MFD": stage == "RunErosionAnalysisMFD",
+                },
+                context=self.context,
+                feedback=self.feedback,
+            )
+        raise ValueError(f"Unknown stage {stage}")
+
+
+def benchmark_stage(runner: StageRunner, stage: str, size: int, repeat: int) -> dict:
+    """Time repeat runs of a stage. Failures are recorded instead of stopping the suite."""
+    result = {"Stage": stage, "Size": size, "Cells": size * size, "Repeat": repeat}
+    try:
+        runner.setup(stage)
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            runner.run(stage)
+            samples.append(time.perf_counter() - start)
+    except (
+        Exception
+    ) as e:  # noqa: BLE001 - a failing stage must not stop the other benchmarks
+        result.update(
+            Status="failed",
+            Error=f"{type(e).__name__}: {e}",
+            Traceback=traceback.format_exc(),
+        )
+        return result
+    median = statistics.median(samples)
+    result.update(
+        Status="ok",
+        Seconds=[round(sample, 4) for sample in samples],
+        MedianSeconds=round(median, 4),
+        CellsPerSecond=round(size * size / median) if median else None,
+    )
+    return result
+
+
+def run_benchmarks(
+    sizes: list,
+    stages: list = STAGES,
+    repeat: int = 3,
+    data_dir: Path = None,
+    seed: int = 0,
+    log=print,
+) -> dict:
+    start_qgis()
+    data_dir = Path(data_dir or Path(tempfile.gettempdir()) / "qnspect-benchmarks")
+    results = []
+    for size in sizes:
+        log(f"Generating {size} x {size} dataset ...")
+        dataset = generate_dataset(data_dir / f"{size}", size, seed=seed)
+        with tempfile.TemporaryDirectory(prefix="qnspect-bench-") as work_dir:
+            runner = StageRunner(dataset, Path(work_dir))
+            for stage in stages:
+                result = benchmark_stage(runner, stage, size, repeat)
+                log(
+                    f"{stage} [{size}]: "
+                    + (
+                        f"{result['MedianSeconds']} s median, {result['CellsPerSecond']} cells/s"
+                        if result["Status"] == "ok"
+                        else result["Error"]
+                    )
+                )
+                results.append(result)
+    return {"Environment": environment(), "Results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="folder where synthetic datasets are cached")
+    parser.add_argument("--output", required=True, help="JSON results file")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        args.sizes, args.stages, args.repeat, args.data_dir, args.seed
+    )
+    Path(args.output).write_text(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Scaling study of Run Pollution Analysis and Run Erosion Analysis.
+
+Each algorithm is run on synthetic datasets over a grid of raster sizes and worker counts. A worker
+is an independent run in its own QGIS process, as a batch of scenarios would run on one node, and
+the GDAL thread pool is shared evenly between the workers of a batch. Per stage, the Profile
+section of the run files gives the wall time, growth of the memory high-water mark and temporary
+disk use, which are reported with the throughput in cells per second. The Total rows report the
+memory high-water mark of the runs:
+
+    python -m benchmarks.scaling --sizes 1024 2048 4096 --workers 1 2 4 --output scaling.json --plots plots
+
+Plots need matplotlib. The study shows where a stage stops scaling linearly with the raster size
+(cells per second falls as the size grows) and how well concurrent runs share a node (the
+efficiency is the batch throughput divided by the workers times the throughput of one worker).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.synthetic import generate_dataset  # noqa: E402
+
+ALGORITHMS = {
+    "pollution": ("RunPollutionAnalysis", "pol.json"),
+    "erosion": ("RunErosionAnalysis", "ero.json"),
+}
+
+
+def run_child(dataset_dir: str, algorithm: str, project_dir: str, output: str) -> None:
+    """Run one algorithm in this process and write the Profile of its run file to output"""
+    from benchmarks.run_benchmarks import StageRunner, start_qgis
+
+    start_qgis()
+    dataset = json.loads((Path(dataset_dir) / "paths.json").read_text())
+    stage, suffix = ALGORITHMS[algorithm]
+    start = time.perf_counter()
+    StageRunner(dataset, Path(project_dir)).run(stage)
+    wall = time.perf_counter() - start
+    run_file = next(Path(project_dir).glob(f"**/*.{suffix}"))
+    profile = json.loads(run_file.read_text()).get("Profile", {})
+    Path(output).write_text(json.dumps({"WallSeconds": wall, "Profile": profile}))
+
+
+def run_batch(dataset_dir: Path, algorithm: str, workers: int, work_dir: Path) -> dict:
+    """Run workers concurrent child processes and collect their profiles"""
+    env = dict(os.environ)
+    env["GDAL_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // workers))
+    processes = []
+    start = time.perf_counter()
+    for i in range(workers):
+        project_dir = work_dir / f"{algorithm}_{workers}_{i}"
+        project_dir.mkdir(parents=True)
+        output = project_dir / "child.json"
+        command = [
+            sys.executable,
+            "-m",
+            "benchmarks.scaling",
+            "child",
+            str(dataset_dir),
+            algorithm,
+            str(project_dir),
+            str(output),
+        ]
+        processes.append(
+            (
+                subprocess.Popen(
+                    command, cwd=REPO_ROOT, env=env, stderr=subprocess.PIPE
+                ),
+                output,
+            )
+        )
+    children = []
+    errors = []
+    for process, output in processes:
+        _, stderr = process.communicate()
+        if process.returncode == 0:
+            children.append(json.loads(output.read_text()))
+        else:
+            errors.append(stderr.decode(errors="replace").strip().splitlines()[-1:])
+    return {
+        "BatchWallSeconds": time.perf_counter() - start,
+        "Children": children,
+        "Errors": errors,
+    }
+
+
+def summarize(batch: dict, algorithm: str, size: int, workers: int) -> list:
+    """Rows of the scaling table: the whole run and each of its stages"""
+    cells = size * size
+    base = {"Algorithm": algorithm, "Size": size, "Cells": cells, "Workers": workers}
+    if not batch["Children"]:
+        return [
+            {**base, "Stage": "Total", "Status": "failed", "Errors": batch["Errors"]}
+        ]
+
+    def peak_mb(profile: dict) -> float:
+        return sum(profile.get("PeakRSSMB", {}).values())
+
+    rows = [
+        {
+            **base,
+            "Stage": "Total",
+            "Status": "ok" if not batch["Errors"] else "partial",
+            "WallSeconds": round(batch["BatchWallSeconds"], 3),
+            # all workers processed the same number of cells
+            "CellsPerSecond": round(
+                cells * len(batch["Children"]) / batch["BatchWallSeconds"]
+            ),
+            # concurrent workers add up on the node
+            "PeakMemoryMB": round(
+                sum(peak_mb(child["Profile"]) for child in batch["Children"]), 1
+            ),
+            "TempBytes": sum(
+                sum(
+                    stage["TempBytesWritten"]
+                    for stage in child["Profile"]["Stages"].values()
+                )
+                for child in batch["Children"]
+            ),
+        }
+    ]
+    stage_names = batch["Children"][0]["Profile"]["Stages"]
+    for name in stage_names:
+        stages = [
+            child["Profile"]["Stages"][name]
+            for child in batch["Children"]
+            if name in child["Profile"]["Stages"]
+        ]
+        wall = statistics.median(stage["WallSeconds"] for stage in stages)
+        rows.append(
+            {
+                **base,
+                "Stage": name,
+                "Status": "ok",
+                "WallSeconds": round(wall, 3),
+                "CellsPerSecond": round(cells / wall) if wall else None,
+                "PeakMemoryGrowthMB": round(
+                    max(sum(stage["PeakRSSGrowthMB"].values()) for stage in stages), 1
+                ),
+                "TempBytes": round(
+                    statistics.median(stage["TempBytesWritten"] for stage in stages)
+                ),
+            }
+        )
+    return rows
+
+
+def add_efficiency(rows: list) -> None:
+    """Batch throughput relative to workers times the single worker throughput"""
+    single = {
+        (row["Algorithm"], row["Size"]): row["CellsPerSecond"]
+        for row in rows
+        if row["Stage"] == "Total" and row["Workers"] == 1 and row.get("CellsPerSecond")
+    }
+    for row in rows:
+        key = (row["Algorithm"], row["Size"])
+        if row["Stage"] == "Total" and row.get("CellsPerSecond") and key in single:
+            row["Efficiency"] = round(
+                row["CellsPerSecond"] / (row["Workers"] * single[key]), 2
+            )
+
+
+def format_table(rows: list) -> str:
+    header = (
+        f"{'Algorithm':<10}{'Stage':<28}{'Size':>7}{'Workers':>8}{'Seconds':>10}"
+        f"{'Cells/s':>12}{'Peak MB':>10}{'+Peak MB':>10}{'Temp MB':>10}{'Eff.':>6}"
+    )
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        if row["Status"] == "failed":
+            lines.append(
+                f"{row['Algorithm']:<10}{row['Stage']:<28}{row['Size']:>7}{row['Workers']:>8}  failed"
+            )
+            continue
+        lines.append(
+            f"{row['Algorithm']:<10}{row['Stage'][:27]:<28}{row['Size']:>7}{row['Workers']:>8}"
+            f"{row['WallSeconds']:>10}{row['CellsPerSecond'] or '':>12}"
+            f"{row.get('PeakMemoryMB', ''):>10}{row.get('PeakMemoryGrowthMB', ''):>10}"
+            f"{row['TempBytes'] / 1024 ** 2:>10.1f}{row.get('Efficiency', ''):>6}"
+        )
+    return "\n".join(lines)
+
+
+def plot(rows: list, plot_dir: Path) -> list:
+    """Throughput plots per algorithm, if matplotlib is available"""
+    try:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed, no plots were made.", file=sys.stderr)
+        return []
+    plot_dir.mkdir(parents=True, exist_ok=True)
+    ok = [
+        row for row in rows if row["Status"] != "failed" and row.get("CellsPerSecond")
+    ]
+    paths = []
+    for algorithm in sorted({row["Algorithm"] for row in ok}):
+        rows_alg = [row for row in ok if row["Algorithm"] == algorithm]
+        fig, (by_workers, by_stage) = plt.subplots(1, 2, figsize=(13, 5))
+        for workers in sorted({row["Workers"] for row in rows_alg}):
+            points = sorted(
+                (row["Cells"], row["CellsPerSecond"])
+                for row in rows_alg
+                if row["Stage"] == "Total" and row["Workers"] == workers
+            )
+            by_workers.plot(*zip(*points), marker="o", label=f"{workers} workers")
+        by_workers.set_title(f"{algorithm}: node throughput")
+        min_workers = min(row["Workers"] for row in rows_alg)
+        for stage in dict.fromkeys(
+            row["Stage"] for row in rows_alg if row["Stage"] != "Total"
+        ):
+            points = sorted(
+                (row["Cells"], row["CellsPerSecond"])
+                for row in rows_alg
+                if row["Stage"] == stage and row["Workers"] == min_workers
+            )
+            by_stage.plot(*zip(*points), marker=".", label=stage)
+        by_stage.set_title(f"{algorithm}: stage throughput ({min_workers} workers)")
+        for axis in (by_workers, by_stage):
+            axis.set_xscale("log")
+            axis.set_yscale("log")
+            axis.set_xlabel("cells")
+            axis.set_ylabel("cells / s")
+            axis.legend(fontsize="small")
+        fig.tight_layout()
+        path = plot_dir / f"scaling_{algorithm}.png"
+        fig.savefig(path, dpi=120)
+        plt.close(fig)
+        paths.append(str(path))
+    return paths
+
+
+def run_study(
+    sizes: list,
+    workers: list,
+    algorithms: list,
+    data_dir: Path = None,
+    seed: int = 0,
+    log=print,
+) -> list:
+    data_dir = Path(data_dir or Path(tempfile.gettempdir()) / "qnspect-benchmarks")
+    rows = []
+    for size in sizes:
+        dataset_dir = data_dir / f"{size}"
+        log(f"Generating {size} x {size} dataset ...")
+        paths = generate_dataset(dataset_dir, size, seed=seed)
+        (dataset_dir / "paths.json").write_text(json.dumps(paths))
+        for algorithm in algorithms:
+            for count in workers:
+                log(f"{algorithm} [{size}] with {count} workers ...")
+                with tempfile.TemporaryDirectory(prefix="qnspect-scaling-") as work_dir:
+                    batch = run_batch(dataset_dir, algorithm, count, Path(work_dir))
+                rows.extend(summarize(batch, algorithm, size, count))
+    add_efficiency(rows)
+    return rows
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "child":
+        run_child(*argv[1:])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--algorithms", nargs="+", choices=list(ALGORITHMS), default=list(ALGORITHMS)
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="folder where synthetic datasets are cached")
+    parser.add_argument("--output", help="JSON file of the table rows")
+    parser.add_argument("--plots", help="folder for throughput plots")
+    args = parser.parse_args(argv)
+
+    rows = run_study(
+        args.sizes, args.workers, args.algorithms, args.data_dir, args.seed
+    )
+    print(format_table(rows))
+    if args.output:
+        Path(args.output).write_text(json.dumps(rows, indent=4))
+    if args.plots:
+        for path in plot(rows, Path(args.plots)):
+            print(f"Plot written to {path}")
+
+
+if __name__ == "__main__":
+    main()
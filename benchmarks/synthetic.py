@@ -0,0 +1,260 @@
+"""
+Synthetic input rasters for the QNSPECT benchmarks.
+
+All rasters of a dataset share one grid (UTM zone 18N, 30 m cells by default) and are generated
+window by window from seeded lattice noise, so sizes up to 20k x 20k cells can be written without
+holding a full raster in memory, and the same seed always gives the same dataset:
+
+- elevation: fractal noise on a valley that drains to the bottom edge
+- land cover: patches of the land cover codes of resources/coefficients/<NLCD|C-CAP>.csv
+- HSG: patches of the hydrologic soil group codes 1 to 9, including the dual classes
+- precipitation (inches), K-Factor and R-Factor: smooth fields in realistic ranges
+
+    python -m benchmarks.synthetic --size 2048 --output /tmp/qnspect-bench
+"""
+
+import argparse
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+from osgeo import gdal, osr
+
+BLOCK_SIZE = 512
+NODATA = -999999
+COEFFICIENTS_DIR = Path(__file__).parents[1] / "QNSPECT" / "resources" / "coefficients"
+
+# share of each HSG code: A, B, C, D, A/D, B/D, C/D, W, Null
+HSG_WEIGHTS = {
+    1: 0.15,
+    2: 0.3,
+    3: 0.2,
+    4: 0.15,
+    5: 0.05,
+    6: 0.05,
+    7: 0.04,
+    8: 0.03,
+    9: 0.03,
+}
+
+DATASET_RASTERS = (
+    "elevation",
+    "land_cover",
+    "hsg",
+    "precipitation",
+    "k_factor",
+    "r_factor",
+)
+
+
+class LatticeNoise:
+    """Fractal value noise: the sum of octaves of bilinearly interpolated random lattices.
+    Values are in [0, 1) and any window can be evaluated independently."""
+
+    def __init__(
+        self,
+        x_size: int,
+        y_size: int,
+        seed: int,
+        base_period: int = 1024,
+        octaves: int = 6,
+        persistence: float = 0.5,
+        min_period: int = 16,
+    ):
+        rng = np.random.default_rng(seed)
+        self.layers = []
+        period = base_period
+        amplitude = 1.0
+        for _ in range(octaves):
+            if period < min_period:
+                break
+            lattice = rng.random((y_size // period + 2, x_size // period + 2))
+            self.layers.append((period, amplitude, lattice))
+            period //= 2
+            amplitude *= persistence
+        self.total_amplitude = sum(layer[1] for layer in self.layers)
+
+    @staticmethod
+    def _axis(start: int, count: int, period: int) -> tuple:
+        position = np.arange(start, start + count) / period
+        index = np.floor(position).astype(np.int64)
+        fraction = position - index
+        return index, fraction * fraction * (3 - 2 * fraction)  # smoothstep
+
+    def window(self, x_off: int, y_off: int, width: int, height: int) -> np.ndarray:
+        values = np.zeros((height, width))
+        for period, amplitude, lattice in self.layers:
+            ix, tx = self._axis(x_off, width, period)
+            iy, ty = self._axis(y_off, height, period)
+            iy = iy[:, None]
+            ty = ty[:, None]
+            top = lattice[iy, ix] * (1 - tx) + lattice[iy, ix + 1] * tx
+            bottom = lattice[iy + 1, ix] * (1 - tx) + lattice[iy + 1, ix + 1] * tx
+            values += amplitude * (top * (1 - ty) + bottom * ty)
+        return values / self.total_amplitude
+
+
+def categorize(values: np.ndarray, codes: list, weights: list) -> np.ndarray:
+    """Map noise values to codes with approximately the given shares"""
+    # lattice noise is roughly normal around 0.5, so spread it before cutting by cumulative weight
+    spread = np.clip((values - 0.5) * 2.5 + 0.5, 0, 1 - 1e-9)
+    cuts = np.cumsum(weights) / np.sum(weights)
+    return np.asarray(codes)[np.searchsorted(cuts, spread, side="right")]
+
+
+def land_cover_codes(land_cover_type: str = "NLCD") -> list:
+    """Land cover codes of a default lookup table that produce runoff"""
+    with (COEFFICIENTS_DIR / f"{land_cover_type}.csv").open(newline="") as f:
+        return [
+            int(row["lc_value"])
+            for row in csv.DictReader(f)
+            if float(row["cn_b"]) > 0 or row["lc_name"].lower().startswith("water")
+        ]
+
+
+def _create(path: Path, size: int, cell_size: float, data_type: int, nodata):
+    ds = gdal.GetDriverByName("GTiff").Create(
+        str(path),
+        size,
+        size,
+        1,
+        data_type,
+        options=[
+            "TILED=YES",
+            f"BLOCKXSIZE={BLOCK_SIZE}",
+            f"BLOCKYSIZE={BLOCK_SIZE}",
+            "COMPRESS=DEFLATE",
+            "BIGTIFF=IF_SAFER",
+        ],
+    )
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(26918)
+    ds.SetProjection(srs.ExportToWkt())
+    ds.SetGeoTransform(
+        (500000.0, cell_size, 0, 4500000.0 + size * cell_size, 0, -cell_size)
+    )
+    if nodata is not None:
+        ds.GetRasterBand(1).SetNoDataValue(nodata)
+    return ds
+
+
+def generate_dataset(
+    output_dir,
+    size: int,
+    seed: int = 0,
+    land_cover_type: str = "NLCD",
+    cell_size: float = 30.0,
+    overwrite: bool = False,
+) -> dict:
+    """Write a square synthetic dataset of size x size cells to output_dir.
+    Returns the paths keyed by raster name. An existing dataset with the same settings is reused.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    settings = {
+        "size": size,
+        "seed": seed,
+        "land_cover_type": land_cover_type,
+        "cell_size": cell_size,
+    }
+    paths = {name: output_dir / f"{name}.tif" for name in DATASET_RASTERS}
+    manifest = output_dir / "dataset.json"
+    if (
+        not overwrite
+        and manifest.exists()
+        and json.loads(manifest.read_text()) == settings
+        and all(path.exists() for path in paths.values())
+    ):
+        return {name: str(path) for name, path in paths.items()}
+
+    codes = land_cover_codes(land_cover_type)
+    noise = {
+        name: LatticeNoise(size, size, seed * 100 + i, base_period=period)
+        for i, (name, period) in enumerate(
+            [
+                ("elevation", 1024),
+                ("land_cover", 256),
+                ("hsg", 512),
+                ("precipitation", 2048),
+                ("k_factor", 512),
+                ("r_factor", 2048),
+            ]
+        )
+    }
+    datasets = {
+        "elevation": _create(
+            paths["elevation"], size, cell_size, gdal.GDT_Float32, NODATA
+        ),
+        "land_cover": _create(
+            paths["land_cover"], size, cell_size, gdal.GDT_Byte, None
+        ),
+        "hsg": _create(paths["hsg"], size, cell_size, gdal.GDT_Byte, 255),
+        "precipitation": _create(
+            paths["precipitation"], size, cell_size, gdal.GDT_Float32, NODATA
+        ),
+        "k_factor": _create(
+            paths["k_factor"], size, cell_size, gdal.GDT_Float32, NODATA
+        ),
+        "r_factor": _create(
+            paths["r_factor"], size, cell_size, gdal.GDT_Float32, NODATA
+        ),
+    }
+
+    relief = 0.02 * cell_size * size**0.5  # m of noise relief
+    for y_off in range(0, size, BLOCK_SIZE):
+        height = min(BLOCK_SIZE, size - y_off)
+        for x_off in range(0, size, BLOCK_SIZE):
+            width = min(BLOCK_SIZE, size - x_off)
+            window = (x_off, y_off, width, height)
+            cols = np.arange(x_off, x_off + width)[None, :]
+            rows = np.arange(y_off, y_off + height)[:, None]
+            # valley along the middle column falling towards the last row
+            valley = 0.05 * cell_size * np.abs(cols - size / 2) + 0.01 * cell_size * (
+                size - rows
+            )
+            blocks = {
+                "elevation": 100 + valley + relief * noise["elevation"].window(*window),
+                "land_cover": categorize(
+                    noise["land_cover"].window(*window), codes, [1] * len(codes)
+                ),
+                "hsg": categorize(
+                    noise["hsg"].window(*window),
+                    list(HSG_WEIGHTS),
+                    list(HSG_WEIGHTS.values()),
+                ),
+                "precipitation": 30 + 30 * noise["precipitation"].window(*window),
+                "k_factor": 0.05 + 0.45 * noise["k_factor"].window(*window),
+                "r_factor": 100 + 200 * noise["r_factor"].window(*window),
+            }
+            for name, block in blocks.items():
+                datasets[name].GetRasterBand(1).WriteArray(block, x_off, y_off)
+
+    for ds in datasets.values():
+        ds.FlushCache()
+    datasets = None
+    manifest.write_text(json.dumps(settings))
+    return {name: str(path) for name, path in paths.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=1024, help="cells per side")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--land-cover-type", choices=["NLCD", "C-CAP"], default="NLCD")
+    parser.add_argument("--cell-size", type=float, default=30.0, help="meters")
+    parser.add_argument("--output", required=True, help="dataset folder")
+    args = parser.parse_args(argv)
+    paths = generate_dataset(
+        args.output,
+        args.size,
+        args.seed,
+        args.land_cover_type,
+        args.cell_size,
+        overwrite=True,
+    )
+    print(json.dumps(paths, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+# coding=utf-8
+"""Tests of the block-wise raster functions.
+
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+__author__ = 'NOAA'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2021 by NOAA'
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from osgeo import gdal
+
+from .utilities import get_qgis_app
+QGIS_APP = get_qgis_app()
+
+from QNSPECT.processing.algorithms.block_utils import (  # noqa: E402
+    NODATA,
+    BlockMask,
+    evaluate_expression,
+)
+
+
+def write_raster(path, array, nodata=NODATA, data_type=gdal.GDT_Float32):
+    """Write a single band GeoTIFF with 30 m cells"""
+    ds = gdal.GetDriverByName('GTiff').Create(
+        path, array.shape[1], array.shape[0], 1, data_type)
+    ds.SetGeoTransform((0, 30, 0, 0, 0, -30))
+    band = ds.GetRasterBand(1)
+    if nodata is not None:
+        band.SetNoDataValue(nodata)
+    band.WriteArray(array)
+    band = None
+    ds = None
+    return path
+
+
+def read_raster(path):
+    ds = gdal.Open(path)
+    array = ds.GetRasterBand(1).ReadAsArray()
+    ds = None
+    return array
+
+
+class BlockMaskTest(unittest.TestCase):
+    """Test the raster math of a run masked by its elevation raster"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_mask_follows_elevation_edge(self):
+        """Cells without elevation are no data inside computed blocks too"""
+        shape = (700, 600)  # 2 x 2 blocks of 512
+        land_cover = np.full(shape, 21, dtype=np.float32)
+        # the watershed covers part of the first block only
+        elevation = np.full(shape, NODATA, dtype=np.float32)
+        elevation[100:300, 50:250] = 10
+        land_cover_path = write_raster(
+            os.path.join(self.folder, 'land_cover.tif'), land_cover)
+        elevation_path = write_raster(
+            os.path.join(self.folder, 'elevation.tif'), elevation)
+
+        mask = BlockMask.from_raster(elevation_path)
+        self.assertEqual(mask.occupied.tolist(), [[True, False], [False, False]])
+
+        output = evaluate_expression(
+            'A * 2',
+            {'A': land_cover_path},
+            os.path.join(self.folder, 'masked.tif'),
+            mask=mask,
+        )
+        result = read_raster(output)
+        expected = np.where(elevation != NODATA, 42, NODATA)
+        np.testing.assert_array_equal(result, expected)
+
+    def test_without_mask(self):
+        """Without a mask every valid land cover cell is computed"""
+        land_cover = np.full((20, 30), 21, dtype=np.float32)
+        land_cover[5, 7] = NODATA
+        land_cover_path = write_raster(
+            os.path.join(self.folder, 'land_cover.tif'), land_cover)
+
+        result = read_raster(evaluate_expression(
+            'A * 2',
+            {'A': land_cover_path},
+            os.path.join(self.folder, 'unmasked.tif'),
+        ))
+        np.testing.assert_array_equal(
+            result, np.where(land_cover != NODATA, 42, NODATA))
+
+
+class ExpressionTest(unittest.TestCase):
+    """Compare the block by block expressions of the runs to numpy on full arrays"""
+
+    # lc_value: CN of hydrologic soil groups A to D
+    CN_TABLE = {
+        11: (0, 0, 0, 0),
+        21: (49, 69, 79, 84),
+        41: (30, 55, 70, 77),
+        82: (67, 78, 85, 89),
+    }
+    RAINING_DAYS = 2
+    CELL_AREA = 9687.5  # square feet
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        shape = (600, 530)  # windows of 512 and partial windows
+        self.land_cover = rng.choice(list(self.CN_TABLE), shape).astype(np.uint8)
+        self.land_cover[rng.random(shape) < 0.05] = 255
+        self.soil = rng.integers(1, 5, shape).astype(np.float32)
+        self.soil[rng.random(shape) < 0.05] = NODATA
+        self.precip = (rng.random(shape) * 5 + 0.1).astype(np.float32)
+        self.precip[rng.random(shape) < 0.05] = NODATA
+
+        self.land_cover_path = write_raster(
+            self.path('land_cover.tif'), self.land_cover, 255, gdal.GDT_Byte)
+        self.soil_path = write_raster(self.path('soil.tif'), self.soil)
+        self.precip_path = write_raster(self.path('precip.tif'), self.precip)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def cn_expression(self):
+        """Same expression as CurveNumber.generate_cn_exprs"""
+        return ' + '.join(
+            f'logical_and(A=={lu},B=={i + 1})*{cn}'
+            for lu, cns in self.CN_TABLE.items()
+            for i, cn in enumerate(cns)
+        )
+
+    def expected_cn(self):
+        cn = np.zeros(self.land_cover.shape)
+        for lu, cns in self.CN_TABLE.items():
+            for i, value in enumerate(cns):
+                cn[(self.land_cover == lu) & (self.soil == i + 1)] = value
+        valid = (self.land_cover != 255) & (self.soil != NODATA)
+        return cn, valid
+
+    def assert_raster(self, path, expected, valid):
+        result = read_raster(path)
+        np.testing.assert_array_equal(result == NODATA, ~valid)
+        np.testing.assert_allclose(
+            result[valid], expected[valid], rtol=1e-5, atol=1e-3)
+
+    def test_curve_number(self):
+        output = evaluate_expression(
+            self.cn_expression(),
+            {'A': self.land_cover_path, 'B': self.soil_path},
+            self.path('cn.tif'),
+        )
+        self.assert_raster(output, *self.expected_cn())
+
+    def test_runoff_volume(self):
+        """Same expressions as RunoffVolume.calculate_Q, CN of 0 gives no runoff"""
+        cn_path = evaluate_expression(
+            self.cn_expression(),
+            {'A': self.land_cover_path, 'B': self.soil_path},
+            self.path('cn.tif'),
+        )
+        days = self.RAINING_DAYS
+        s_path = evaluate_expression(
+            'numpy.maximum((numpy.divide(1000, A, out=numpy.zeros_like(A), where=(A!=0)) - 10), 0)',
+            {'A': cn_path},
+            self.path('s.tif'),
+        )
+        p_ia_path = evaluate_expression(
+            f'(A-(0.2*B*{days}))',
+            {'A': self.precip_path, 'B': s_path},
+            self.path('p_ia.tif'),
+        )
+        q_temp_path = evaluate_expression(
+            f'((C**2)/(A+(0.8*B*{days}))) * (C>0) * {self.CELL_AREA} * 2.35973722 ',
+            {'A': self.precip_path, 'B': s_path, 'C': p_ia_path},
+            self.path('q_temp.tif'),
+        )
+        q_path = evaluate_expression(
+            '(B!=0) * A',
+            {'A': q_temp_path, 'B': cn_path},
+            self.path('q.tif'),
+        )
+
+        cn, valid = self.expected_cn()
+        cn = cn.astype(np.float32)
+        precip = self.precip.astype(np.float64)
+        s = np.zeros(cn.shape)
+        s[cn != 0] = np.maximum(1000 / cn[cn != 0] - 10, 0)
+        p_ia = precip - 0.2 * s * days
+        q = p_ia ** 2 / (precip + 0.8 * s * days) * (p_ia > 0) * self.CELL_AREA * 2.35973722
+        q[cn == 0] = 0
+        valid &= self.precip != NODATA
+
+        self.assert_raster(q_path, q, valid)
+        self.assertTrue((read_raster(q_path)[valid & (cn == 0)] == 0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
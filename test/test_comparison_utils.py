@@ -0,0 +1,62 @@
+# coding=utf-8
+"""Tests of the scenario comparison functions.
+
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+__author__ = 'NOAA'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2021 by NOAA'
+
+import unittest
+
+import numpy as np
+
+from .utilities import get_qgis_app
+QGIS_APP = get_qgis_app()
+
+from QNSPECT.processing.algorithms.compare_scenarios.comparison_utils import (  # noqa: E402
+    _RunningStats,
+)
+
+
+class RunningStatsTest(unittest.TestCase):
+    """Test the band statistics accumulated block by block"""
+
+    def assert_stats(self, blocks):
+        stats = _RunningStats()
+        for block in blocks:
+            stats.update(block)
+        values = np.concatenate(blocks)
+        values = values[np.isfinite(values)]
+        minimum, maximum, mean, std_dev = stats.values()
+        self.assertEqual(stats.count, values.size)
+        self.assertEqual(minimum, values.min())
+        self.assertEqual(maximum, values.max())
+        self.assertAlmostEqual(mean, values.mean(), delta=1e-9 * abs(values.mean()))
+        self.assertAlmostEqual(std_dev, values.std(), delta=1e-7 * values.std())
+
+    def test_blocks(self):
+        rng = np.random.default_rng(0)
+        self.assert_stats([rng.normal(5, 3, size) for size in (512 * 512, 1000, 1, 37)])
+
+    def test_large_mean(self):
+        """The standard deviation stays accurate when the mean is much larger"""
+        rng = np.random.default_rng(1)
+        self.assert_stats([1e8 + rng.normal(0, 0.5, 10000) for _ in range(5)])
+
+    def test_empty_and_not_finite_blocks(self):
+        rng = np.random.default_rng(2)
+        self.assert_stats([
+            np.array([]),
+            np.array([np.nan, np.inf, 2.0]),
+            rng.normal(-4, 1, 100),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
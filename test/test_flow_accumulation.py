@@ -0,0 +1,117 @@
+# coding=utf-8
+"""Tests of the MFD flow accumulation engine.
+
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+__author__ = 'NOAA'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2021 by NOAA'
+
+import unittest
+
+import numpy as np
+
+from .utilities import get_qgis_app
+QGIS_APP = get_qgis_app()
+
+from qgis.core import QgsProcessingFeedback  # noqa: E402
+
+from QNSPECT.processing.algorithms.flow_accumulation import (  # noqa: E402
+    flow_graph,
+    mfd_accumulation,
+)
+
+EAST = 8
+EAST_OUT = -8
+WEST = 4
+
+
+class WarningFeedback(QgsProcessingFeedback):
+    """Feedback that keeps the warnings pushed to it"""
+
+    def __init__(self):
+        super().__init__()
+        self.warnings = []
+
+    def pushWarning(self, warning):
+        self.warnings.append(warning)
+
+
+class MFDAccumulationTest(unittest.TestCase):
+    """Test the accumulation of the numpy MFD engine"""
+
+    def test_single_path(self):
+        """A ramp accumulates the weight of every upstream cell"""
+        elevation = np.array([[4, 3, 2, 1, 0]], dtype=float)
+        drainage = np.array([[EAST, EAST, EAST, EAST, EAST_OUT]])
+        accumulation = mfd_accumulation(
+            elevation, np.ones(elevation.shape), drainage, 30, 30)
+        np.testing.assert_allclose(accumulation, [[1, 2, 3, 4, 5]])
+
+    def test_depression(self):
+        """Flow leaves a pit along the drainage direction and does not loop back"""
+        elevation = np.array([[3, 2, 1, 2, 0]], dtype=float)
+        drainage = np.array([[EAST, EAST, EAST, EAST, EAST_OUT]])
+        accumulation = mfd_accumulation(
+            elevation, np.ones(elevation.shape), drainage, 30, 30)
+        np.testing.assert_allclose(accumulation, [[1, 2, 3, 4, 5]])
+
+    def test_fractions(self):
+        """Flow is split in proportion to (drop / distance) ** convergence"""
+        elevation = np.array([[5, 4, 5], [5, 5, 5], [5, 3, 5]], dtype=float)
+        elevation[[0, 0, 2, 2], [0, 2, 0, 2]] = np.nan
+        elevation[1, [0, 2]] = np.nan
+        drainage = np.full(elevation.shape, 6)  # south
+        indptr, targets, fractions = flow_graph(elevation, drainage, 1, 1, 2)
+        center = 4
+        edges = slice(indptr[center], indptr[center + 1])
+        weights = dict(zip(targets[edges], fractions[edges]))
+        self.assertAlmostEqual(weights[1], 1 / 5, places=6)
+        self.assertAlmostEqual(weights[7], 4 / 5, places=6)
+
+    def test_plane_conserves_flow(self):
+        """On a plane sloping east, all the flow reaches the east edge"""
+        rows, cols = 40, 50
+        elevation = -np.tile(np.arange(cols, dtype=float), (rows, 1))
+        drainage = np.full(elevation.shape, EAST)
+        drainage[:, -1] = EAST_OUT
+        accumulation = mfd_accumulation(
+            elevation, np.ones(elevation.shape), drainage, 30, 30)
+        self.assertAlmostEqual(accumulation[:, -1].sum(), rows * cols, places=6)
+
+    def test_nodata(self):
+        """Cells without elevation neither receive nor send flow"""
+        elevation = np.array([[4, 3, np.nan, 1, 0]], dtype=float)
+        drainage = np.array([[EAST, EAST, 0, EAST, EAST_OUT]])
+        accumulation = mfd_accumulation(
+            elevation, np.ones(elevation.shape), drainage, 30, 30)
+        np.testing.assert_allclose(accumulation[0, [0, 1, 3, 4]], [1, 2, 1, 2])
+
+    def test_drainage_loop(self):
+        """Cells left in a loop of drainage directions are reported"""
+        elevation = np.array([[2, 1, 1, 0]], dtype=float)
+        # the flat cell 1 drains east, cell 2 drains back west
+        drainage = np.array([[EAST, EAST, WEST, EAST_OUT]])
+        feedback = WarningFeedback()
+        accumulation = mfd_accumulation(
+            elevation, np.ones(elevation.shape), drainage, 30, 30, feedback=feedback)
+        self.assertEqual(accumulation[0, 3], 1)
+        self.assertEqual(len(feedback.warnings), 1)
+        self.assertIn('2 cells', feedback.warnings[0])
+
+    def test_no_warning(self):
+        elevation = np.array([[3, 2, 1, 2, 0]], dtype=float)
+        drainage = np.array([[EAST, EAST, EAST, EAST, EAST_OUT]])
+        feedback = WarningFeedback()
+        mfd_accumulation(
+            elevation, np.ones(elevation.shape), drainage, 30, 30, feedback=feedback)
+        self.assertEqual(feedback.warnings, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# coding=utf-8
+"""Tests of the local loads used to estimate the load change of a land cover change.
+
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+__author__ = 'NOAA'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2021 by NOAA'
+
+import unittest
+
+import numpy as np
+
+from .utilities import get_qgis_app
+QGIS_APP = get_qgis_app()
+
+from qgis.core import QgsFeature, QgsVectorLayer  # noqa: E402
+
+from QNSPECT.processing.algorithms.estimate_load_change.load_change_utils import (  # noqa: E402
+    LocalLoadModel,
+)
+
+# SCS conversion of inches over square feet to Liters
+LITERS = 2.35973722
+CELL_AREA = 100.0  # square feet
+
+# lc_value: (cn_a, cn_b, cn_c, cn_d, nitrogen)
+LOOKUP = {
+    11: (0, 0, 0, 0, 0.5),
+    21: (60, 70, 75, 100, 2.0),
+    41: (50, 50, 50, 50, None),
+}
+
+
+def lookup_layer():
+    """Memory land cover lookup table of LOOKUP"""
+    layer = QgsVectorLayer(
+        'None?field=lc_value:integer&field=cn_a:double&field=cn_b:double'
+        '&field=cn_c:double&field=cn_d:double&field=nitrogen:double',
+        'Land Cover Lookup Table',
+        'memory',
+    )
+    features = []
+    for lc_value, values in LOOKUP.items():
+        feature = QgsFeature(layer.fields())
+        feature.setAttributes([lc_value, *values])
+        features.append(feature)
+    layer.dataProvider().addFeatures(features)
+    return layer
+
+
+def model(dual_soil_type=0, raining_days=1, precip_units=0):
+    return LocalLoadModel(
+        lookup_layer(), {'Nitrogen': 'nitrogen'}, dual_soil_type, raining_days, CELL_AREA,
+        precip_units)
+
+
+class LocalLoadModelTest(unittest.TestCase):
+    """Compare the local runoff and loads to hand-computed values"""
+
+    def test_curve_number(self):
+        """Hydrologic soil groups A to D pick their own curve number"""
+        cn = model().curve_number(np.array([21, 21, 21, 21, 41]), np.array([1, 2, 3, 4, 3]))
+        np.testing.assert_array_equal(cn, [60, 70, 75, 100, 50])
+
+    def test_dual_soil_average(self):
+        """Dual soils (A/D) are D undrained, A drained and their average for both"""
+        land_cover = np.array([21, 21])
+        hsg = np.array([5, 2])
+        np.testing.assert_array_equal(model(0).curve_number(land_cover, hsg), [100, 70])
+        np.testing.assert_array_equal(model(1).curve_number(land_cover, hsg), [60, 70])
+        np.testing.assert_array_equal(model(2).curve_number(land_cover, hsg), [80, 70])
+
+        # CN 80: S = 1000 / 80 - 10 = 2.5, P = 2 in: Q = (2 - 0.5) ** 2 / (2 + 2) = 0.5625 in
+        loads = model(2).local_loads(np.array([21]), np.array([5]), np.array([2.0]))
+        self.assertAlmostEqual(loads['Runoff'], 0.5625 * CELL_AREA * LITERS)
+        self.assertAlmostEqual(loads['Nitrogen'], 2.0 * 0.5625 * CELL_AREA * LITERS)
+
+    def test_raining_days(self):
+        """The initial abstraction applies on every raining day"""
+        # CN 50: S = 10, P = 8 in over 2 days: Q = (8 - 4) ** 2 / (8 + 16) = 2 / 3 in
+        loads = model(raining_days=2).local_loads(
+            np.array([41]), np.array([1]), np.array([8.0]))
+        self.assertAlmostEqual(loads['Runoff'], 2 / 3 * CELL_AREA * LITERS)
+
+    def test_millimeters(self):
+        """Precipitation in millimeters gives the loads of the same run in inches"""
+        land_cover = np.array([21, 41, 21])
+        hsg = np.array([5, 1, 2])
+        inches = np.array([2.0, 4.0, 1.5])
+        expected = model(2).local_loads(land_cover, hsg, inches)
+        loads = model(2, precip_units=1).local_loads(land_cover, hsg, inches * 25.4)
+        self.assertEqual(loads.keys(), expected.keys())
+        for name in expected:
+            self.assertAlmostEqual(loads[name], expected[name])
+        # 50.8 mm = 2 in at CN 80: Q = 0.5625 in
+        loads = model(2, precip_units=1).local_loads(
+            np.array([21]), np.array([5]), np.array([50.8]))
+        self.assertAlmostEqual(loads['Runoff'], 0.5625 * CELL_AREA * LITERS)
+
+    def test_zero_curve_number(self):
+        """A curve number of 0 gives no runoff and no load whatever the precipitation"""
+        cn = model().curve_number(np.array([11]), np.array([2]))
+        np.testing.assert_array_equal(cn, [0])
+        np.testing.assert_array_equal(model().runoff(cn, np.array([10.0])), [0])
+        loads = model().local_loads(np.array([11, 11]), np.array([1, 4]), np.array([10.0, 3.0]))
+        self.assertEqual(loads, {'Runoff': 0.0, 'Nitrogen': 0.0})
+
+    def test_no_runoff_below_initial_abstraction(self):
+        """Precipitation below 0.2 S does not run off"""
+        # CN 50: S = 10, P = 1.5 in < 0.2 S
+        loads = model().local_loads(np.array([41]), np.array([1]), np.array([1.5]))
+        self.assertEqual(loads['Runoff'], 0.0)
+
+    def test_missing_codes(self):
+        """Land covers missing from the table and empty coefficients count as 0"""
+        # 99 is not in the table, 41 has no nitrogen coefficient
+        # CN 50: S = 10, P = 4 in: Q = (4 - 2) ** 2 / (4 + 8) = 1 / 3 in
+        land_cover = np.array([99, 41])
+        hsg = np.array([1, 1])
+        np.testing.assert_array_equal(model().curve_number(land_cover, hsg), [0, 50])
+        loads = model().local_loads(land_cover, hsg, np.array([4.0, 4.0]))
+        self.assertAlmostEqual(loads['Runoff'], 1 / 3 * CELL_AREA * LITERS)
+        self.assertEqual(loads['Nitrogen'], 0.0)
+
+    def test_sum_over_cells(self):
+        """Loads are the sums over all the given cells"""
+        loads = model(2).local_loads(
+            np.array([21, 41, 99, 11]), np.array([5, 1, 1, 1]), np.array([2.0, 4.0, 4.0, 4.0]))
+        self.assertAlmostEqual(loads['Runoff'], (0.5625 + 1 / 3) * CELL_AREA * LITERS)
+        self.assertAlmostEqual(loads['Nitrogen'], 2.0 * 0.5625 * CELL_AREA * LITERS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+# coding=utf-8
+"""Tests of the benchmark regression gate.
+
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+__author__ = 'NOAA'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2021 by NOAA'
+
+import unittest
+
+from benchmarks.regression import MAD_SCALE, compare, noise
+
+
+def result(stage, seconds, size=1024):
+    """Result of a stage as written by benchmarks.run_benchmarks"""
+    return {
+        'Stage': stage,
+        'Size': size,
+        'Cells': size * size,
+        'Status': 'ok',
+        'Seconds': seconds,
+        'MedianSeconds': sorted(seconds)[len(seconds) // 2],
+    }
+
+
+def failed(stage, size=1024):
+    return {
+        'Stage': stage,
+        'Size': size,
+        'Cells': size * size,
+        'Status': 'failed',
+        'Error': 'QgsProcessingException: Could not load source layer',
+    }
+
+
+def statuses(rows):
+    return {(row['Stage'], row['Size']): row['Status'] for row in rows}
+
+
+class NoiseTest(unittest.TestCase):
+    """Test the robust standard deviation of the samples"""
+
+    def test_single_sample(self):
+        self.assertEqual(noise([]), 0.0)
+        self.assertEqual(noise([1.5]), 0.0)
+
+    def test_constant_samples(self):
+        self.assertEqual(noise([2.0, 2.0, 2.0]), 0.0)
+
+    def test_median_absolute_deviation(self):
+        # median 2, absolute deviations 1, 0, 1, 0, 8: MAD 1
+        self.assertAlmostEqual(noise([1.0, 2.0, 3.0, 2.0, 10.0]), MAD_SCALE)
+
+    def test_outlier(self):
+        """A single slow repetition does not change the noise"""
+        self.assertAlmostEqual(noise([1.0, 1.1, 0.9, 1.0, 60.0]), 0.1 * MAD_SCALE)
+
+
+class CompareTest(unittest.TestCase):
+    """Compare synthetic reports with a baseline"""
+
+    BASELINE = {
+        ('CurveNumber', 1024): [1.0, 1.0, 1.0],
+        ('RunoffVolume', 1024): [2.0, 2.0, 2.0],
+        ('ReliefLengthRatio', 1024): [1.0, 1.2, 0.8],
+        ('CompareRasters', 1024): [0.01, 0.01, 0.01],
+        ('AlignRasters', 1024): [1.0, 1.0, 1.0],
+    }
+
+    def compare(self, *results):
+        return compare({'Results': list(results)}, self.BASELINE)
+
+    def test_unchanged(self):
+        """Differences within the relative threshold are unchanged"""
+        [row] = self.compare(result('CurveNumber', [1.05, 1.05, 1.05]))
+        self.assertEqual(row['Status'], 'unchanged')
+        self.assertEqual(row['BaselineSeconds'], 1.0)
+        self.assertEqual(row['Seconds'], 1.05)
+        self.assertEqual(row['Change'], 5.0)
+        self.assertEqual(row['ToleranceSeconds'], 0.1)
+
+    def test_regression(self):
+        [row] = self.compare(result('RunoffVolume', [2.5, 2.5, 2.6]))
+        self.assertEqual(row['Status'], 'regression')
+        self.assertEqual(row['Change'], 25.0)
+        self.assertEqual(row['ToleranceSeconds'], 0.2)
+
+    def test_improvement(self):
+        [row] = self.compare(result('RunoffVolume', [1.5, 1.4, 1.6]))
+        self.assertEqual(row['Status'], 'improvement')
+        self.assertEqual(row['Change'], -25.0)
+
+    def test_noisy_samples(self):
+        """A slowdown within the noise of the samples is not a regression"""
+        # baseline noise 0.2 * MAD_SCALE, tolerance 3 * sqrt(2) * 0.2 * MAD_SCALE ~ 1.26 s
+        [row] = self.compare(result('ReliefLengthRatio', [1.5, 1.3, 1.7]))
+        self.assertEqual(row['Status'], 'unchanged')
+        self.assertAlmostEqual(
+            row['ToleranceSeconds'], 3 * 2 ** 0.5 * 0.2 * MAD_SCALE, places=4)
+
+    def test_min_seconds(self):
+        """Very short stages are not flagged for differences under min_seconds"""
+        [row] = self.compare(result('CompareRasters', [0.04, 0.04, 0.04]))
+        self.assertEqual(row['Status'], 'unchanged')
+        self.assertEqual(row['ToleranceSeconds'], 0.05)
+
+    def test_failed_stage(self):
+        """A stage that ran on the baseline but fails now is a regression"""
+        [row] = self.compare(failed('AlignRasters'))
+        self.assertEqual(row['Status'], 'regression')
+        self.assertEqual(row['BaselineSeconds'], 1.0)
+        self.assertIn('Could not load source layer', row['Reason'])
+        self.assertNotIn('Seconds', row)
+
+    def test_new_stage(self):
+        """Stages and sizes without baseline samples are new, failed or not"""
+        rows = self.compare(
+            result('CurveNumber', [4.0], size=4096),
+            result('MFDAccumulation', [3.0]),
+            failed('RunErosionAnalysisMFD'),
+        )
+        self.assertEqual(set(statuses(rows).values()), {'new'})
+        self.assertTrue(all('BaselineSeconds' not in row for row in rows))
+
+    def test_report(self):
+        """One row per result in the order of the report"""
+        rows = self.compare(
+            result('CurveNumber', [1.0, 1.0, 1.0]),
+            result('RunoffVolume', [3.0, 3.0, 3.0]),
+            result('ReliefLengthRatio', [0.1, 0.1, 0.1]),
+            failed('AlignRasters'),
+            result('MFDAccumulation', [3.0]),
+        )
+        self.assertEqual(
+            [row['Status'] for row in rows],
+            ['unchanged', 'regression', 'improvement', 'regression', 'new'])
+
+    def test_threshold(self):
+        """The relative threshold is configurable"""
+        report = {'Results': [result('RunoffVolume', [2.5, 2.5, 2.5])]}
+        self.assertEqual(
+            compare(report, self.BASELINE, threshold=0.3)[0]['Status'], 'unchanged')
+        self.assertEqual(
+            compare(report, self.BASELINE, threshold=0.2)[0]['Status'], 'regression')
+
+
+if __name__ == '__main__':
+    unittest.main()
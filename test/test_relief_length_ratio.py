@@ -0,0 +1,165 @@
+# coding=utf-8
+"""Tests of the relief-length ratio computed with Horn's stencil.
+
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+__author__ = 'NOAA'
+__date__ = '2026-10-18'
+__copyright__ = '(C) 2021 by NOAA'
+
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from osgeo import gdal
+
+from .utilities import get_qgis_app
+QGIS_APP = get_qgis_app()
+
+from qgis.core import QgsProcessingFeedback  # noqa: E402
+
+from QNSPECT.processing.algorithms.block_utils import NODATA  # noqa: E402
+from QNSPECT.processing.algorithms.run_analysis.relief_length_ratio import (  # noqa: E402
+    create_relief_length_ratio_raster,
+    relief_length_ratio,
+)
+
+CELL_X = 30.0
+CELL_Y = 20.0
+
+
+def horn_derivative(z, row, col, d_row, d_col, cell_size):
+    """First derivative at a cell with the nodata rules of the native slope algorithm, cell by cell.
+    (d_row, d_col) is the direction of the derivative."""
+    def value(r, c):
+        if 0 <= r < z.shape[0] and 0 <= c < z.shape[1] and not math.isnan(z[r, c]):
+            return z[r, c]
+        return None
+
+    total = weight = 0
+    for offset, row_weight in zip((-1, 0, 1), (1, 2, 1)):
+        # rows of the stencil across the direction of the derivative
+        r, c = row + offset * d_col, col + offset * d_row
+        before = value(r - d_row, c - d_col)
+        center = value(r, c)
+        after = value(r + d_row, c + d_col)
+        if before is not None and after is not None:
+            total += row_weight * (after - before)
+            weight += 2 * row_weight
+        elif after is not None and center is not None:
+            total += row_weight * (after - center)
+            weight += row_weight
+        elif before is not None and center is not None:
+            total += row_weight * (center - before)
+            weight += row_weight
+    return total / (weight * cell_size) if weight else math.nan
+
+
+def reference_ratio(z):
+    """tan(slope) / 1000 of each cell of an elevation array, NaN for no data"""
+    ratio = np.full(z.shape, np.nan)
+    for row in range(z.shape[0]):
+        for col in range(z.shape[1]):
+            if math.isnan(z[row, col]):
+                continue
+            dz_dx = horn_derivative(z, row, col, 0, 1, CELL_X)
+            dz_dy = horn_derivative(z, row, col, 1, 0, CELL_Y)
+            ratio[row, col] = math.hypot(dz_dx, dz_dy) / 1000
+    return ratio
+
+
+def padded(z):
+    return np.pad(z, 1, constant_values=np.nan)
+
+
+class ReliefLengthRatioTest(unittest.TestCase):
+    """Compare the relief-length ratio to tan(slope) / 1000"""
+
+    def test_plane(self):
+        """The ratio of a plane is the tangent of its slope everywhere, raster edges included"""
+        rows, cols = np.mgrid[0:12, 0:15]
+        # rises 3 per cell to the east and 2 per cell to the south
+        z = 3.0 * cols - 2.0 * rows
+        expected = math.hypot(3 / CELL_X, 2 / CELL_Y) / 1000
+        np.testing.assert_allclose(
+            relief_length_ratio(padded(z), CELL_X, CELL_Y), expected, rtol=1e-12)
+
+    def test_nodata_hole(self):
+        """Cells around a hole use one sided differences, the hole stays no data"""
+        rng = np.random.default_rng(0)
+        z = rng.random((10, 12)) * 50
+        z[4:6, 5:8] = np.nan
+        z[0, 0] = np.nan
+        ratio = relief_length_ratio(padded(z), CELL_X, CELL_Y)
+        self.assertTrue(np.isnan(ratio[4:6, 5:8]).all())
+        np.testing.assert_allclose(ratio, reference_ratio(z), rtol=1e-12)
+
+    def test_plane_with_hole(self):
+        """One sided differences are still exact on a plane"""
+        rows, cols = np.mgrid[0:8, 0:8]
+        z = 3.0 * cols - 2.0 * rows
+        z[3, 3:5] = np.nan
+        ratio = relief_length_ratio(padded(z), CELL_X, CELL_Y)
+        expected = np.where(
+            np.isnan(z), np.nan, math.hypot(3 / CELL_X, 2 / CELL_Y) / 1000)
+        np.testing.assert_allclose(ratio, expected, rtol=1e-12)
+
+
+class ReliefLengthRatioRasterTest(unittest.TestCase):
+    """Test the block by block computation of the relief-length ratio raster"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_window_boundaries(self):
+        """The halo makes the result independent of the 512 cell windows"""
+        rng = np.random.default_rng(1)
+        shape = (530, 520)
+        rows, cols = np.indices(shape)
+        z = (np.sin(rows / 40) + np.cos(cols / 30)) * 20 + rng.random(shape)
+        # nodata cells right on the window boundaries
+        z[511, 100:110] = NODATA
+        z[200:205, 512] = NODATA
+        dem_path = os.path.join(self.folder, 'dem.tif')
+        ds = gdal.GetDriverByName('GTiff').Create(
+            dem_path, shape[1], shape[0], 1, gdal.GDT_Float32)
+        ds.SetGeoTransform((0, CELL_X, 0, 0, 0, -CELL_Y))
+        ds.GetRasterBand(1).SetNoDataValue(NODATA)
+        ds.GetRasterBand(1).WriteArray(z)
+        ds = None
+
+        output = create_relief_length_ratio_raster(
+            dem_path,
+            None,
+            QgsProcessingFeedback(),
+            os.path.join(self.folder, 'relief_length.tif'),
+        )
+        ds = gdal.Open(output)
+        result = ds.GetRasterBand(1).ReadAsArray().astype(np.float64)
+        ds = None
+
+        z = np.where(z == NODATA, np.nan, z.astype(np.float32)).astype(np.float64)
+        expected = relief_length_ratio(padded(z), CELL_X, CELL_Y)
+        np.testing.assert_array_equal(result == NODATA, np.isnan(expected))
+        valid = ~np.isnan(expected)
+        np.testing.assert_allclose(result[valid], expected[valid], rtol=1e-6)
+        # the cells along the window boundaries match the cell by cell stencil
+        for row, col in [(511, 99), (512, 105), (510, 512), (204, 511), (300, 513)]:
+            self.assertAlmostEqual(
+                result[row, col], reference_ratio(z[row - 1:row + 2, col - 1:col + 2])[1, 1],
+                delta=1e-6 * abs(result[row, col]))
+
+
+if __name__ == '__main__':
+    unittest.main()